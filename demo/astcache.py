@@ -0,0 +1,399 @@
+from data import *
+from preprocess import DEFAULT_CACHE_DIR, DEFAULT_CACHE_MAX_BYTES, hash_bytes, evict_lru
+from os import makedirs, replace, utime
+from os.path import join, exists, dirname
+from struct import calcsize, pack, unpack_from
+from sys import byteorder
+
+AST_MAGIC: bytes = b'Z9AS'
+
+# bumped when the layout, the node classes or the token values change,
+# a file of another format is a miss (and gets overwritten)
+AST_FORMAT: int = 2
+
+# the modules the trees are made by, their sources are part of the
+# entries' key, so that a change to the lexer, the parser or the node
+# classes is a miss even when `AST_FORMAT` was not bumped for it
+AST_MODULES: list[str] = ['lex.py', 'dparse.py', 'data.py', 'astcache.py']
+
+def modules_hash() -> str:
+  sources: list[bytes] = []
+
+  for module in AST_MODULES:
+    with open(join(dirname(__file__), module), 'rb') as f:
+      sources.append(f.read())
+
+  return hash_bytes(b'\0'.join(sources))
+
+# the header also records how the arrays were written,
+# they are stored with their native item sizes
+AST_HEADER: str = '<4sHBB'
+NATIVE: tuple[int, int] = (0 if byteorder == 'little' else 1, array('L').itemsize)
+
+# value tags, each followed by its payload in the codes
+ABSENT, NONE, FALSE, TRUE, INT, BIGINT, FLOAT, STR, LIST, TUPLE, \
+  TOKEN, VIEW, RANGE, LOC, SOURCE_LOC = range(15)
+
+# the tag of a node is `NODE_BASE` + the index of its class
+NODE_CLASSES: list[type] = list(NODE_LAYOUTS)
+NODE_TAGS: dict[type, int] = {cls: i for i, cls in enumerate(NODE_CLASSES)}
+NODE_BASE: int = 16
+
+def pack_strings(strings: list[str]) -> list[array]:
+  '''
+  the lengths (in bytes) and the concatenated utf-8
+  '''
+
+  encoded = [s.encode('utf-8', 'surrogatepass') for s in strings]
+
+  return [array('L', map(len, encoded)), array('B', b''.join(encoded))]
+
+def unpack_strings(lengths: array, blob: array) -> list[str]:
+  data = blob.tobytes()
+  strings: list[str] = []
+  start: int = 0
+
+  for length in lengths:
+    strings.append(data[start:start + length].decode('utf-8', 'surrogatepass'))
+    start += length
+
+  return strings
+
+class AstWriter:
+  '''
+  encodes a dparse tree into a flat array of codes, the strings it
+  holds are written once each; views, ranges and locations are
+  stored as indexes and offsets into the unit's token storage
+  '''
+
+  def __init__(self, tokens: TokenBuffer) -> None:
+    self.tokens: TokenBuffer = tokens
+    # every code fits in 32 bits, bigger numbers are written as strings
+    self.codes: array[int] = array('i')
+    self.strings: list[str] = []
+    self.string_indices: dict[str, int] = {}
+
+  def string(self, s: str) -> int:
+    if (index := self.string_indices.get(s)) is not None:
+      return index
+
+    index = len(self.strings)
+    self.strings.append(s)
+    self.string_indices[s] = index
+
+    return index
+
+  def value(self, v: object) -> None:
+    codes = self.codes
+
+    # `bool` before `int`, and views before the other nodes
+    if v is None:
+      codes.append(NONE)
+    elif v is True or v is False:
+      codes.append(TRUE if v else FALSE)
+    elif isinstance(v, TokenView) and v.buffer is self.tokens:
+      codes.extend((VIEW, v.index))
+    elif isinstance(v, TokenRange) and v.buffer is self.tokens:
+      codes.extend((RANGE, v.start, v.end))
+    elif isinstance(v, SourceLoc) and v.source_map is self.tokens.source_map:
+      codes.extend((SOURCE_LOC, v.offset))
+    elif type(v) in NODE_TAGS:
+      self.node(cast(Node, v))
+    elif isinstance(v, Token):
+      codes.append(TOKEN)
+      self.value(v.kind)
+      self.value(v.value)
+      self.value(v.loc)
+      self.value(v.value_id)
+    elif isinstance(v, Loc):
+      codes.extend((LOC, self.string(v.filepath), v.line, v.col))
+    elif isinstance(v, (list, tuple)):
+      codes.extend((LIST if isinstance(v, list) else TUPLE, len(v)))
+
+      for item in v:
+        self.value(item)
+    elif isinstance(v, str):
+      codes.extend((STR, self.string(v)))
+    elif isinstance(v, int):
+      if -2 ** 31 <= v < 2 ** 31:
+        codes.extend((INT, v))
+      else:
+        codes.extend((BIGINT, self.string(str(v))))
+    elif isinstance(v, float):
+      # `repr` round-trips
+      codes.extend((FLOAT, self.string(repr(v))))
+    else:
+      raise TypeError(f'cannot encode {type(v).__name__}')
+
+  def node(self, node: Node) -> None:
+    cls = type(node)
+    self.codes.append(NODE_BASE + NODE_TAGS[cls])
+
+    for attr in NODE_LAYOUTS[cls]:
+      # optional syntax fields may be unassigned
+      if not hasattr(node, attr):
+        self.codes.append(ABSENT)
+        continue
+
+      self.value(getattr(node, attr))
+
+class AstReader:
+  '''
+  the reverse of `AstWriter`, nodes are allocated
+  without calling their constructors
+  '''
+
+  def __init__(self, codes: array, strings: list[str], tokens: TokenBuffer) -> None:
+    self.strings: list[str] = strings
+    self.tokens: TokenBuffer = tokens
+    # the codes are only read forward
+    self.next: Callable[[], int] = iter(codes).__next__
+
+  def value(self) -> object:
+    return self.decode(self.next())
+
+  def decode(self, tag: int) -> object:
+    if tag >= NODE_BASE:
+      cls = NODE_CLASSES[tag - NODE_BASE]
+      node = cls.__new__(cls)
+
+      for attr in NODE_LAYOUTS[cls]:
+        if (attr_tag := self.next()) != ABSENT:
+          setattr(node, attr, self.decode(attr_tag))
+
+      return node
+
+    # the most frequent ones first
+    if tag == VIEW:
+      return TokenView(self.tokens, self.next())
+
+    if tag == SOURCE_LOC:
+      return SourceLoc(self.tokens.source_map, self.next())
+
+    if tag == LIST or tag == TUPLE:
+      items = [self.value() for _ in range(self.next())]
+      return items if tag == LIST else tuple(items)
+
+    if tag == STR:
+      return self.strings[self.next()]
+
+    if tag == RANGE:
+      start = self.next()
+      return TokenRange(self.tokens, start, self.next())
+
+    if tag == NONE:
+      return None
+
+    if tag == FALSE or tag == TRUE:
+      return tag == TRUE
+
+    if tag == INT:
+      return self.next()
+
+    if tag == BIGINT:
+      return int(self.strings[self.next()])
+
+    if tag == FLOAT:
+      return float(self.strings[self.next()])
+
+    if tag == TOKEN:
+      kind, value, loc, value_id = [self.value() for _ in range(4)]
+      return Token(cast(str, kind), value, cast(Loc, loc), cast(int | None, value_id))
+
+    if tag == LOC:
+      filepath = self.strings[self.next()]
+      line = self.next()
+      return Loc(filepath, line, self.next())
+
+    raise UnreachableError()
+
+def encode_unit(unit) -> bytes:
+  '''
+  the unit's tokens, pools, source map and tree
+  '''
+
+  tokens: TokenBuffer = unit.tokens
+  source_map: SourceMap = unit.source_map
+
+  w = AstWriter(tokens)
+  w.codes.append(len(tokens.objects))
+
+  for o in tokens.objects:
+    w.value(o)
+
+  w.value(unit.root)
+
+  sections: list[array] = [
+    tokens.kinds, tokens.values, tokens.offsets, tokens.matches,
+    *pack_strings(tokens.kind_names),
+    *pack_strings(unit.ids.contents),
+    *pack_strings(unit.str_literals.contents),
+    source_map.line_starts, source_map.segment_offsets,
+    source_map.segment_files, source_map.segment_deltas,
+    *pack_strings(source_map.filepaths),
+    *pack_strings(w.strings),
+    w.codes,
+  ]
+
+  out = [pack(AST_HEADER, AST_MAGIC, AST_FORMAT, *NATIVE)]
+
+  for section in sections:
+    out.append(pack('<cQ', section.typecode.encode(), len(section) * section.itemsize))
+    out.append(section.tobytes())
+
+  return b''.join(out)
+
+def decode_sections(data: bytes) -> list[array] | None:
+  '''
+  `None` when the file has another format
+  '''
+
+  header_size = calcsize(AST_HEADER)
+
+  if len(data) < header_size:
+    return None
+
+  magic, format, *native = unpack_from(AST_HEADER, data)
+
+  if magic != AST_MAGIC or format != AST_FORMAT or tuple(native) != NATIVE:
+    return None
+
+  sections: list[array] = []
+  pos: int = header_size
+  view = memoryview(data)
+
+  while pos < len(data):
+    typecode, size = unpack_from('<cQ', data, pos)
+    pos += calcsize('<cQ')
+
+    section = array(typecode.decode())
+    section.frombytes(view[pos:pos + size])
+    sections.append(section)
+    pos += size
+
+  return sections
+
+def restore_pool(strings: list[str]) -> InternPool:
+  pool = InternPool()
+  pool.contents = strings
+  pool.indices = {s: i for i, s in enumerate(strings)}
+
+  return pool
+
+def decode_unit(unit, data: bytes) -> bool:
+  '''
+  sets the unit's tokens, pools, source map and tree,
+  returns `False` (and sets nothing) when the format differs
+  '''
+
+  if (sections := decode_sections(data)) is None:
+    return False
+
+  kinds, values, offsets, matches, \
+    kind_lengths, kind_blob, \
+    id_lengths, id_blob, \
+    str_lengths, str_blob, \
+    line_starts, segment_offsets, segment_files, segment_deltas, \
+    filepath_lengths, filepath_blob, \
+    string_lengths, string_blob, \
+    codes = sections
+
+  source_map = SourceMap(unit.filepath)
+  source_map.line_starts = line_starts
+  source_map.segment_offsets = segment_offsets
+  source_map.segment_files = segment_files
+  source_map.segment_deltas = segment_deltas
+  source_map.filepaths = unpack_strings(filepath_lengths, filepath_blob)
+  source_map.filepath_indices = {f: i for i, f in enumerate(source_map.filepaths)}
+
+  ids = restore_pool(unpack_strings(id_lengths, id_blob))
+  str_literals = restore_pool(unpack_strings(str_lengths, str_blob))
+
+  tokens = TokenBuffer(ids, str_literals, source_map)
+  tokens.kinds = kinds
+  tokens.values = values
+  tokens.offsets = offsets
+  tokens.matches = matches
+  tokens.length = len(kinds)
+
+  # the codes are assigned in order
+  for kind in unpack_strings(kind_lengths, kind_blob):
+    tokens.kind_code(kind)
+
+  r = AstReader(codes, unpack_strings(string_lengths, string_blob), tokens)
+
+  for _ in range(r.next()):
+    tokens.object_index(r.value())
+
+  unit.root = r.value()
+  unit.tokens = tokens
+  unit.ids = ids
+  unit.str_literals = str_literals
+  unit.source_map = source_map
+
+  return True
+
+class AstCache:
+  '''
+  on-disk cache of dparse results, keyed by the unit's path and
+  preprocessed source (the tree only depends on its tokens) and
+  by the sources of `AST_MODULES`; an entry
+  holds the tree and the token storage it refers to, in the binary
+  format of `encode_unit`, entries are evicted least recently
+  used first when their total size goes over `max_bytes`
+  '''
+
+  def __init__(
+    self,
+    directory: str = join(DEFAULT_CACHE_DIR, 'ast'),
+    max_bytes: int = DEFAULT_CACHE_MAX_BYTES
+  ) -> None:
+    self.directory: str = directory
+    self.max_bytes: int = max_bytes
+    makedirs(directory, exist_ok=True)
+
+    self.hits: int = 0
+    self.misses: int = 0
+    self.evictions: int = 0
+
+    # hashed once, the modules don't change while running
+    self.modules: bytes = modules_hash().encode()
+
+  def entry_path(self, unit) -> str:
+    source = unit.source.encode() if isinstance(unit.source, str) else unit.source
+    name = hash_bytes(self.modules + b'\0' + unit.filepath.encode() + b'\0' + source)
+
+    return join(self.directory, f'{name}.ast')
+
+  def load(self, unit) -> bool:
+    path = self.entry_path(unit)
+
+    if exists(path):
+      with open(path, 'rb') as f:
+        loaded = decode_unit(unit, f.read())
+
+      if loaded:
+        # recently used, for the eviction
+        utime(path)
+
+        self.hits += 1
+        return True
+
+    self.misses += 1
+    return False
+
+  def store(self, unit) -> None:
+    path = self.entry_path(unit)
+
+    # written aside and then moved, so that readers
+    # never see a partial file
+    with open(path + '.tmp', 'wb') as f:
+      f.write(encode_unit(unit))
+
+    replace(path + '.tmp', path)
+    self.evictions += evict_lru(self.directory, self.max_bytes, keep=path)
+
+  def __repr__(self) -> str:
+    return \
+      f'AstCache({self.directory}, hits: {self.hits}, ' \
+      f'misses: {self.misses}, evictions: {self.evictions})'
@@ -0,0 +1,1270 @@
+'''
+development checks and benchmarks for the front-end,
+usage: `python bench.py <command> [samples...]`
+'''
+
+from unit import TranslationUnit, INGESTION_MODES, translation_units
+from preprocess import Preprocessor, PreprocessCache
+from data import *
+from sys import argv, executable
+from glob import glob
+from time import perf_counter
+from typing import Callable
+from tracemalloc import start as trace_start, stop as trace_stop, get_traced_memory
+
+SAMPLES: list[str] = sorted(glob('samples/*'))
+
+def timed(fn: Callable[[], object]) -> float:
+  start = perf_counter()
+  fn()
+
+  return perf_counter() - start
+
+def lex_with(unit: TranslationUnit, engine: str) -> list[tuple[str, object, str]] | str:
+  '''
+  lexes the unit and returns a comparable
+  representation of the token stream (or of the error)
+  '''
+
+  try:
+    unit.lex(engine)
+  except CompilationException as e:
+    return f'{e.message} at {e.loc}'
+
+  return [(t.kind, t.value, repr(t.loc)) for t in unit.tokens]
+
+def lexdiff(samples: list[str]) -> bool:
+  '''
+  differential check of the regex and bytes lexers against
+  the reference one, they must produce the same token stream
+  '''
+
+  ok = True
+
+  for sample in samples:
+    expected = lex_with(TranslationUnit(sample), 'char')
+
+    for engine, ingestion in [('regex', 'str'), ('bytes', 'mmap')]:
+      got = lex_with(TranslationUnit(sample, ingestion), engine)
+
+      if expected == got:
+        print(f'{sample} [{engine}]: ok ({len(expected)} tokens)')
+        continue
+
+      ok = False
+      print(f'{sample} [{engine}]: MISMATCH')
+
+      if isinstance(expected, str) or isinstance(got, str):
+        print(f'  char: {expected if isinstance(expected, str) else "tokens"}')
+        print(f'  {engine}: {got if isinstance(got, str) else "tokens"}')
+        continue
+
+      for i, (e, g) in enumerate(zip(expected, got)):
+        if e != g:
+          print(f'  token {i}: char {e} != {engine} {g}')
+          break
+      else:
+        print(f'  lengths differ: char {len(expected)}, {engine} {len(got)}')
+
+  return ok
+
+def lexbench(samples: list[str]) -> bool:
+  for sample in samples:
+    unit = TranslationUnit(sample)
+
+    for engine in ['char', 'regex']:
+      elapsed = timed(lambda: unit.lex(engine))
+
+      print(
+        f'{sample} [{engine}]: {len(unit.tokens)} tokens in {elapsed:.3f}s '
+        f'({len(unit.tokens) / elapsed:.0f} tokens/s)'
+      )
+
+  return True
+
+def lex_into_list(unit: TranslationUnit) -> list[Token]:
+  '''
+  the token storage used before `TokenBuffer`, one `Token` per token
+  '''
+
+  from lex import RegexLexer
+
+  unit.ids = InternPool()
+  unit.str_literals = InternPool()
+  unit.source_map = SourceMap(unit.filepath)
+
+  tokens: list[Token] = []
+  l = RegexLexer(unit)
+
+  while (token := l.next_token()) is not None:
+    tokens.append(token)
+
+  return tokens
+
+def measure_tokens(fn: Callable[[], object]) -> tuple[object, int, float]:
+  '''
+  returns the result of `fn`, the bytes still
+  allocated after the call and the elapsed time
+  '''
+
+  trace_start()
+  before, _ = get_traced_memory()
+  start = perf_counter()
+
+  result = fn()
+
+  elapsed = perf_counter() - start
+  after, _ = get_traced_memory()
+  trace_stop()
+
+  return result, after - before, elapsed
+
+def tokmem(samples: list[str]) -> bool:
+  '''
+  bytes per token and tokens per second, `list[Token]` vs `TokenBuffer`
+  (times are taken under tracemalloc, so they are only comparable
+  between each other)
+  '''
+
+  for sample in samples:
+    unit = TranslationUnit(sample)
+
+    tokens, list_bytes, list_time = measure_tokens(lambda: lex_into_list(unit))
+    count = len(tokens) # type: ignore[arg-type]
+    del tokens
+
+    _, buffer_bytes, buffer_time = measure_tokens(unit.lex)
+
+    if count == 0:
+      continue
+
+    print(f'{sample}: {count} tokens')
+    print(f'  list[Token]: {list_bytes / count:.1f} bytes/token, {count / list_time:.0f} tokens/s')
+    print(f'  TokenBuffer: {buffer_bytes / count:.1f} bytes/token, {count / buffer_time:.0f} tokens/s')
+
+  return True
+
+def intern(samples: list[str]) -> bool:
+  for sample in samples:
+    unit = TranslationUnit(sample)
+    unit.lex()
+
+    print(f'{sample}: {len(unit.tokens)} tokens')
+    print(f'  ids: {unit.ids}')
+    print(f'  str_literals: {unit.str_literals}')
+
+  return True
+
+def dparse_child(args: list[str]) -> bool:
+  '''
+  runs a single `batch` or `stream` dparse in this process and prints
+  `peak_rss_kb first_decl_s total_s window_peak` for `streambench`
+  '''
+
+  from resource import getrusage, RUSAGE_SELF
+
+  mode, sample = args
+  unit = TranslationUnit(sample)
+  first_decl: list[float] = []
+  on_declaration = lambda _: first_decl.append(perf_counter()) if not first_decl else None
+
+  start = perf_counter()
+
+  try:
+    if mode == 'batch':
+      unit.lex()
+      unit.dparse(on_declaration)
+    else:
+      unit.stream_dparse(on_declaration=on_declaration)
+  except CompilationException:
+    pass
+
+  total = perf_counter() - start
+  first = first_decl[0] - start if first_decl else total
+  window_peak = unit.window.peak if mode == 'stream' else len(unit.tokens)
+
+  print(getrusage(RUSAGE_SELF).ru_maxrss, first, total, window_peak)
+  return True
+
+def streambench(samples: list[str]) -> bool:
+  '''
+  batch vs streaming dparse, each one in its own process
+  so that the peak rss is not shared
+  '''
+
+  from subprocess import run
+
+  for sample in samples:
+    print(f'{sample}:')
+
+    for mode in ['batch', 'stream']:
+      out = run(
+        [executable, __file__, '_dparse', mode, sample],
+        capture_output=True, text=True
+      ).stdout.split()
+
+      rss, first, total, held = int(out[0]), float(out[1]), float(out[2]), int(out[3])
+
+      print(
+        f'  {mode}: peak rss {rss / 1024:.1f}MiB, first declaration after {first * 1000:.1f}ms, '
+        f'total {total * 1000:.1f}ms, {held} tokens held at most'
+      )
+
+  return True
+
+def ingest(samples: list[str]) -> bool:
+  '''
+  peak traced memory and time of reading and lexing
+  the preprocessed source, for each ingestion mode
+  '''
+
+  for sample in samples:
+    print(f'{sample}:')
+
+    for ingestion in INGESTION_MODES:
+      def run() -> TranslationUnit:
+        unit = TranslationUnit(sample, ingestion)
+        unit.lex()
+
+        return unit
+
+      trace_start()
+      start = perf_counter()
+      unit = run()
+      elapsed = perf_counter() - start
+      _, peak = get_traced_memory()
+      trace_stop()
+
+      print(
+        f'  {ingestion}: {len(unit.source)} source bytes, '
+        f'peak {peak / 1024:.1f}KiB, {elapsed * 1000:.1f}ms'
+      )
+
+  return True
+
+def cppbench(samples: list[str]) -> bool:
+  '''
+  spawns and wall time per unit, one preprocessor invocation
+  per unit vs a single batch invocation (it needs a compiler
+  driver, such as `Z9_CPP=gcc`: `cpp` takes one input, so
+  with it both are per unit)
+  '''
+
+  single = Preprocessor()
+  for sample in samples:
+    TranslationUnit(sample, preprocessor=single)
+
+  batch = Preprocessor()
+  translation_units(samples, preprocessor=batch)
+
+  print(f'per unit: {single}')
+  print(f'batch:    {batch}')
+
+  return True
+
+def cppcache(samples: list[str]) -> bool:
+  '''
+  cold vs warm preprocessing through a fresh `PreprocessCache`
+  '''
+
+  from tempfile import TemporaryDirectory
+
+  with TemporaryDirectory() as tmp:
+    cache = PreprocessCache(tmp)
+
+    for run in ['cold', 'warm']:
+      preprocessor = Preprocessor(cache=cache)
+      elapsed = timed(lambda: [TranslationUnit(s, preprocessor=preprocessor) for s in samples])
+
+      print(f'{run}: {elapsed * 1000:.1f}ms, {preprocessor}')
+      print(f'  {cache}')
+
+  return True
+
+def prefixbench(samples: list[str]) -> bool:
+  '''
+  units made of an `#include` of each sample and a short body,
+  dparsed from scratch vs resuming from a prefix snapshot (cold
+  and warm), the resulting trees must be the same
+  '''
+
+  from prefix import PrefixStore
+  from tempfile import TemporaryDirectory
+  from os.path import abspath, join
+
+  ok = True
+
+  with TemporaryDirectory() as tmp:
+    cache = PreprocessCache(join(tmp, 'cache'))
+    store = PrefixStore(cache)
+
+    for i, sample in enumerate(samples):
+      filepath = join(tmp, f'unit{i}.z9')
+
+      with open(filepath, 'w') as f:
+        f.write(f'// prefixbench\n#include "{abspath(sample)}"\n\nint main(void) {{ return 0; }}\n')
+
+      def run(use_prefix: bool) -> TranslationUnit:
+        unit = TranslationUnit(filepath, preprocessor=Preprocessor(cache=cache))
+
+        if use_prefix:
+          unit.use_prefix(store)
+
+        unit.lex()
+        unit.dparse()
+
+        return unit
+
+      try:
+        expected = repr(run(False).root)
+      except CompilationException as e:
+        print(f'{sample}: skipped, {e.message}')
+        continue
+
+      print(f'{sample}:')
+
+      for label, use_prefix in [('scratch', False), ('cold', True), ('warm', True)]:
+        elapsed = timed(lambda: run(use_prefix))
+        same = repr(run(use_prefix).root) == expected
+        ok = ok and same
+
+        print(f'  {label}: {elapsed * 1000:.1f}ms{"" if same else ", MISMATCH"}')
+
+    print(f'  {store}')
+
+  return ok
+
+def nested_declarator(shape: str, depth: int) -> str:
+  if shape == 'returns':
+    # `void g(void (*(*(*f)(int))(int))(int));`
+    d = '(*f)'
+    for _ in range(depth):
+      d = f'(*{d}(int))'
+
+    return f'void g(void {d}(int));\n'
+
+  if shape == 'params':
+    # `void (*p1)(void (*p0)(int));`
+    d = 'int'
+    for i in range(depth):
+      d = f'void (*p{i})({d})'
+
+    return f'{d};\n'
+
+  # `void g(int *const *const *const);`, the declarator
+  # fails and the abstract one parses the pointers again
+  return f'void g(int {"*const " * depth});\n'
+
+def declbench(_: list[str]) -> bool:
+  '''
+  dparse time per token of nested declarators,
+  it must stay flat as the depth grows
+  '''
+
+  for shape in ['returns', 'params', 'pointers']:
+    print(f'{shape}:')
+
+    for depth in [4, 8, 16, 32, 64]:
+      unit = TranslationUnit(f'{shape}.c', preprocessed=nested_declarator(shape, depth).encode())
+      unit.lex()
+
+      # the best of a few runs, the first one also imports dparse
+      elapsed = min(timed(unit.dparse) for _ in range(5))
+
+      print(f'  depth {depth}: {elapsed / len(unit.tokens) * 1e6:.1f}us/token')
+
+  return True
+
+def bodies_source(count: int) -> bytes:
+  '''
+  function definitions and initializers with nested
+  brackets, the lazy-body path of dparse
+  '''
+
+  body = ' '.join(
+    f'x = f(a[{i}], (b + {i}) * c); if (x) {{ y = {{1, 2}}; }}' for i in range(30)
+  )
+  items = ', '.join(f'({i})' for i in range(50))
+
+  return ''.join(
+    f'int g{n}(int a) {{ {body} }}\nint t{n}[] = {{ {items} }};\n' for n in range(count)
+  ).encode()
+
+def bodybench(_: list[str]) -> bool:
+  '''
+  dparse time, and the memory held by the tree per body or initializer
+  '''
+
+  unit = TranslationUnit('bodies.c', preprocessed=bodies_source(300))
+  unit.lex()
+
+  elapsed = min(timed(unit.dparse) for _ in range(5))
+  _, held, _ = measure_tokens(unit.dparse)
+
+  # each unit of `bodies_source` has one body and one initializer
+  compounds = len(unit.root.nodes)
+
+  print(f'{len(unit.tokens)} tokens, dparse {elapsed * 1000:.1f}ms')
+  print(f'  tree: {held / compounds:.0f} bytes per body or initializer')
+  return True
+
+def dparse_result(unit: TranslationUnit, dparse: Callable[[], None]) -> str:
+  '''
+  the tree and the error (if any), comparable
+  '''
+
+  try:
+    dparse()
+  except CompilationException as e:
+    return f'{unit.root}\n{e.message} at {e.loc}'
+
+  return repr(unit.root)
+
+def pardparse(samples: list[str]) -> bool:
+  '''
+  speed-up of `parallel_dparse` over `dparse` by number of
+  workers (up to the cores), the tree and the error must be the same
+  '''
+
+  from os import cpu_count
+
+  ok = True
+  cores = cpu_count() or 1
+  counts = sorted({1, cores} | {2 ** i for i in range(1, 8) if 2 ** i < cores})
+
+  for sample in samples:
+    unit = TranslationUnit(sample)
+    unit.lex()
+
+    # the first run also imports dparse
+    dparse_result(unit, unit.dparse)
+
+    start = perf_counter()
+    expected = dparse_result(unit, unit.dparse)
+    sequential = perf_counter() - start
+
+    print(f'{sample}: {len(unit.tokens)} tokens, {cores} cores, dparse {sequential * 1000:.1f}ms')
+
+    for workers in counts:
+      start = perf_counter()
+      got = dparse_result(unit, lambda: unit.parallel_dparse(workers))
+      elapsed = perf_counter() - start
+
+      same = got == expected
+      ok = ok and same
+
+      print(
+        f'  {workers} workers: {elapsed * 1000:.1f}ms, '
+        f'speed-up {sequential / elapsed:.2f}x{"" if same else ", MISMATCH"}'
+      )
+
+  return ok
+
+def count_nodes(node: object) -> int:
+  if isinstance(node, SyntaxNode):
+    return 1 + sum(count_nodes(v) for v in node.data.values())
+
+  if isinstance(node, MultipleNode):
+    return 1 + sum(count_nodes(n) for n in node.nodes)
+
+  return 1 if isinstance(node, Node) else 0
+
+def astmem(samples: list[str]) -> bool:
+  '''
+  bytes per tree node (tokens and locations included)
+  and dparse throughput
+  '''
+
+  for sample in samples:
+    unit = TranslationUnit(sample)
+    unit.lex()
+
+    try:
+      unit.dparse()
+      _, held, _ = measure_tokens(unit.dparse)
+      elapsed = min(timed(unit.dparse) for _ in range(3))
+    except CompilationException as e:
+      print(f'{sample}: skipped, {e.message}')
+      continue
+
+    nodes = count_nodes(unit.root)
+
+    print(
+      f'{sample}: {nodes} nodes, {held / nodes:.1f} bytes/node, '
+      f'dparse {len(unit.tokens) / elapsed:.0f} tokens/s'
+    )
+
+  return True
+
+def astcachebench(samples: list[str]) -> bool:
+  '''
+  lexing and dparsing from scratch vs loading the tree
+  from the `AstCache`, the loaded tree must be the same
+  '''
+
+  from astcache import AstCache
+  from tempfile import TemporaryDirectory
+  from os.path import getsize
+
+  ok = True
+
+  with TemporaryDirectory() as tmp:
+    cache = AstCache(tmp)
+
+    for sample in samples:
+      unit = TranslationUnit(sample)
+
+      try:
+        # the first run stores the entry
+        unit.cached_dparse(cache)
+      except CompilationException as e:
+        print(f'{sample}: skipped, {e.message}')
+        continue
+
+      expected = repr(unit.root)
+
+      def fresh() -> None:
+        unit.lex()
+        unit.dparse()
+
+      parse_time = min(timed(fresh) for _ in range(3))
+      load_time = min(timed(lambda: cache.load(unit)) for _ in range(3))
+
+      same = repr(unit.root) == expected
+      ok = ok and same
+
+      print(
+        f'{sample}: {getsize(cache.entry_path(unit)) / 1024:.1f}KiB entry, '
+        f'parse {parse_time * 1000:.1f}ms, load {load_time * 1000:.1f}ms '
+        f'({parse_time / load_time:.1f}x){"" if same else ", MISMATCH"}'
+      )
+
+    print(cache)
+
+  return ok
+
+def tree_locs(v: object, locs: list[str]) -> list[str]:
+  '''
+  the locations in a tree, in order (`repr` does not show them)
+  '''
+
+  if type(v) in NODE_LAYOUTS:
+    for attr in NODE_LAYOUTS[type(v)]:
+      if hasattr(v, attr):
+        tree_locs(getattr(v, attr), locs)
+  elif isinstance(v, (list, tuple, TokenRange)):
+    for item in v:
+      tree_locs(item, locs)
+  elif isinstance(v, Token):
+    locs.append(repr(v.loc))
+  elif isinstance(v, Loc):
+    locs.append(repr(v))
+
+  return locs
+
+def incbench(samples: list[str]) -> bool:
+  '''
+  full vs incremental dparse after an edit (a declaration inserted
+  in the middle of the unit, so the locations after it move),
+  the trees and their locations must be the same
+  '''
+
+  ok = True
+
+  for sample in samples:
+    previous = TranslationUnit(sample)
+    previous.lex()
+
+    try:
+      previous.incremental_dparse()
+    except CompilationException as e:
+      print(f'{sample}: skipped, {e.message}')
+      continue
+
+    source = cast(str, previous.source)
+    middle = source.find(';\n', len(source) // 2) + 2
+    edited = f'{source[:middle]}int incbench_edit;\n{source[middle:]}'.encode()
+
+    full = TranslationUnit(sample, preprocessed=edited)
+    full.lex()
+    full_time = min(timed(full.dparse) for _ in range(3))
+
+    unit = TranslationUnit(sample, preprocessed=edited)
+    unit.lex()
+    inc_time = min(timed(lambda: unit.incremental_dparse(previous)) for _ in range(3))
+
+    same = \
+      repr(unit.root) == repr(full.root) and \
+        tree_locs(unit.root, []) == tree_locs(full.root, [])
+    ok = ok and same
+
+    print(
+      f'{sample}: {len(unit.reused)}/{len(unit.root.nodes)} declarations reused, '
+      f'full {full_time * 1000:.1f}ms, incremental {inc_time * 1000:.1f}ms '
+      f'({full_time / inc_time:.1f}x){"" if same else ", MISMATCH"}'
+    )
+
+  return ok
+
+def expressions_source(count: int) -> bytes:
+  '''
+  function bodies made of long expressions, only
+  with binary operators (see `LadderLParse`)
+  '''
+
+  ops = ['+', '*', '-', '<<', '|', '&', '^', '==', '<', '/', '%', '>>', '!=', '>=']
+  names = ['a', 'b', 'c', '(a + b)', '(c * 3)', '7']
+
+  def expression(n: int) -> str:
+    return ' '.join(
+      f'{names[(n + i) % len(names)]} {ops[(n * 3 + i) % len(ops)]}' for i in range(24)
+    ) + ' a'
+
+  return ''.join(
+    f'int f{n}(int a, int b, int c) {{ return {expression(n)}; }}\n' for n in range(count)
+  ).encode()
+
+def ladder_lparse() -> type:
+  '''
+  the expression parser `LParse` had before the precedence table: one
+  rule per level of the grammar, so each operand goes through all of them
+  '''
+
+  from gen import LParse, BINARY
+
+  class LadderLParse(LParse):
+    def pg_ladder(self, ops: tuple[str, ...], parse_fn: Callable[[], None]) -> None:
+      parse_fn()
+
+      while self.token(*ops):
+        op = self.bck
+
+        parse_fn()
+        self.cbody.operator(BINARY, op.kind, op.loc)
+
+    def pg_assignment_expression(self) -> None:
+      multiplicative = (('*', '/', '%'), self.pg_cast_expression)
+      additive = (('+', '-'), lambda: self.pg_ladder(*multiplicative))
+      shift = (('<<', '>>'), lambda: self.pg_ladder(*additive))
+      relational = (('<', '>', '<=', '>='), lambda: self.pg_ladder(*shift))
+      equality = (('==', '!='), lambda: self.pg_ladder(*relational))
+      and_ = (('&',), lambda: self.pg_ladder(*equality))
+      xor = (('^',), lambda: self.pg_ladder(*and_))
+      or_ = (('|',), lambda: self.pg_ladder(*xor))
+
+      self.pg_ladder(*or_)
+
+  return LadderLParse
+
+def exprbench(_: list[str]) -> bool:
+  '''
+  body generation time, the precedence table vs the
+  rule per level one, they must emit the same code
+  '''
+
+  from gen import Gen, LParse
+
+  unit = TranslationUnit('expressions.c', preprocessed=expressions_source(300))
+  unit.lex()
+  unit.dparse()
+
+  gen = Gen(unit)
+  unit.tab = SymTable(unit.ids)
+  tokens = sum(len(cast(CompoundNode, n['body']).tokens) for n in unit.root.nodes) # type: ignore[index]
+
+  def run(cls: type) -> list[LParse]:
+    lparsers = [cls(gen, node) for node in unit.root.nodes]
+
+    for l in lparsers:
+      l.process()
+
+    return lparsers
+
+  results: dict[str, list[str]] = {}
+
+  for label, cls in [('ladder', ladder_lparse()), ('table', LParse)]:
+    elapsed = min(timed(lambda: run(cls)) for _ in range(5))
+    lparsers = run(cls)
+    results[label] = [l.cbody.disassemble() for l in lparsers]
+
+    instructions = sum(len(l.cbody) for l in lparsers)
+    print(
+      f'{label}: {len(lparsers)} bodies, {instructions} instructions, '
+      f'{elapsed * 1000:.1f}ms ({tokens / elapsed:.0f} tokens/s)'
+    )
+
+  same = results['ladder'] == results['table']
+  print('same code' if same else 'MISMATCH')
+
+  return same
+
+def constant_expressions_source(count: int) -> bytes:
+  '''
+  function bodies whose expressions are partly made of constants,
+  such as sizes and masks computed inline
+  '''
+
+  parts = [
+    '(4 * 8 + 2) * a', '(1 << 4) - 1', 'b * (16 / 4 - 1)', '(a & 0xff)',
+    '(sizeof_t > 2 ? 64 : 32)', '(1 ? 3 : 5) * c', '~0 ^ b', '(7 % 3 + 2 == 3)',
+  ]
+
+  def expression(n: int) -> str:
+    return ' + '.join(parts[(n + i) % len(parts)] for i in range(6))
+
+  return ''.join(
+    f'int f{n}(int a, int b, int c) {{ return {expression(n)}; }}\n' for n in range(count)
+  ).encode()
+
+def generated_bodies(count: int) -> list:
+  '''
+  the `CBody` of each function of `expressions_source`
+  '''
+
+  from gen import Gen, LParse
+
+  unit = TranslationUnit('expressions.c', preprocessed=expressions_source(count))
+  unit.lex()
+  unit.dparse()
+
+  gen = Gen(unit)
+  unit.tab = SymTable(unit.ids)
+  lparsers = [LParse(gen, node) for node in unit.root.nodes]
+
+  for l in lparsers:
+    l.process()
+
+  return [l.cbody for l in lparsers]
+
+def irmem(_: list[str]) -> bool:
+  '''
+  bytes per instruction and the time of a pass over all the
+  code, the array columns of `CBody` vs an object per instruction
+  '''
+
+  from gen import OPCODES, OPERATORS, CONST
+
+  class ObjectInstr:
+    __slots__ = ('op', 'ex', 'loc')
+
+    def __init__(self, op: str, ex: object, loc: Loc) -> None:
+      self.op: str = op
+      self.ex: object = ex
+      self.loc: Loc = loc
+
+  bodies = generated_bodies(300)
+  instructions = sum(len(b) for b in bodies)
+
+  def as_objects(b) -> list[ObjectInstr]:
+    return [
+      ObjectInstr(OPCODES[op], b.consts[arg] if op == CONST else OPERATORS[arg], loc)
+        for op, arg, loc in zip(b.ops, b.args, b.locs)
+    ]
+
+  objects = [as_objects(b) for b in bodies]
+
+  # the locations are shared by both, so they are not counted
+  array_bytes = sum(getsizeof(b.ops) + getsizeof(b.args) + getsizeof(b.locs) for b in bodies)
+  object_bytes = sum(getsizeof(o) + sum(getsizeof(i) for i in o) for o in objects)
+
+  def walk_arrays() -> None:
+    for b in bodies:
+      for op, arg in zip(b.ops, b.args):
+        pass
+
+  def walk_objects() -> None:
+    for o in objects:
+      for i in o:
+        i.op, i.ex
+
+  array_time = min(timed(walk_arrays) for _ in range(5))
+  object_time = min(timed(walk_objects) for _ in range(5))
+
+  print(f'{len(bodies)} bodies, {instructions} instructions')
+  print(
+    f'arrays: {array_bytes / instructions:.1f} bytes/instruction, '
+    f'pass {array_time * 1000:.2f}ms'
+  )
+  print(
+    f'objects: {object_bytes / instructions:.1f} bytes/instruction, '
+    f'pass {object_time * 1000:.2f}ms'
+  )
+
+  return True
+
+def foldbench(_: list[str]) -> bool:
+  '''
+  instructions emitted and generation time with and without
+  the constant folding of `CBody`
+  '''
+
+  from gen import Gen, LParse, CBody, OPERATOR_CODES
+
+  class UnfoldedCBody(CBody):
+    def operator(self, op: int, operator: str, loc: Loc) -> None:
+      self.emit(op, OPERATOR_CODES[operator], loc)
+
+    def constant_condition(self) -> bool | None:
+      return None
+
+  unit = TranslationUnit('constants.c', preprocessed=constant_expressions_source(300))
+  unit.lex()
+  unit.dparse()
+
+  gen = Gen(unit)
+  unit.tab = SymTable(unit.ids)
+
+  def run(cls: type) -> list[CBody]:
+    lparsers = [LParse(gen, node) for node in unit.root.nodes]
+
+    for l in lparsers:
+      l.cbody = cls(unit.ids)
+      l.process()
+
+    return [l.cbody for l in lparsers]
+
+  for label, cls in [('unfolded', UnfoldedCBody), ('folded', CBody)]:
+    elapsed = min(timed(lambda: run(cls)) for _ in range(5))
+    bodies = run(cls)
+
+    print(
+      f'{label}: {sum(len(b) for b in bodies)} instructions '
+      f'in {len(bodies)} bodies, {elapsed * 1000:.1f}ms'
+    )
+
+  return True
+
+COMPTIME_SOURCE: bytes = b'''
+int fib(int n) { return n < 2 ? n : fib(n - 1) + fib(n - 2); }
+int mix(int x) { return x = (x * 31 + 7) % 1009, x = x ^ (x << 3), x = x % 10007, x + (x > 5000); }
+int chain(int n) { return n == 0 ? 0 : mix(n) % 2 + chain(n - 1); }
+unsigned char inc(unsigned char x) { return x + 1; }
+signed char wrap(int x) { return x; }
+_Bool truth(int x) { return x; }
+unsigned short twice(unsigned short x) { return x = x * 2, x + 0; }
+unsigned int countdown(unsigned char x) { return x-- == 0 ? x : 0; }
+unsigned int umax(int x) { return x; }
+int later(int);
+int early(int x) { if (x > 100) { return later(x); } return x + 1; }
+int later(int x) { return @meta(early(1)); }
+'''
+
+# calls of `COMPTIME_SOURCE`'s functions whose values are stored into
+# narrower (or unsigned) types, and their results (as given by gcc)
+NARROW_CALLS: list[tuple[str, int, int]] = [
+  ('inc', 255, 0),
+  ('wrap', 200, -56),
+  ('truth', 256, 1),
+  ('twice', 40000, 14464),
+  ('countdown', 0, 255),
+  ('umax', -1, 4294967295),
+]
+
+def vmbench(_: list[str]) -> bool:
+  '''
+  instructions per second of the `ComptimeVM`, without
+  the cache of pure calls and with it, then checks the
+  conversions to the declared types (`NARROW_CALLS`) and
+  a `@meta` call of a function that refers to its caller
+  '''
+
+  from gen import Gen
+  from comptime import ComptimeVM, LIT_INT
+
+  unit = TranslationUnit('comptime.c', preprocessed=COMPTIME_SOURCE)
+  unit.lex()
+  unit.dparse()
+  unit.gen()
+
+  gen = Gen(unit)
+  loc = unit.root.loc
+
+  def body(name: str):
+    return cast(FnSymbol, unit.tab.members[unit.ids.intern(name)]).fn.cbody
+
+  ok = True
+
+  for name, n, expected in [('fib', 24, 46368), ('chain', 2000, None)]:
+    results: list[object] = []
+
+    for use_cache in [False, True]:
+      vm = ComptimeVM(unit.ids, gen.comptime_body, use_cache=use_cache, generated=gen.generated_body)
+
+      elapsed = timed(lambda: results.append(vm.call(body(name), [Val(LIT_INT, n)], loc).meta))
+
+      print(
+        f'{name}({n}) {"cached" if use_cache else "uncached"}: {results[-1]}, '
+        f'{vm.steps} instructions, {elapsed * 1000:.1f}ms '
+        f'({vm.steps / elapsed:.0f} instructions/s, {vm.hits} cache hits)'
+      )
+
+    same = results[0] == results[1] and expected in (None, results[0])
+    ok = ok and same
+
+    if not same:
+      print('MISMATCH')
+
+  vm = ComptimeVM(unit.ids, gen.comptime_body, generated=gen.generated_body)
+
+  for name, n, expected in NARROW_CALLS + [('later', 0, 2)]:
+    result = vm.call(body(name), [Val(LIT_INT, n)], loc)
+    same = result.meta == expected
+    ok = ok and same
+
+    print(f'{name}({n}): {result.meta} ({result.typ}){"" if same else f", expected {expected}"}')
+
+  return ok
+
+def helpers_source(helpers: int, exported: int) -> bytes:
+  '''
+  a unit made of `static inline` helpers, as the ones that
+  come with big headers, called in chains of up to 50
+  from a few exported functions (the roots)
+  '''
+
+  def helper(n: int) -> str:
+    call = f' + h{n + 1}(a - 1)' if n % 50 != 49 and n + 1 < helpers else ''
+    return f'static inline int h{n}(int a) {{ return a * {n % 7 + 1}{call}; }}\n'
+
+  def root(n: int) -> str:
+    return f'int api{n}(int a) {{ return h{n * 97 % helpers}(a) + 1; }}\n'
+
+  return (
+    ''.join(map(helper, range(helpers))) + ''.join(map(root, range(exported)))
+  ).encode()
+
+def demandbench(_: list[str]) -> bool:
+  '''
+  generation of the whole unit vs only of the bodies reachable from
+  the roots, the reachable ones must be the same in both
+  '''
+
+  source = helpers_source(3000, 10)
+  units: dict[str, TranslationUnit] = {}
+
+  for label in ['whole', 'demand']:
+    unit = units[label] = TranslationUnit('helpers.c', preprocessed=source)
+    unit.lex()
+    unit.dparse()
+
+    elapsed = timed(unit.gen if label == 'whole' else unit.demand_gen)
+    generated = sum(isinstance(v, FnSymbol) for v in unit.tab.members.values())
+
+    print(
+      f'{label}: {generated} bodies generated, '
+      f'{getattr(unit, "skipped_bodies", 0)} skipped, {elapsed * 1000:.1f}ms'
+    )
+
+  whole, demand = units['whole'].tab.members, units['demand'].tab.members
+
+  same = all(
+    not isinstance(v, FnSymbol) or
+      v.fn.cbody.disassemble() == cast(FnSymbol, whole[name]).fn.cbody.disassemble()
+        for name, v in demand.items()
+  )
+
+  print('same reachable code' if same else 'MISMATCH')
+  return same
+
+def gen_result(unit: TranslationUnit, gen: Callable[[], None]) -> tuple:
+  '''
+  the disassembly of each generated body (tests included) and the
+  error of `gen` (if any), the tree is kept across runs
+  '''
+
+  error: tuple[str, str] | None = None
+
+  try:
+    gen()
+  except CompilationException as e:
+    error = (e.message, str(e.loc))
+
+  bodies = [
+    (name, v.fn.cbody.disassemble()) for name, v in unit.tab.members.items()
+      if isinstance(v, FnSymbol)
+  ]
+
+  return bodies, error
+
+def pargen(_: list[str]) -> bool:
+  '''
+  speed-up of `parallel_gen` over `gen` by number of workers (up to
+  the cores) on a unit with thousands of functions, the bodies must be
+  the same; then again with a wrong body halfway, the error and the
+  bodies before it must be the same too
+  '''
+
+  from os import cpu_count
+
+  ok = True
+  cores = cpu_count() or 1
+  counts = sorted({1, cores} | {2 ** i for i in range(1, 8) if 2 ** i < cores})
+
+  helpers = helpers_source(3000, 10)
+  half = helpers.index(b'static inline int h1500(')
+  broken = helpers[:half] + b'int broken(int a) { return 1 = a; }\n' + helpers[half:]
+
+  for label, source in [('helpers', helpers), ('broken', broken)]:
+    unit = TranslationUnit(f'{label}.c', preprocessed=source)
+    unit.lex()
+    unit.dparse()
+
+    start = perf_counter()
+    expected = gen_result(unit, unit.gen)
+    sequential = perf_counter() - start
+
+    print(
+      f'{label}: {len(expected[0])} bodies, {cores} cores, gen {sequential * 1000:.1f}ms'
+      f'{"" if expected[1] is None else ", error at " + expected[1][1]}'
+    )
+
+    for workers in counts:
+      start = perf_counter()
+      got = gen_result(unit, lambda: unit.parallel_gen(workers))
+      elapsed = perf_counter() - start
+
+      same = got == expected
+      ok = ok and same
+
+      print(
+        f'  {workers} workers: {elapsed * 1000:.1f}ms, '
+        f'speed-up {sequential / elapsed:.2f}x{"" if same else ", MISMATCH"}'
+      )
+
+  return ok
+
+def copied_scopes(globals: dict[int, object], depth: int, names: list[int], hot: int) -> int:
+  '''
+  nested blocks as a copy of the table per scope
+  '''
+
+  found = 0
+  tables = [globals]
+
+  for _ in range(depth):
+    table = tables[-1].copy()
+
+    for name in names:
+      table[name] = name
+
+    tables.append(table)
+    found += table[hot] is not None
+
+  while len(tables) > 1:
+    tables.pop()
+
+  return found
+
+def chained_scopes(scopes: Scopes, depth: int, names: list[int], hot: int) -> int:
+  found = 0
+  loc = Loc('scopes.c', 1, 1)
+
+  for _ in range(depth):
+    scopes.push()
+
+    for name in names:
+      scopes.bind(name, name, loc)
+
+    found += scopes[hot] is not None
+
+  for _ in range(depth):
+    scopes.pop()
+
+  return found
+
+def scopebench(_: list[str]) -> bool:
+  '''
+  nested block scopes over thousands of globals, copying the
+  table per scope vs `Scopes`, the visible names must be the same
+  '''
+
+  ids = InternPool()
+  globals = [ids.intern(f'g{n}') for n in range(3000)]
+  locals = [ids.intern(f'l{n}') for n in range(4)]
+  hot = globals[1234]
+
+  scopes = Scopes(ids)
+
+  for name in globals:
+    scopes.bind(name, name, Loc('scopes.c', 1, 1))
+
+  before = dict(scopes.bindings)
+  ok = True
+
+  for depth in [4, 16, 64]:
+    copied = timed(lambda: [copied_scopes(before, depth, locals, hot) for _ in range(50)])
+    chained = timed(lambda: [chained_scopes(scopes, depth, locals, hot) for _ in range(50)])
+
+    same = scopes.bindings == before and scopes.depth == 0
+    ok = ok and same
+
+    print(
+      f'depth {depth}: copy {copied / 50 * 1e6:.0f}us, scopes {chained / 50 * 1e6:.0f}us '
+      f'per function, {copied / chained:.0f}x{"" if same else ", MISMATCH"}'
+    )
+
+  return ok
+
+def structural_eq(a: Typ, b: Typ) -> bool:
+  '''
+  how types were compared before they were hash-consed
+  '''
+
+  typs = [type(a), type(b)]
+
+  if PoisonedTyp in typs:
+    return True
+
+  if type(a) != type(b) or a.is_const != b.is_const:
+    return False
+
+  match a:
+    case IntTyp():
+      return a.kind == cast(IntTyp, b).kind and a.is_signed == cast(IntTyp, b).is_signed
+
+    case PointerTyp():
+      return structural_eq(a.pointee, cast(PointerTyp, b).pointee)
+
+    case ArrayTyp():
+      return structural_eq(a.pointee, cast(ArrayTyp, b).pointee) and a.length == cast(ArrayTyp, b).length
+
+    case FnTyp():
+      return structural_eq(a.ret, cast(FnTyp, b).ret) and len(a.params) == len(cast(FnTyp, b).params) and all(
+        structural_eq(p, q) for p, q in zip(a.params, cast(FnTyp, b).params)
+      )
+
+  return True
+
+def typbench(_: list[str]) -> bool:
+  '''
+  comparing function signatures (as for the heading declarations)
+  by identity vs structurally, and the sizes of arrays
+  '''
+
+  def signature(n: int) -> FnTyp:
+    char_pp = PointerTyp(PointerTyp(IntTyp('char', True, is_const=True)))
+    params = [IntTyp('int', True), char_pp, ArrayTyp(IntTyp('long', False), n), PointerTyp(VoidTyp())]
+
+    return FnTyp(PointerTyp(IntTyp('int', True)), params, False)
+
+  signatures = [signature(n) for n in range(100)]
+  again = [signature(n) for n in range(100)]
+  rounds = 200
+
+  identity = timed(lambda: [a == b for _ in range(rounds) for a, b in zip(signatures, again)])
+  structural = timed(lambda: [structural_eq(a, b) for _ in range(rounds) for a, b in zip(signatures, again)])
+
+  same = all(a is b and structural_eq(a, b) for a, b in zip(signatures, again)) and \
+    not any(a == b for a, b in zip(signatures, again[1:]))
+
+  compares = rounds * len(signatures)
+  print(
+    f'signatures: identity {identity / compares * 1e9:.0f}ns, '
+    f'structural {structural / compares * 1e9:.0f}ns per compare, {structural / identity:.0f}x'
+  )
+
+  arrays = [typ for s in signatures for typ in s.params if isinstance(typ, ArrayTyp)]
+  cached = timed(lambda: [typ.byte_size() for _ in range(rounds) for typ in arrays])
+
+  def uncached_byte_size(typ: Typ) -> int:
+    from math import ceil
+    return ceil(typ.compute_bit_size() / 8)
+
+  uncached = timed(lambda: [uncached_byte_size(typ) for _ in range(rounds) for typ in arrays])
+  same = same and all(typ.byte_size() == uncached_byte_size(typ) for typ in arrays)
+
+  # an array of const elements is const, however it is built
+  const_char = IntTyp('char', True, is_const=True)
+  same = same and ArrayTyp(const_char, 4) is ArrayTyp(const_char, 4, is_const=True)
+
+  print(
+    f'array sizes: cached {cached / compares * 1e9:.0f}ns, '
+    f'computed {uncached / compares * 1e9:.0f}ns per size'
+  )
+
+  print('same results' if same else 'MISMATCH')
+  return same
+
+def resolvebench(samples: list[str]) -> bool:
+  '''
+  resolving the declarations of the samples at predeclaration, then
+  looking their types up again (as the bodies and signature checks
+  do) memoized vs resolved again, the types must be the same
+  '''
+
+  from gen import Gen
+  from declarators import DeclaratorResolver
+
+  ok = True
+
+  for sample in samples:
+    unit = TranslationUnit(sample)
+
+    try:
+      unit.lex()
+      unit.dparse()
+    except CompilationException as e:
+      print(f'{sample}: {e.message} at {e.loc}')
+      continue
+
+    gen = Gen(unit)
+    unit.tab = SymTable(unit.ids)
+
+    nodes = [
+      n for n in unit.root.nodes
+        if isinstance(n, SyntaxNode) and n.syntax_name in ('Declaration', 'FunctionDefinition')
+    ]
+
+    predeclared = timed(lambda: [gen.predeclare_top_level(n) for n in unit.root.nodes])
+    rounds = 20
+
+    memoized = timed(lambda: [gen.resolver.declaration(n).typ for _ in range(rounds) for n in nodes])
+    again = timed(lambda: [DeclaratorResolver(gen).declaration(n).typ for _ in range(rounds) for n in nodes])
+
+    same = all(gen.resolver.declaration(n).typ is DeclaratorResolver(gen).declaration(n).typ for n in nodes)
+    ok = ok and same
+
+    lookups = rounds * len(nodes)
+    print(
+      f'{sample}: {len(nodes)} declarations, predeclared in {predeclared * 1000:.1f}ms, '
+      f'lookup {memoized / lookups * 1e9:.0f}ns memoized vs {again / lookups * 1e9:.0f}ns '
+      f'resolved again{"" if same else ", MISMATCH"}'
+    )
+
+  return ok
+
+COMMANDS: dict[str, Callable[[list[str]], bool]] = {
+  'lexdiff': lexdiff,
+  'lexbench': lexbench,
+  'tokmem': tokmem,
+  'intern': intern,
+  'streambench': streambench,
+  'ingest': ingest,
+  'cppbench': cppbench,
+  'cppcache': cppcache,
+  'prefixbench': prefixbench,
+  'declbench': declbench,
+  'bodybench': bodybench,
+  'pardparse': pardparse,
+  'astmem': astmem,
+  'astcachebench': astcachebench,
+  'incbench': incbench,
+  'exprbench': exprbench,
+  'irmem': irmem,
+  'foldbench': foldbench,
+  'vmbench': vmbench,
+  'demandbench': demandbench,
+  'pargen': pargen,
+  'scopebench': scopebench,
+  'typbench': typbench,
+  'resolvebench': resolvebench,
+  '_dparse': dparse_child,
+}
+
+if __name__ == '__main__':
+  if len(argv) < 2 or argv[1] not in COMMANDS:
+    print(f'usage: python bench.py ({" | ".join(COMMANDS)}) [samples...]')
+    exit(1)
+
+  if not COMMANDS[argv[1]](argv[2:] or SAMPLES):
+    exit(1)
@@ -0,0 +1,661 @@
+'''
+compile time evaluation, with the semantics of c integers:
+operands are promoted and converted the same way, unsigned results wrap
+around their width, while signed overflow (undefined behavior in c),
+division by zero and out of range shifts are reported
+'''
+
+from data import *
+from operator import add, sub, mul, and_, or_, xor
+import re
+
+# by conversion rank, see `common_typ`
+INT_RANKS: dict[str, int] = {
+  '_Bool': 0, 'char': 1, 'short': 2, 'int': 3, 'long': 4, 'longlong': 5,
+}
+
+INT: IntTyp = IntTyp('int', True)
+LIT_INT: LitIntTyp = LitIntTyp(INT)
+
+SHIFT_OPERATORS = ('<<', '>>')
+COMPARISON_OPERATORS = ('==', '!=', '<', '>', '<=', '>=')
+
+def typ_range(typ: IntTyp) -> tuple[int, int]:
+  bits = typ.bit_size()
+
+  if typ.is_signed and bits > 1:
+    return -2 ** (bits - 1), 2 ** (bits - 1) - 1
+
+  return 0, 2 ** bits - 1
+
+# by kind and signedness
+INT_RANGES: dict[tuple[str, bool], tuple[int, int]] = {
+  (kind, is_signed): typ_range(IntTyp(kind, is_signed))
+    for kind in INT_RANKS for is_signed in (True, False)
+}
+
+def int_range(typ: IntTyp) -> tuple[int, int]:
+  return INT_RANGES[typ.kind, typ.is_signed]
+
+def fits(value: int, typ: IntTyp) -> bool:
+  low, high = int_range(typ)
+  return low <= value <= high
+
+# the kinds of the integer literals by their suffix (lowercase, see
+# `integer_literal`), and whether it is unsigned
+INT_SUFFIXES: dict[str, tuple[str, bool]] = {
+  '': ('int', False), 'u': ('int', True),
+  'l': ('long', False), 'ul': ('long', True), 'lu': ('long', True),
+  'll': ('longlong', False), 'ull': ('longlong', True), 'llu': ('longlong', True),
+}
+
+LITERAL_KINDS: tuple[str, ...] = ('int', 'long', 'longlong')
+
+def literal_typs(kind: str, is_unsigned: bool, is_decimal: bool) -> list[IntTyp]:
+  '''
+  the types a literal may have (the first one that fits is its type), as
+  in c99: from the suffix's kind up, only the unsigned ones with a `u`,
+  only the signed ones for decimal literals, both for the others
+  '''
+
+  typs: list[IntTyp] = []
+
+  for k in LITERAL_KINDS[LITERAL_KINDS.index(kind):]:
+    if not is_unsigned:
+      typs.append(IntTyp(k, True))
+
+    if is_unsigned or not is_decimal:
+      typs.append(IntTyp(k, False))
+
+  return typs
+
+# by suffix and whether the literal is decimal
+LITERAL_TYPS: dict[tuple[str, bool], list[IntTyp]] = {
+  (suffix, is_decimal): literal_typs(kind, is_unsigned, is_decimal)
+    for suffix, (kind, is_unsigned) in INT_SUFFIXES.items()
+      for is_decimal in (True, False)
+}
+
+# the digits (with their radix prefix) and the suffix
+INT_LITERAL_PATTERN: re.Pattern[str] = re.compile(
+  r'(0[xX][0-9a-fA-F]+|0[bB][01]+|[0-9]+)([uUlL]*)'
+)
+
+def is_int_constant(v: Val) -> bool:
+  # `bool` metas are not c integers
+  return isinstance(v.typ, (LitIntTyp, IntTyp)) and type(v.meta) is int
+
+def integer_literal(spelling: str, loc: Loc | None) -> Val:
+  '''
+  the value of the integer literal `spelling` (as lexed), its type
+  depends on its radix and suffix (see `literal_typs`), not only
+  on its value: `0xFFFFFFFF` is an `unsigned int`
+  '''
+
+  if (m := INT_LITERAL_PATTERN.fullmatch(spelling)) is None or 'lL' in m[2] or 'Ll' in m[2]:
+    raise CompilationException(f'invalid integer constant "{spelling}"', loc)
+
+  digits, suffix = m[1], m[2].lower()
+  is_decimal = digits[0] != '0' or digits == '0'
+
+  if (typs := LITERAL_TYPS.get((suffix, is_decimal))) is None:
+    raise CompilationException(f'invalid suffix "{m[2]}" on integer constant', loc)
+
+  if digits[:2] in ('0x', '0X', '0b', '0B'):
+    value = int(digits, 0)
+  elif not is_decimal:
+    if '8' in digits or '9' in digits:
+      raise CompilationException(f'invalid digit in octal constant "{spelling}"', loc)
+
+    value = int(digits, 8)
+  else:
+    value = int(digits)
+
+  for typ in typs:
+    if fits(value, typ):
+      return Val(LitIntTyp(typ), value, loc)
+
+  raise CompilationException('integer constant is too large for its type', loc)
+
+def promoted(typ: IntTyp) -> IntTyp:
+  '''
+  the integer promotion, all the smaller types fit in `int`
+  '''
+
+  if INT_RANKS[typ.kind] < INT_RANKS['int']:
+    return INT
+
+  return typ
+
+def operand_typ(v: Val) -> IntTyp:
+  typ = v.typ
+
+  if isinstance(typ, LitIntTyp):
+    typ = typ.typ
+
+  return promoted(cast(IntTyp, typ))
+
+def common_typ(a: IntTyp, b: IntTyp) -> IntTyp:
+  '''
+  the usual arithmetic conversions, of promoted types
+  '''
+
+  if a.is_signed == b.is_signed:
+    return a if INT_RANKS[a.kind] >= INT_RANKS[b.kind] else b
+
+  signed, unsigned = (a, b) if a.is_signed else (b, a)
+
+  if INT_RANKS[unsigned.kind] >= INT_RANKS[signed.kind]:
+    return unsigned
+
+  # the signed one can represent all the values of the unsigned one
+  if signed.bit_size() > unsigned.bit_size():
+    return signed
+
+  return IntTyp(signed.kind, False)
+
+def convert(value: int, typ: IntTyp) -> int:
+  '''
+  the value converted to `typ`, out of range values wrap
+  around (implementation defined for signed types)
+  '''
+
+  low, high = int_range(typ)
+  return (value - low) % (high - low + 1) + low
+
+def checked(value: int, typ: IntTyp, loc: Loc | None) -> int:
+  '''
+  the result of an operation in `typ`
+  '''
+
+  if typ.is_signed:
+    if not fits(value, typ):
+      raise CompilationException(f'integer overflow in constant expression of type "{typ}"', loc)
+
+    return value
+
+  return convert(value, typ)
+
+def constant(value: int, typ: IntTyp, is_literal: bool, loc: Loc | None) -> Val:
+  # only literals give literals, of the type they were computed in
+  return Val(LitIntTyp(typ) if is_literal else typ, value, loc)
+
+def converted(v: Val, typ: Typ | None) -> Val:
+  '''
+  `v` stored into a declared type (a parameter, a local or the returned
+  value), converted as `convert` does, except that any non zero value
+  is 1 as a `_Bool`; the other types are not converted yet
+  '''
+
+  if v.typ is typ or not isinstance(typ, IntTyp) or not is_int_constant(v):
+    return v
+
+  value = cast(int, v.meta)
+
+  if typ.kind == '_Bool':
+    return Val(typ, int(value != 0), v.loc)
+
+  return Val(typ, convert(value, typ), v.loc)
+
+def truncated_division(a: int, b: int, loc: Loc | None) -> tuple[int, int]:
+  '''
+  c division rounds toward zero, python one toward negative infinity
+  '''
+
+  if b == 0:
+    raise CompilationException('division by zero in constant expression', loc)
+
+  q = abs(a) // abs(b)
+
+  if (a < 0) != (b < 0):
+    q = -q
+
+  return q, a - b * q
+
+def fold_unary(operator: str, v: Val, loc: Loc) -> Val | None:
+  '''
+  `None` when it cannot be computed at compile time
+  '''
+
+  if not is_int_constant(v) or operator not in ('+', '-', '~', '!'):
+    return None
+
+  typ = operand_typ(v)
+  value = convert(cast(int, v.meta), typ)
+  is_literal = isinstance(v.typ, LitIntTyp)
+
+  match operator:
+    case '+':
+      result = value
+
+    case '-':
+      result = checked(-value, typ, loc)
+
+    case '~':
+      result = convert(~value, typ)
+
+    case '!':
+      return constant(int(value == 0), INT, is_literal, v.loc)
+
+    case _:
+      raise UnreachableError()
+
+  return constant(result, typ, is_literal, v.loc)
+
+def compare(operator: str, a: int, b: int) -> int:
+  match operator:
+    case '==': return int(a == b)
+    case '!=': return int(a != b)
+    case '<':  return int(a < b)
+    case '>':  return int(a > b)
+    case '<=': return int(a <= b)
+    case '>=': return int(a >= b)
+
+  raise UnreachableError()
+
+# the operators computed the same way for all the types
+# (in range two's complement bitwise results stay in range)
+PLAIN_OPERATORS: dict[str, Callable[[int, int], int]] = {
+  '+': add, '-': sub, '*': mul, '&': and_, '|': or_, '^': xor,
+}
+
+def fold_binary(operator: str, left: Val, right: Val, loc: Loc) -> Val | None:
+  '''
+  `None` when it cannot be computed at compile time
+  '''
+
+  a, b = left.meta, right.meta
+
+  if left.typ is LIT_INT and right.typ is LIT_INT and type(a) is int and type(b) is int:
+    # the most frequent case, two `int` literals (always in range)
+    is_literal = True
+    typ = left_typ = INT
+  else:
+    if not is_int_constant(left) or not is_int_constant(right):
+      return None
+
+    is_literal = isinstance(left.typ, LitIntTyp) and isinstance(right.typ, LitIntTyp)
+    left_typ, right_typ = operand_typ(left), operand_typ(right)
+
+    # the type of a shift is the left operand's one, the count is not converted
+    if operator in SHIFT_OPERATORS:
+      typ = left_typ
+      a, b = convert(a, left_typ), convert(b, right_typ)
+    else:
+      typ = common_typ(left_typ, right_typ)
+      a, b = convert(a, typ), convert(b, typ)
+
+  if (fn := PLAIN_OPERATORS.get(operator)) is not None:
+    return constant(checked(fn(a, b), typ, loc), typ, is_literal, left.loc)
+
+  if operator in COMPARISON_OPERATORS:
+    return constant(compare(operator, a, b), INT, is_literal, left.loc)
+
+  if operator == '/' or operator == '%':
+    q, r = truncated_division(a, b, loc)
+    return constant(checked(q if operator == '/' else r, typ, loc), typ, is_literal, left.loc)
+
+  if operator in SHIFT_OPERATORS:
+    if not 0 <= b < typ.bit_size():
+      raise CompilationException(f'shift count {b} out of range for type "{typ}"', loc)
+
+    if operator == '>>':
+      return constant(a >> b, typ, is_literal, left.loc)
+
+    if a < 0:
+      raise CompilationException('left shift of a negative value in constant expression', loc)
+
+    return constant(checked(a << b, typ, loc), typ, is_literal, left.loc)
+
+  return None
+
+# the limits of a comptime execution (see `ComptimeVM`): executed
+# instructions, nested calls and values held at once (on the
+# stack and in the locals of all the calls)
+MAX_STEPS: int = 10_000_000
+MAX_DEPTH: int = 10_000
+MAX_CELLS: int = 1_000_000
+
+ONE: Val = Val(LIT_INT, 1)
+
+# a local not assigned yet, or one of a body not running at comptime
+UNKNOWN: object = object()
+
+# the result of a `void` call
+VOID_VAL: Val = Val(VoidTyp())
+
+class ComptimeVM:
+  '''
+  executes `CBody` code at compile time: values are `Val`s computed
+  with the semantics of c integers (see `fold_binary`) and converted
+  to the declared types of the parameters, locals and return values
+  they are stored into (see `converted`), each call has its own locals
+  and the frames of the callers are kept on an explicit call stack, so
+  that deep recursion is bounded by the limits and not by python's one;
+
+  `resolve` gives the body of the function a global name refers to
+  (`None` when it is not a function), generating it when needed, only
+  calls resolve their callee; `generated` gives it without generating
+  it (`UNKNOWN` when it is not generated yet), for `is_pure`; the
+  results of pure calls (which only use their locals and call pure
+  functions) are cached by argument values
+  '''
+
+  def __init__(
+    self,
+    ids: InternPool,
+    resolve: Callable[[int, Loc], Any],
+    max_steps: int = MAX_STEPS,
+    max_depth: int = MAX_DEPTH,
+    max_cells: int = MAX_CELLS,
+    use_cache: bool = True,
+    generated: Callable[[int], Any] | None = None
+  ) -> None:
+    self.ids: InternPool = ids
+    self.resolve: Callable[[int, Loc], Any] = resolve
+    # by default, only the bodies resolved so far are known
+    self.generated: Callable[[int], Any] = \
+      generated or (lambda name: self.bodies.get(name, UNKNOWN))
+
+    self.max_steps: int = max_steps
+    self.max_depth: int = max_depth
+    self.max_cells: int = max_cells
+
+    # (id of the body, arguments) -> result
+    self.cache: dict[tuple[int, tuple[tuple[Typ, object], ...]], Val] | None = \
+      {} if use_cache else None
+    # by id of the body
+    self.purity: dict[int, bool] = {}
+    # name id -> body, see `callee`
+    self.bodies: dict[int, Any] = {}
+
+    # instructions executed so far, across runs
+    self.steps: int = 0
+    self.hits: int = 0
+
+  def callee(self, name: int, loc: Loc) -> Any:
+    '''
+    `resolve`, the bodies don't change once generated
+    '''
+
+    if (body := self.bodies.get(name)) is not None:
+      return body
+
+    if (body := self.resolve(name, loc)) is not None:
+      self.bodies[name] = body
+
+    return body
+
+  def is_pure(self, body) -> bool:
+    '''
+    whether `body` only uses its locals and calls pure functions: the
+    bodies reachable from it are collected first, with whether their
+    own code is pure, then the impurity spreads to their callers until
+    nothing changes (the greatest fixed point), so the functions of a
+    recursive cycle are pure only once all of them are known to be;
+
+    nothing is generated here: a body referring to a function not
+    generated yet (maybe the one being generated) is not known to be
+    pure, it is not cached and asked again on its next call
+    '''
+    from gen import GLOBAL, IMPURE_OPS
+
+    if (pure := self.purity.get(id(body))) is not None:
+      return pure
+
+    # by id of the bodies whose purity is not known yet, `None`
+    # for the ones that (may) call a function not generated yet
+    callees: dict[int, list[int]] = {}
+    purity: dict[int, bool | None] = {}
+    pending: list[Any] = [body]
+
+    while len(pending) > 0:
+      b = pending.pop()
+
+      if id(b) in callees or id(b) in self.purity:
+        continue
+
+      callees[id(b)] = []
+      purity[id(b)] = True
+
+      for op, arg in zip(b.ops, b.args):
+        if op in IMPURE_OPS:
+          purity[id(b)] = False
+        elif op == GLOBAL:
+          # reading a global which is not a function
+          if (callee := self.generated(arg)) is None:
+            purity[id(b)] = False
+          elif callee is UNKNOWN:
+            if purity[id(b)]:
+              purity[id(b)] = None
+          else:
+            callees[id(b)].append(id(callee))
+            pending.append(callee)
+
+    # the ones already known keep their purity
+    known = self.purity
+    changed = True
+
+    while changed:
+      changed = False
+
+      for b, calls in callees.items():
+        if purity[b] is False:
+          continue
+
+        called = [purity.get(c, known.get(c)) for c in calls]
+
+        if False in called:
+          purity[b] = False
+        elif purity[b] and None in called:
+          purity[b] = None
+        else:
+          continue
+
+        changed = True
+
+    known.update((b, pure) for b, pure in purity.items() if pure is not None)
+    return purity[id(body)] is True
+
+  def evaluate(self, body, start: int, loc: Loc) -> Val:
+    '''
+    the value of the expression whose code starts at `start` and ends
+    with `body`, the locals of `body` are not known at compile time
+    '''
+
+    if (v := self.execute(body, start)) is VOID_VAL:
+      raise CompilationException('expression has no value', loc)
+
+    return v
+
+  def call(self, body, arguments: list[Val], loc: Loc) -> Val:
+    '''
+    the result of calling the function whose body is `body`
+    '''
+
+    if len(arguments) != body.params:
+      raise CompilationException(f'expected {body.params} arguments, got {len(arguments)}', loc)
+
+    return self.execute(body, 0, arguments)
+
+  def execute(self, body, start: int, arguments: list[Val] = []) -> Val:
+    '''
+    runs `body` from `start`, with `arguments` in its first local slots, until
+    it returns or its code ends (then the result is the last value pushed)
+    '''
+    from gen import \
+      CONST, LOCAL, LOCAL_REF, GLOBAL, CALL, UNARY, BINARY, ASSIGN, PRE, POST, \
+      POP, JUMP, JUMP_IF_FALSE, JUMP_IF_TRUE, RET, RET_VOID, OPCODES, OPERATORS, CBody
+
+    def error(message: str) -> CompilationException:
+      return CompilationException(message, locs[pc - 1])
+
+    def known(slot: int) -> Val:
+      if (v := slots[slot]) is UNKNOWN:
+        raise error(f'local "{self.ids[body.local_names[slot]]}" is not known at compile time')
+
+      return cast(Val, v)
+
+    stack: list[Any] = []
+    # the caller's state of each running call
+    frames: list[tuple] = []
+
+    ops, args, locs, consts = body.ops, body.args, body.locs, body.consts
+    slots: list[Any] = \
+      [converted(a, typ) for a, typ in zip(arguments, body.local_typs)] + \
+        [UNKNOWN] * (len(body.local_names) - len(arguments))
+    pc, end, base, call_key = start, len(ops), 0, None
+
+    cells: int = len(slots)
+    steps: int = 0
+    max_steps, max_depth, max_cells = self.max_steps, self.max_depth, self.max_cells
+    cache = self.cache
+
+    try:
+      while True:
+        if pc == end:
+          # the end of the evaluated code
+          if len(frames) == 0:
+            return stack[-1]
+
+          # falling off the end of a function
+          op, arg = RET_VOID, 0
+        else:
+          op = ops[pc]
+          arg = args[pc]
+
+        pc += 1
+        steps += 1
+
+        # the most frequent ones first
+        if op == LOCAL:
+          stack.append(known(arg))
+
+        elif op == CONST:
+          stack.append(consts[arg])
+
+        elif op == BINARY:
+          right = stack.pop()
+
+          if (v := fold_binary(OPERATORS[arg], stack[-1], right, locs[pc - 1])) is None:
+            raise error(f'operator "{OPERATORS[arg]}" cannot be computed at compile time')
+
+          stack[-1] = v
+
+        elif op == JUMP_IF_FALSE:
+          if stack.pop().meta == 0:
+            pc = arg
+
+        elif op == JUMP_IF_TRUE:
+          if stack.pop().meta != 0:
+            pc = arg
+
+        elif op == JUMP:
+          if arg < pc and steps > max_steps:
+            raise error(f'comptime execution exceeded {max_steps} steps')
+
+          pc = arg
+
+        elif op == GLOBAL:
+          if (callee := self.callee(arg, locs[pc - 1])) is None:
+            raise error(f'"{self.ids[arg]}" is not known at compile time')
+
+          stack.append(callee)
+
+        elif op == CALL:
+          callee = stack[-arg - 1]
+          arguments = stack[len(stack) - arg:]
+          del stack[-arg - 1:]
+
+          if not isinstance(callee, CBody):
+            raise error('only functions can be called at compile time')
+
+          if arg != callee.params:
+            raise error(f'expected {callee.params} arguments, got {arg}')
+
+          # as assigned to the parameters
+          arguments = [converted(a, typ) for a, typ in zip(arguments, callee.local_typs)]
+          key = None
+
+          if cache is not None and self.is_pure(callee):
+            key = (id(callee), tuple((a.typ, a.meta) for a in arguments))
+
+            if (v := cache.get(key)) is not None:
+              self.hits += 1
+              stack.append(v)
+              continue
+
+          if len(frames) >= max_depth:
+            raise error(f'comptime calls nested deeper than {max_depth}')
+
+          if steps > max_steps:
+            raise error(f'comptime execution exceeded {max_steps} steps')
+
+          frames.append((body, pc, end, base, slots, call_key))
+
+          body = callee
+          ops, args, locs, consts = body.ops, body.args, body.locs, body.consts
+          slots = arguments + [UNKNOWN] * (len(body.local_names) - arg)
+          pc, end, base, call_key = 0, len(ops), len(stack), key
+
+          cells += len(slots)
+
+          if cells + len(stack) > max_cells:
+            raise error(f'comptime execution holds more than {max_cells} values')
+
+        elif op == RET or op == RET_VOID:
+          v = converted(stack.pop(), body.ret_typ) if op == RET else VOID_VAL
+
+          if call_key is not None:
+            cast(dict, cache)[call_key] = v
+
+          if len(frames) == 0:
+            return v
+
+          cells -= len(slots)
+          del stack[base:]
+
+          body, pc, end, base, slots, call_key = frames.pop()
+          ops, args, locs, consts = body.ops, body.args, body.locs, body.consts
+          stack.append(v)
+
+        elif op == UNARY:
+          if (v := fold_unary(OPERATORS[arg], stack[-1], locs[pc - 1])) is None:
+            raise error(f'operator "{OPERATORS[arg]}" cannot be computed at compile time')
+
+          stack[-1] = v
+
+        elif op == LOCAL_REF:
+          # references are slots
+          stack.append(arg)
+
+        elif op == ASSIGN:
+          v = stack.pop()
+          slot = stack.pop()
+
+          if OPERATORS[arg] != '=':
+            operator = OPERATORS[arg][:-1]
+
+            if (v := fold_binary(operator, known(slot), v, locs[pc - 1])) is None:
+              raise error(f'operator "{operator}" cannot be computed at compile time')
+
+          slots[slot] = v = converted(v, body.local_typs[slot])
+          stack.append(v)
+
+        elif op == PRE or op == POST:
+          slot = stack.pop()
+          old = known(slot)
+
+          if (v := fold_binary(OPERATORS[arg][0], old, ONE, locs[pc - 1])) is None:
+            raise error(f'operator "{OPERATORS[arg]}" cannot be computed at compile time')
+
+          slots[slot] = v = converted(v, body.local_typs[slot])
+          stack.append(v if op == PRE else old)
+
+        elif op == POP:
+          stack.pop()
+
+        else:
+          raise error(f'"{OPCODES[op]}" cannot be executed at compile time')
+    finally:
+      self.steps += steps
@@ -1,4 +1,7 @@
-from typing import Callable, Any, cast
+from typing import Callable, Any, Iterator, cast
+from array import array
+from sys import getsizeof
+from bisect import bisect_right
 
 META_TYPES = [
   'this_t', 'info_t',
@@ -11,9 +14,20 @@ META_DIRECTIVES = [
 ]
 
 META_TAGS = META_DIRECTIVES + META_TYPES + [
-  'this'
+  'this', 'meta'
 ]
 
+# token kinds whose values are interned in `unit.ids`
+ID_KINDS = ('id', 'meta_id')
+
+# token kinds whose values are interned in `unit.str_literals`
+STR_KINDS = ('str', 'chr', 'meta_str')
+
+# closing bracket -> opening bracket
+BRACKET_PAIRS: dict[str, str] = {')': '(', ']': '[', '}': '{'}
+OPENING_BRACKETS = tuple(BRACKET_PAIRS.values())
+BRACKETS = frozenset(OPENING_BRACKETS) | frozenset(BRACKET_PAIRS)
+
 INDENT_DEPTH: int = 2
 INDENT_STEP: str = ' ' * INDENT_DEPTH
 
@@ -73,6 +87,8 @@ def recoverable(func):
   return wrapper
 
 class Loc:
+  __slots__ = ('filepath', 'line', 'col')
+
   def __init__(self, filepath: str, line: int, col: int) -> None:
     self.filepath: str = filepath
     self.line: int = line
@@ -81,6 +97,103 @@ class Loc:
   def __repr__(self) -> str:
     return f'{self.filepath}:{self.line}:{self.col}'
 
+class SourceLoc(Loc):
+  '''
+  a location stored as an offset into the preprocessed source,
+  filepath, line and column are only computed when accessed
+  '''
+
+  __slots__ = ('source_map', 'offset')
+
+  def __init__(self, source_map: 'SourceMap', offset: int) -> None:
+    self.source_map: SourceMap = source_map
+    self.offset: int = offset
+
+  @property
+  def filepath(self) -> str: # type: ignore[override]
+    return self.source_map.resolve(self.offset)[0]
+
+  @property
+  def line(self) -> int: # type: ignore[override]
+    return self.source_map.resolve(self.offset)[1]
+
+  @property
+  def col(self) -> int: # type: ignore[override]
+    return self.source_map.resolve(self.offset)[2]
+
+  # the base slots are shadowed by the properties, so they are not pickled
+  def __reduce__(self) -> tuple[type, tuple['SourceMap', int]]:
+    return SourceLoc, (self.source_map, self.offset)
+
+  def __repr__(self) -> str:
+    filepath, line, col = self.source_map.resolve(self.offset)
+    return f'{filepath}:{line}:{col}'
+
+class SourceMap:
+  '''
+  maps offsets of the preprocessed source to locations,
+  the same idea as `filepaths_t` in old/source/compilation_tower.h;
+  the lexer registers the start of each line and each
+  linemarker (`# line "file"`) as a new segment
+  '''
+
+  def __init__(self, filepath: str) -> None:
+    # offsets of the first char of each line
+    self.line_starts: array[int] = array('L', [0])
+
+    # one entry per linemarker segment: where it starts,
+    # its file, and what to add to the line index to get its line
+    self.segment_offsets: array[int] = array('L')
+    self.segment_files: array[int] = array('H')
+    self.segment_deltas: array[int] = array('l')
+
+    self.filepaths: list[str] = []
+    self.filepath_indices: dict[str, int] = {}
+
+    self.add_segment(0, filepath, 1)
+
+  def filepath_index(self, filepath: str) -> int:
+    if (index := self.filepath_indices.get(filepath)) is not None:
+      return index
+
+    index = len(self.filepaths)
+    self.filepaths.append(filepath)
+    self.filepath_indices[filepath] = index
+
+    return index
+
+  def add_line(self, offset: int) -> None:
+    self.line_starts.append(offset)
+
+  def add_segment(self, offset: int, filepath: str, line: int) -> None:
+    '''
+    from `offset` on, the current line is `line` of `filepath`
+    '''
+
+    self.segment_offsets.append(offset)
+    self.segment_files.append(self.filepath_index(filepath))
+    self.segment_deltas.append(line - len(self.line_starts))
+
+  def add_linemarker(self, offset: int, filepath: str, line: int) -> None:
+    '''
+    a linemarker tells the line that follows it
+    '''
+
+    self.add_segment(offset, filepath, line - 1)
+
+  def resolve(self, offset: int) -> tuple[str, int, int]:
+    line = bisect_right(self.line_starts, offset) - 1
+    segment = bisect_right(self.segment_offsets, offset) - 1
+
+    return (
+      self.filepaths[self.segment_files[segment]],
+      line + self.segment_deltas[segment] + 1,
+      offset - self.line_starts[line] + 1
+    )
+
+  def loc(self, offset: int) -> SourceLoc:
+    return SourceLoc(self, offset)
+
 class CompilationException(Exception):
   def __init__(self, message: str, loc: Loc | None) -> None:
     super().__init__()
@@ -88,6 +201,8 @@ class CompilationException(Exception):
     self.loc: Loc | None = loc
 
 class Node:
+  __slots__ = ('loc',)
+
   def __init__(self, loc: Loc) -> None:
     self.loc: Loc = loc
 
@@ -97,17 +212,67 @@ class Node:
   def __repr__(self) -> str:
     raise NotImplementedError(type(self).__name__)
 
+class InternPool:
+  '''
+  stores each distinct string only once and hands out
+  a small integer id for it, the same as `ids_t` in
+  old/source/compilation_tower.h;
+  the lexer fills one pool for identifiers (`unit.ids`) and one
+  for string literals (`unit.str_literals`), then the later stages
+  can compare ids instead of strings
+  '''
+
+  def __init__(self) -> None:
+    self.contents: list[str] = []
+    self.indices: dict[str, int] = {}
+
+    # memory not allocated thanks to the pooling
+    self.saved_bytes: int = 0
+
+  def intern(self, content: str) -> int:
+    if (index := self.indices.get(content)) is not None:
+      self.saved_bytes += getsizeof(content)
+      return index
+
+    index = len(self.contents)
+    self.contents.append(content)
+    self.indices[content] = index
+
+    return index
+
+  def lookup(self, content: str) -> int | None:
+    '''
+    like `intern`, but without adding the content when missing
+    '''
+
+    return self.indices.get(content)
+
+  def __getitem__(self, index: int) -> str:
+    return self.contents[index]
+
+  def __len__(self) -> int:
+    return len(self.contents)
+
+  def __repr__(self) -> str:
+    return f'InternPool(unique: {len(self)}, saved_bytes: {self.saved_bytes})'
+
 class Token(Node):
+  __slots__ = ('kind', 'value', 'value_id')
+
   def __init__(
     self,
     kind: str,
     value: object,
-    loc: Loc
+    loc: Loc,
+    value_id: int | None = None
   ) -> None:
     super().__init__(loc)
 
     self.kind: str = kind
     self.value: object = value
+    # the id of `value` in the unit's `InternPool`
+    # (only for identifiers and strings)
+    self.value_id: int | None = value_id
 
   def __repr__(self) -> str:
     if self.kind == self.value:
@@ -115,14 +280,411 @@ class Token(Node):
 
     return f'{self.kind}({repr(self.value)})'
 
+class TokenView(Token):
+  '''
+  a lightweight handle to the token at `index` in a `TokenBuffer`,
+  fields are read from the buffer's columns only when accessed
+  '''
+
+  __slots__ = ('buffer', 'index')
+
+  def __init__(self, buffer: 'TokenBuffer', index: int) -> None:
+    self.buffer: TokenBuffer = buffer
+    self.index: int = index
+
+  @property
+  def kind(self) -> str: # type: ignore[override]
+    return self.buffer.kind_at(self.index)
+
+  @property
+  def value(self) -> object: # type: ignore[override]
+    return self.buffer.value_at(self.index)
+
+  @property
+  def loc(self) -> Loc: # type: ignore[override]
+    return self.buffer.loc_at(self.index)
+
+  @property
+  def value_id(self) -> int | None: # type: ignore[override]
+    return self.buffer.value_id_at(self.index)
+
+  def __reduce__(self) -> tuple[type, tuple['TokenBuffer', int]]:
+    return TokenView, (self.buffer, self.index)
+
+class BracketMatcher:
+  '''
+  pairs the brackets while the tokens are stored, `matches` maps
+  each opener's index to its closer's one (-1 when unmatched);
+
+  a closer matches the innermost open bracket of its
+  kind, the ones still open inside it (such as `(` in `{ ( }`)
+  stay unmatched, and a closer with no opener is ignored;
+
+  indexes are absolute, `matches` may only hold the tokens from
+  `base` on (see `TokenWindow`), the openers before it are `release`d
+  '''
+
+  def __init__(self) -> None:
+    self.open_brackets: list[tuple[int, str]] = []
+
+  def feed(self, matches: Any, index: int, kind: str, base: int = 0) -> None:
+    if kind in OPENING_BRACKETS:
+      self.open_brackets.append((index, kind))
+      return
+
+    opener = BRACKET_PAIRS[kind]
+
+    for i in range(len(self.open_brackets) - 1, -1, -1):
+      if self.open_brackets[i][1] != opener:
+        continue
+
+      for unclosed, _ in self.open_brackets[i + 1:]:
+        matches[unclosed - base] = -1
+
+      matches[self.open_brackets[i][0] - base] = index
+      del self.open_brackets[i:]
+
+      return
+
+  def release(self, index: int) -> None:
+    '''
+    forgets the brackets still open before `index`, so a later
+    closer no longer matches them (nor closes the ones inside)
+    '''
+
+    count: int = 0
+
+    while count < len(self.open_brackets) and self.open_brackets[count][0] < index:
+      count += 1
+
+    del self.open_brackets[:count]
+
+class TokenBuffer:
+  '''
+  struct-of-arrays token storage, the same design as `tokens_t`
+  in old/source/compilation_tower.h: kinds, values and locations
+  live in parallel `array` columns instead of one `Token` (plus its `Loc`)
+  per token; indexing hands out `TokenView`s
+
+  the values of identifiers and strings are their ids in the unit's
+  `InternPool`s, the other values are indexes into `objects`,
+  where each distinct value is kept only once;
+  locations are source offsets, resolved through the unit's `SourceMap`;
+  brackets are paired while appending, see `match_at`
+  '''
+
+  def __init__(
+    self,
+    ids: InternPool,
+    str_literals: InternPool,
+    source_map: SourceMap
+  ) -> None:
+    self.ids: InternPool = ids
+    self.str_literals: InternPool = str_literals
+    self.source_map: SourceMap = source_map
+
+    self.kinds: array[int] = array('B')
+    self.values: array[int] = array('L')
+    # source offsets, resolved through `source_map`
+    self.offsets: array[int] = array('L')
+    # the index of each opening bracket's closer, otherwise -1
+    self.matches: array[int] = array('i')
+    self.brackets: BracketMatcher = BracketMatcher()
+
+    # the same as `len(self)`, but without the call overhead
+    self.length: int = 0
+
+    self.kind_names: list[str] = []
+    self.kind_codes: dict[str, int] = {}
+    # the pool each kind's values are interned in, by kind code
+    self.kind_pools: list[InternPool | None] = []
+
+    self.objects: list[object] = []
+    # the type is part of the key, so that `1` and `1.0` are not merged
+    self.object_indices: dict[tuple[type, object], int] = {}
+
+  def kind_code(self, kind: str) -> int:
+    if (code := self.kind_codes.get(kind)) is not None:
+      return code
+
+    code = len(self.kind_names)
+    self.kind_names.append(kind)
+    self.kind_codes[kind] = code
+
+    if kind in ID_KINDS:
+      self.kind_pools.append(self.ids)
+    elif kind in STR_KINDS:
+      self.kind_pools.append(self.str_literals)
+    else:
+      self.kind_pools.append(None)
+
+    return code
+
+  def object_index(self, value: object) -> int:
+    key = (type(value), value)
+
+    if (index := self.object_indices.get(key)) is not None:
+      return index
+
+    index = len(self.objects)
+    self.objects.append(value)
+    self.object_indices[key] = index
+
+    return index
+
+  def append(self, token: Token) -> None:
+    code: int = self.kind_code(token.kind)
+
+    self.kinds.append(code)
+
+    if self.kind_pools[code] is not None:
+      self.values.append(cast(int, token.value_id))
+    else:
+      self.values.append(self.object_index(token.value))
+
+    self.offsets.append(cast(SourceLoc, token.loc).offset)
+    self.matches.append(-1)
+
+    if token.kind in BRACKETS:
+      self.brackets.feed(self.matches, self.length, token.kind)
+
+    self.length += 1
+
+  def kind_at(self, index: int) -> str:
+    return self.kind_names[self.kinds[index]]
+
+  def value_at(self, index: int) -> object:
+    if (pool := self.kind_pools[self.kinds[index]]) is not None:
+      return pool.contents[self.values[index]]
+
+    return self.objects[self.values[index]]
+
+  def value_id_at(self, index: int) -> int | None:
+    if self.kind_pools[self.kinds[index]] is None:
+      return None
+
+    return self.values[index]
+
+  def loc_at(self, index: int) -> Loc:
+    return SourceLoc(self.source_map, self.offsets[index])
+
+  def match_at(self, index: int) -> int:
+    '''
+    the index of the bracket closing the one at `index`, or -1
+    '''
+
+    return self.matches[index]
+
+  def nbytes(self) -> int:
+    '''
+    the size of the columns, side tables excluded
+    '''
+
+    return sum(
+      len(c) * c.itemsize for c in [
+        self.kinds, self.values, self.offsets, self.matches
+      ]
+    )
+
+  def has(self, index: int) -> bool:
+    return index < self.length
+
+  def release(self, index: int) -> None:
+    '''
+    the whole buffer is kept, see `TokenWindow.release`
+    '''
+
+  def __len__(self) -> int:
+    return self.length
+
+  def __getitem__(self, index: int) -> TokenView:
+    if index < 0:
+      index += self.length
+
+    if not 0 <= index < self.length:
+      raise IndexError(index)
+
+    return TokenView(self, index)
+
+  def __iter__(self) -> Iterator[TokenView]:
+    for index in range(self.length):
+      yield TokenView(self, index)
+
+  def slice(self, start: int, end: int) -> 'TokenRange':
+    return TokenRange(self, start, end)
+
+class TokenRange:
+  '''
+  a view of the tokens in [start, end) of a `TokenBuffer`, indexed like
+  a `list[Token]`, so that bodies and initializers don't copy their tokens;
+
+  it is also a token storage for `DParse` (indexes
+  are relative to `start`), see `parallel_dparse`
+  '''
+
+  __slots__ = ('buffer', 'start', 'end')
+
+  def __init__(self, buffer: TokenBuffer, start: int, end: int) -> None:
+    self.buffer: TokenBuffer = buffer
+    self.start: int = start
+    self.end: int = end
+
+  def __len__(self) -> int:
+    return self.end - self.start
+
+  def __getitem__(self, index: int) -> TokenView:
+    if index < 0:
+      index += self.end - self.start
+
+    if not 0 <= index < self.end - self.start:
+      raise IndexError(index)
+
+    return TokenView(self.buffer, self.start + index)
+
+  def __iter__(self) -> Iterator[TokenView]:
+    for index in range(self.start, self.end):
+      yield TokenView(self.buffer, index)
+
+  def __repr__(self) -> str:
+    return repr(list(self))
+
+  def has(self, index: int) -> bool:
+    return index < self.end - self.start
+
+  def release(self, index: int) -> None:
+    '''
+    see `TokenBuffer.release`
+    '''
+
+  def kind_at(self, index: int) -> str:
+    return self.buffer.kind_at(self.start + index)
+
+  def value_id_at(self, index: int) -> int | None:
+    return self.buffer.value_id_at(self.start + index)
+
+  def match_at(self, index: int) -> int:
+    # brackets closed outside of the range are unmatched
+    if not self.start <= (closer := self.buffer.match_at(self.start + index)) < self.end:
+      return -1
+
+    return closer - self.start
+
+  def slice(self, start: int, end: int) -> 'TokenRange':
+    return TokenRange(self.buffer, self.start + start, self.start + end)
+
+# the match of an opener whose closer was not pulled yet
+UNRESOLVED: int = -2
+
+class TokenWindow:
+  '''
+  a lookahead window over the token stream of a lexer, used
+  instead of `TokenBuffer` when lexing and parsing run together:
+  tokens are pulled only when the parser looks at them, and the
+  ones before `release`'s index are dropped (those referenced by
+  the syntax tree, such as names or bodies' tokens, are kept alive by it)
+
+  indexes are absolute, as if all the tokens were stored
+  '''
+
+  def __init__(self, source: Iterator[Token]) -> None:
+    self.source: Iterator[Token] = source
+    self.tokens: list[Token] = []
+    # the absolute index of `tokens[0]`
+    self.base: int = 0
+    self.is_exhausted: bool = False
+    self.last_token: Token | None = None
+
+    # the biggest number of tokens held at once
+    self.peak: int = 0
+
+    # parallel to `tokens`, the absolute index of each opener's
+    # closer, `UNRESOLVED` while it is still open, otherwise -1
+    self.matches: list[int] = []
+    self.brackets: BracketMatcher = BracketMatcher()
+
+  def fill(self, index: int) -> bool:
+    while index - self.base >= len(self.tokens):
+      if self.is_exhausted:
+        return False
+
+      if (token := next(self.source, None)) is None:
+        self.is_exhausted = True
+        return False
+
+      self.matches.append(UNRESOLVED if token.kind in OPENING_BRACKETS else -1)
+
+      if token.kind in BRACKETS:
+        self.brackets.feed(self.matches, self.base + len(self.tokens), token.kind, self.base)
+
+      self.tokens.append(token)
+      self.last_token = token
+
+    self.peak = max(self.peak, len(self.tokens))
+    return True
+
+  def has(self, index: int) -> bool:
+    return index - self.base < len(self.tokens) or self.fill(index)
+
+  def release(self, index: int) -> None:
+    '''
+    drops the tokens before `index`, the caller
+    must not rewind before it anymore
+    '''
+
+    del self.tokens[:index - self.base]
+    del self.matches[:index - self.base]
+    self.base = index
+
+    self.brackets.release(index)
+
+  def match_at(self, index: int) -> int:
+    '''
+    the same as `TokenBuffer.match_at`, tokens
+    are pulled until the bracket is resolved
+    '''
+
+    while self.matches[index - self.base] == UNRESOLVED:
+      if not self.fill(self.base + len(self.tokens)):
+        return -1
+
+    return self.matches[index - self.base]
+
+  def slice(self, start: int, end: int) -> list[Token]:
+    '''
+    a copy, the window drops its tokens on `release`
+    '''
+
+    return self.tokens[start - self.base:end - self.base]
+
+  def kind_at(self, index: int) -> str:
+    return self.tokens[index - self.base].kind
+
+  def value_id_at(self, index: int) -> int | None:
+    return self.tokens[index - self.base].value_id
+
+  def __getitem__(self, index: int) -> Token:
+    # negative indexes are relative to the last pulled token
+    if index < 0:
+      if len(self.tokens) == 0:
+        return cast(Token, self.last_token)
+
+      return self.tokens[index]
+
+    return self.tokens[index - self.base]
+
 class PoisonedNode(Node):
+  __slots__ = ()
+
   def __repr__(self) -> str:
     return f'PoisonedNode'
 
 class CompoundNode(Node):
+  __slots__ = ('tokens',)
+
   def __init__(self, loc: Loc) -> None:
     super().__init__(loc)
-    self.tokens: list[Token] = []
+    # a range of the unit's tokens, except when streaming
+    self.tokens: list[Token] | TokenRange = []
 
   def __repr__(self) -> str:
     if len(self.tokens) <= 2:
@@ -137,41 +699,116 @@ class CompoundNode(Node):
 class SyntaxNode(Node):
   '''
   represents a whole sytax node,
-  such as "FunctionDefinition" or a "Declaration"
+  such as "FunctionDefinition" or a "Declaration";
+
+  each syntax name has its own class (see `syntax_node_class`),
+  with a slot per field, fields are also accessed as `node['key']`;
+  an optional field that was never assigned is not part of the node
   '''
 
-  def __init__(
-    self,
-    loc: Loc,
-    syntax_name: str,
-    data: dict[str, Node | None],
-  ) -> None:
+  __slots__ = ()
+
+  syntax_name: str = ''
+  fields: tuple[str, ...] = ()
+
+  def __init__(self, loc: Loc, **data: Node | None) -> None:
     super().__init__(loc)
-    
-    self.syntax_name: str = syntax_name
-    self.data: dict[str, Node | None] = data
+
+    for key, value in data.items():
+      setattr(self, key, value)
+
+  @property
+  def data(self) -> dict[str, Node | None]:
+    '''
+    the assigned fields, in order (a new dict)
+    '''
+
+    return {
+      key: getattr(self, key) for key in self.fields if hasattr(self, key)
+    }
 
   def __getitem__(self, key: Any) -> Node | None:
     assert isinstance(key, str)
 
-    return self.data[key]
+    try:
+      return getattr(self, key)
+    except AttributeError:
+      raise KeyError(key) from None
+
+  def __setitem__(self, key: str, value: Node | None) -> None:
+    setattr(self, key, value)
 
   def __repr__(self) -> str:
-    if len(self.data) == 1:
-      k = next(iter(self.data))
-      v = self.data[k]
+    data = self.data
+
+    if len(data) == 1:
+      k = next(iter(data))
+      v = data[k]
 
       return f'{self.syntax_name}({k}: {v})'
 
     body = indented_repr(
-      list(self.data.items()),
+      list(data.items()),
       lambda i: f'{i[0]}: {repr(i[1])}',
       ("(", ")")
     )
 
     return f'{self.syntax_name}{body}'
 
+def syntax_node_class(syntax_name: str, *fields: str) -> type[SyntaxNode]:
+  return type(syntax_name, (SyntaxNode,), {
+    '__slots__': fields,
+    '__module__': __name__,
+    'syntax_name': syntax_name,
+    'fields': fields,
+  })
+
+# the syntax nodes dparse allocates, the module level names are
+# needed to pickle them (see `PrefixStore` and `parallel_dparse`)
+FunctionDefinition = syntax_node_class(
+  'FunctionDefinition', 'declaration_specifiers', 'declarator', 'body', 'method_modifier'
+)
+Declaration = syntax_node_class(
+  'Declaration', 'declaration_specifiers', 'declarator', 'initializer', 'bitfield'
+)
+EmptyDeclaration = syntax_node_class('EmptyDeclaration', 'declaration_specifiers')
+EnumeratorWithValue = syntax_node_class('EnumeratorWithValue', 'name', 'initializer')
+EnumSpecifier = syntax_node_class('EnumSpecifier', 'is_struct', 'name', 'body')
+StructSpecifier = syntax_node_class('StructSpecifier', 'name', 'body')
+UnionSpecifier = syntax_node_class('UnionSpecifier', 'name', 'body')
+Pointer = syntax_node_class('Pointer', 'type_qualifier_list', 'pointer')
+Declarator = syntax_node_class('Declarator', 'pointer', 'direct_declarator')
+AbstractDeclarator = syntax_node_class(
+  'AbstractDeclarator', 'pointer', 'direct_abstract_declarator'
+)
+EmptyParameterListAbstractDeclarator = syntax_node_class(
+  'EmptyParameterListAbstractDeclarator'
+)
+ParameterDeclaration = syntax_node_class(
+  'ParameterDeclaration', 'declaration_specifiers', 'declarator'
+)
+ParameterListDeclarator = syntax_node_class(
+  'ParameterListDeclarator', 'declarator', 'parameter_list', 'ellipsis'
+)
+ArrayDeclarator = syntax_node_class('ArrayDeclarator', 'declarator', 'size_initializer')
+ArrayAbstractDeclarator = syntax_node_class(
+  'ArrayAbstractDeclarator', 'declarator', 'size_initializer'
+)
+
+# by syntax name, for the names built at runtime
+SYNTAX_NODES: dict[str, type[SyntaxNode]] = {
+  cls.syntax_name: cls for cls in [
+    FunctionDefinition, Declaration, EmptyDeclaration,
+    EnumeratorWithValue, EnumSpecifier, StructSpecifier, UnionSpecifier,
+    Pointer, Declarator, AbstractDeclarator,
+    EmptyParameterListAbstractDeclarator, ParameterDeclaration,
+    ParameterListDeclarator, ArrayDeclarator, ArrayAbstractDeclarator,
+  ]
+}
+
 class MultipleNode(Node):
+  __slots__ = ('nodes',)
+
   def __init__(self, loc: Loc) -> None:
     super().__init__(loc)
 
@@ -188,10 +825,14 @@ class MultipleNode(Node):
     return f'MultipleNode{body}'
 
 class PlaceholderNode(Node):
+  __slots__ = ()
+
   def __init__(self) -> None:
     pass
 
 class UseFeatureDirective(Node):
+  __slots__ = ('features', 'body')
+
   def __init__(self, loc: Loc) -> None:
     super().__init__(loc)
 
@@ -219,6 +860,8 @@ class UseFeatureDirective(Node):
       f'UseFeatureDirective({features},{body}{indented_line()})'
 
 class TypeBuiltinNode(Node):
+  __slots__ = ('name',)
+
   def __init__(self, name: str, loc: Loc) -> None:
     super().__init__(loc)
 
@@ -228,10 +871,14 @@ class TypeBuiltinNode(Node):
     return f'TypeBuiltinNode({repr(self.name)})'
 
 class TypeTemplatedNode(Node):
+  __slots__ = ()
+
   def __init__(self, loc: Loc) -> None:
     super().__init__(loc)
 
 class DeclSpecNode(Node):
+  __slots__ = ('name',)
+
   def __init__(self, name: str, loc: Loc) -> None:
     super().__init__(loc)
 
@@ -246,6 +893,8 @@ class GenericImportDirective(Node):
   never allocated by the parser
   '''
 
+  __slots__ = ('kind', 'to_import')
+
   def __init__(self, kind: str, to_import: Token, loc: Loc) -> None:
     super().__init__(loc)
 
@@ -258,6 +907,8 @@ class AliasedImportDirective(GenericImportDirective):
   @import some = ...;
   '''
 
+  __slots__ = ('alias',)
+
   def __init__(self, alias: Token, kind: str, to_import: Token, loc: Loc) -> None:
     super().__init__(kind, to_import, loc)
 
@@ -273,6 +924,8 @@ class FullImportDirective(GenericImportDirective):
   @import * = ...;
   '''
 
+  __slots__ = ()
+
   def __repr__(self) -> str:
     return \
       f'FullImportDirective(kind: {repr(self.kind)}, to_import: {self.to_import})'
@@ -282,6 +935,8 @@ class PartialImportDirective(GenericImportDirective):
   @import {...} = ...;
   '''
 
+  __slots__ = ('names',)
+
   def __init__(
     self,
     names: list[tuple[Token, Token]],
@@ -298,6 +953,8 @@ class PartialImportDirective(GenericImportDirective):
       f'kind: {repr(self.kind)}, to_import: {self.to_import})'
 
 class TestDirective(Node):
+  __slots__ = ('desc', 'body')
+
   def __init__(self, desc: str, body: CompoundNode, loc: Loc) -> None:
     super().__init__(loc)
 
@@ -317,22 +974,95 @@ class TestDirective(Node):
     return \
       f'TestDirective({desc},{body}{indented_line()})'
 
+# the attributes of each node class, for the code that walks or
+# copies trees generically (see `AstWriter` and `rebase`)
+NODE_LAYOUTS: dict[type, tuple[str, ...]] = {
+  MultipleNode: ('loc', 'nodes'),
+  CompoundNode: ('loc', 'tokens'),
+  PoisonedNode: ('loc',),
+  PlaceholderNode: (),
+  TypeTemplatedNode: ('loc',),
+  TypeBuiltinNode: ('loc', 'name'),
+  DeclSpecNode: ('loc', 'name'),
+  UseFeatureDirective: ('loc', 'features', 'body'),
+  AliasedImportDirective: ('loc', 'alias', 'kind', 'to_import'),
+  FullImportDirective: ('loc', 'kind', 'to_import'),
+  PartialImportDirective: ('loc', 'names', 'kind', 'to_import'),
+  TestDirective: ('loc', 'desc', 'body'),
+} | {
+  cls: ('loc',) + cls.fields for cls in SYNTAX_NODES.values()
+}
+
 class UnreachableError(Exception):
   pass
 
-class Typ:
+# the canonical type of each key, see `TypInterner`
+TYPS: dict[tuple, 'Typ'] = {}
+
+def canonical_typ(key: tuple) -> 'Typ':
+  '''
+  the type of `key` (class, qualifiers and arguments), also
+  the way types are unpickled, so they stay canonical
+  '''
+
+  if (typ := TYPS.get(key)) is not None:
+    return typ
+
+  cls, is_const, *args = key
+
+  typ = type.__call__(cls, *args)
+  typ.is_const = typ.is_const or is_const
+  typ.key = key
+
+  TYPS[key] = typ
+  return typ
+
+class TypInterner(type):
+  '''
+  the metaclass of the types: they are hash-consed, a type is only
+  built once for each class, arguments and qualifiers, and then the
+  same object is returned; so types are compared by identity and their
+  sizes are computed once, types must never be changed after that
+  '''
+
+  def __call__(cls, *args: Any, is_const: bool = False) -> Any:
+    args = tuple(tuple(a) if type(a) is list else a for a in args)
+
+    # the key holds the constness the type ends up with, so
+    # that a type made const by its arguments has a single key
+    return canonical_typ((cls, is_const or cls.implied_const(*args), *args))
+
+class Typ(metaclass=TypInterner):
+  __slots__ = ('is_const', 'key', 'bits')
+
   def __init__(
     self,
     is_const: bool = False
   ) -> None:
     self.is_const: bool = is_const
-  
+    self.key: tuple = ()
+    # see `bit_size`
+    self.bits: int | None = None
+
+  @classmethod
+  def implied_const(cls, *args: Any) -> bool:
+    '''
+    whether the arguments alone make the type const
+    '''
+
+    return False
+
   def bit_size(self) -> int:
+    if (bits := self.bits) is None:
+      bits = self.bits = self.compute_bit_size()
+
+    return bits
+
+  def compute_bit_size(self) -> int:
     raise NotImplementedError(type(self).__name__)
-  
+
   def byte_size(self) -> int:
-    from math import ceil
-    return ceil(self.bit_size() / 8)
+    return (self.bit_size() + 7) // 8
 
   def quals(self) -> list[str]:
     r = []
@@ -342,52 +1072,52 @@ class Typ:
 
     return r
 
-  def are_quals_eq(self, other: 'Typ') -> bool:
+  def __eq__(self, other: object) -> bool:
+    # a poisoned type matches any other one, so
+    # that an error is not reported once per use
     return (
-      self.is_const == other.is_const
+      self is other or
+      type(self) is PoisonedTyp or
+      type(other) is PoisonedTyp
     )
 
-  def is_eq(self, other) -> bool:
-    raise NotImplementedError(type(self).__name__)
-
-  def __eq__(self, other: object) -> bool:
-    typs = [type(self), type(other)]
-
-    # if MetaIntTyp in typs and IntTyp in typs:
-    #   return True
-
-    if PoisonedTyp in typs:
-      return True
-
-    if type(self) != type(other):
-      return False
-
-    if not self.are_quals_eq(cast(Typ, other)):
-      return False
+  __hash__ = object.__hash__
 
-    return self.is_eq(other)
+  def __reduce__(self) -> tuple[Callable[[tuple], 'Typ'], tuple[tuple]]:
+    return canonical_typ, (self.key,)
 
   def __repr__(self) -> str:
     raise NotImplementedError(type(self).__name__)
 
 class LitIntTyp(Typ):
-  def is_eq(self, other: 'LitIntTyp') -> bool:
-    return True
+  '''
+  the type of integer literals and of the constants computed only
+  from them, `typ` is their c type (see `comptime.integer_literal`)
+  '''
 
-  def bit_size(self) -> int:
-    return 0
+  __slots__ = ('typ',)
+
+  def __init__(self, typ: 'IntTyp') -> None:
+    super().__init__()
+
+    self.typ: IntTyp = typ
+
+  def compute_bit_size(self) -> int:
+    return self.typ.bit_size()
 
   def __repr__(self) -> str:
-    return f'literal int'
+    return f'literal {self.typ}'
 
 class IntTyp(Typ):
+  __slots__ = ('kind', 'is_signed')
+
   def __init__(self, kind: str, is_signed: bool) -> None:
     super().__init__()
 
     self.kind: str = kind
     self.is_signed: bool = is_signed
   
-  def bit_size(self) -> int:
+  def compute_bit_size(self) -> int:
     match self.kind:
       # TODO: change 'long' to
       #       32 bit and allow
@@ -404,33 +1134,29 @@ class IntTyp(Typ):
       case _:
         raise UnreachableError(self.kind)
 
-  def is_eq(self, other: 'IntTyp') -> bool:
-    return (
-      self.kind == other.kind and
-      self.is_signed == other.is_signed
-    )
-
   def __repr__(self) -> str:
     kind = self.kind
 
     if kind == 'longlong':
       kind = 'long long'
 
+    if not self.is_signed and kind != '_Bool':
+      kind = f'unsigned {kind}'
+
     quals = self.quals()
     quals.insert(0, kind)
 
     return ' '.join(quals)
 
 class VoidTyp(Typ):
+  __slots__ = ()
+
   def __init__(self) -> None:
     super().__init__()
 
-  def bit_size(self) -> int:
+  def compute_bit_size(self) -> int:
     return 0
 
-  def is_eq(self, other: 'VoidTyp') -> bool:
-    return True
-
   def __repr__(self) -> str:
     quals = self.quals()
     quals.insert(0, 'void')
@@ -438,17 +1164,16 @@ class VoidTyp(Typ):
     return ' '.join(quals)
 
 class PointerTyp(Typ):
+  __slots__ = ('pointee',)
+
   def __init__(self, pointee: Typ) -> None:
     super().__init__()
 
     self.pointee: Typ = pointee
 
-  def bit_size(self) -> int:
+  def compute_bit_size(self) -> int:
     return 64
 
-  def is_eq(self, other: 'PointerTyp') -> bool:
-    return self.pointee == other.pointee
-
   def __repr__(self) -> str:
     quals = self.quals()
     quals.insert(0, repr(self.pointee))
@@ -467,65 +1192,70 @@ class PointerTyp(Typ):
     return ' '.join(quals) + '*'
 
 class FnTyp(Typ):
-  def __init__(
-    self,
-    ret: Typ,
-    params: list[Typ],
-    pnames: list[Token | None]
-  ) -> None:
+  '''
+  the names of the parameters are not part of the
+  type, they belong to each declaration of it
+  '''
+
+  __slots__ = ('ret', 'params', 'is_variadic')
+
+  def __init__(self, ret: Typ, params: tuple[Typ, ...], is_variadic: bool) -> None:
     super().__init__()
 
     self.ret: Typ = ret
-    self.params: list[Typ] = params
-    self.pnames: list[Token | None] = pnames
+    self.params: tuple[Typ, ...] = params
+    self.is_variadic: bool = is_variadic
 
-  def bit_size(self) -> int:
+  def compute_bit_size(self) -> int:
     return 0
 
-  def is_eq(self, other: 'FnTyp') -> bool:
-    return (
-      self.ret == other.ret and
-      self.params == other.params
-    )
-
   def __repr__(self) -> str:
     quals = self.quals()
 
-    params = ', '.join(map(repr, self.params))
+    params = ', '.join([*map(repr, self.params), *(['...'] if self.is_variadic else [])])
     quals.insert(0, f'{self.ret} ({params})')
 
     return '@fn ' + ' '.join(quals)
 
 class ArrayTyp(Typ):
-  def __init__(self, pointee: Typ, size: 'Val') -> None:
+  '''
+  `length` is `None` for arrays of unknown size
+  '''
+
+  __slots__ = ('pointee', 'length')
+
+  def __init__(self, pointee: Typ, length: int | None) -> None:
     super().__init__(pointee.is_const)
 
     self.pointee: Typ = pointee
-    self.length: Val = size
+    self.length: int | None = length
 
-  def bit_size(self) -> int:
-    return cast(int, self.length.meta) * self.pointee.bit_size()
+  @classmethod
+  def implied_const(cls, *args: Any) -> bool:
+    # an array of const elements is const itself
+    return args[0].is_const
 
-  def is_eq(self, other: 'ArrayTyp') -> bool:
-    return (
-      self.pointee == other.pointee and
-      self.length == other.length
-    )
+  def compute_bit_size(self) -> int:
+    return cast(int, self.length) * self.pointee.bit_size()
 
   def __repr__(self) -> str:
-    return f'{self.pointee}[{self.length}]'
+    return f'{self.pointee}[{"" if self.length is None else self.length}]'
 
 class PoisonedTyp(Typ):
+  __slots__ = ()
+
   def __init__(self) -> None:
     super().__init__()
 
-  def bit_size(self) -> int:
+  def compute_bit_size(self) -> int:
     return 0
 
   def __repr__(self) -> str:
     return '?'
 
 class Val:
+  __slots__ = ('typ', 'meta', 'loc')
+
   def __init__(self, typ: Typ, meta: object = None, loc: Loc | None = None) -> None:
     self.typ: Typ = typ
     self.meta: object = meta
@@ -551,6 +1281,30 @@ class Val:
 
 POISONED_VAL = Val(PoisonedTyp())
 
+class ResolvedDeclaration:
+  '''
+  the declared name and type of `node` (see `DeclaratorResolver`),
+  for functions also the names of the parameters, which are not
+  part of their type
+  '''
+
+  __slots__ = ('node', 'name', 'typ', 'pnames')
+
+  def __init__(
+    self,
+    node: Node,
+    name: Token | None,
+    typ: Typ,
+    pnames: list[Token | None]
+  ) -> None:
+    self.node: Node = node
+    self.name: Token | None = name
+    self.typ: Typ = typ
+    self.pnames: list[Token | None] = pnames
+
+  def __repr__(self) -> str:
+    return f'ResolvedDeclaration({self.name}: {self.typ})'
+
 class Symbol:
   def __init__(self, name: str, loc: Loc) -> None:
     self.name: str = name
@@ -578,22 +1332,117 @@ class FnSymbol(Symbol):
   def __repr__(self) -> str:
     return f'FnSymbol({self.fn.cbody})'
 
-class SymTable:
-  def __init__(self) -> None:
-    self.members: dict[str, Symbol | tuple[Node, bool]] = {}
-    self.heading_decls: dict[str, list[Node]] = {}
+class EnumeratorSymbol(Symbol):
+  '''
+  an enumeration constant, its value is known since predeclaration
+  '''
+
+  def __init__(self, name: str, loc: Loc, val: Val) -> None:
+    super().__init__(name, loc)
+
+    self.val: Val = val
+
+  def __repr__(self) -> str:
+    return f'EnumeratorSymbol({self.val})'
+
+class Scopes:
+  '''
+  nested scopes in a single table, keyed by the ids of the names in
+  `ids`: a name declared in an inner scope replaces its outer binding,
+  which is saved in an undo log and restored when the scope is popped;
+
+  `push` is O(1) and `pop` is O(1) for each name declared in the popped
+  scope, instead of copying the table per scope, and a lookup is a
+  single dict access, however deep the name was declared, so hot names
+  are never looked up along a chain of scopes;
+  the same structure holds the globals (see `SymTable`), the locals
+  of a function body and the members of a struct
+  '''
+
+  # the value of the undo log for names that were not bound
+  UNBOUND: object = object()
+
+  def __init__(self, ids: InternPool, what: str = 'name') -> None:
+    self.ids: InternPool = ids
+    # how names are called in the errors
+    self.what: str = what
+
+    self.bindings: dict[int, Any] = {}
+    # the scope depth of each binding
+    self.depths: dict[int, int] = {}
+
+    # name, shadowed value and its depth
+    self.undo: list[tuple[int, object, int]] = []
+    # the length of `undo` when each open scope was pushed
+    self.marks: list[int] = []
+
+  @property
+  def depth(self) -> int:
+    return len(self.marks)
+
+  def push(self) -> None:
+    self.marks.append(len(self.undo))
 
-  def copy(self) -> 'SymTable':
-    s = SymTable()
-    s.members = self.members.copy()
-    s.heading_decls = self.heading_decls.copy()
+  def pop(self) -> None:
+    mark = self.marks.pop()
 
-    return s
+    while len(self.undo) > mark:
+      name, value, depth = self.undo.pop()
 
-  def is_weak(self, name: str) -> bool:
-    return cast(tuple, self.members[name])[1]
+      if value is Scopes.UNBOUND:
+        del self.bindings[name], self.depths[name]
+      else:
+        self.bindings[name] = value
+        self.depths[name] = depth
 
-  def save_weak_decl(self, name: str, decl: Node) -> None:
+  def bind(self, name: int, value: Any, loc: Loc) -> None:
+    '''
+    declares `name` in the innermost scope
+    '''
+
+    depth = self.depths.get(name, -1)
+
+    if depth == self.depth:
+      raise CompilationException(f'{self.what} "{self.ids[name]}" already declared', loc)
+
+    # the global scope is never popped
+    if self.depth > 0:
+      self.undo.append((name, self.bindings.get(name, Scopes.UNBOUND), depth))
+
+    self.bindings[name] = value
+    self.depths[name] = self.depth
+
+  def get(self, name: int) -> Any | None:
+    return self.bindings.get(name)
+
+  def __contains__(self, name: int) -> bool:
+    return name in self.bindings
+
+  def __getitem__(self, name: int) -> Any:
+    return self.bindings[name]
+
+  def __len__(self) -> int:
+    return len(self.bindings)
+
+class SymTable(Scopes):
+  '''
+  the global scope, members are either symbols or the
+  predeclared nodes (and whether they are weak declarations)
+  '''
+
+  def __init__(self, ids: InternPool) -> None:
+    super().__init__(ids)
+    self.heading_decls: dict[int, list[Node]] = {}
+
+  @property
+  def members(self) -> dict[int, Symbol | tuple[Node, bool]]:
+    return self.bindings
+
+  def is_weak(self, name: int) -> bool:
+    # symbols (such as enumerators) are complete
+    return not isinstance(value := self.members[name], Symbol) and value[1]
+
+  def save_weak_decl(self, name: int, decl: Node) -> None:
     if name not in self.heading_decls:
       self.heading_decls[name] = []
 
@@ -601,12 +1450,15 @@ class SymTable:
 
   def declare(
     self,
-    name: str,
+    name: int,
     value: Node,
     is_weak: bool,
     loc: Loc
   ) -> None:
     if name in self.members:
+      if isinstance(self.members[name], Symbol):
+        raise CompilationException(f'name "{self.ids[name]}" already declared', loc)
+
       # we don't want the week declaration
       # to overwrite the complete one
       if is_weak:
@@ -614,32 +1466,28 @@ class SymTable:
         return
 
       if not self.is_weak(name):
-        raise CompilationException(f'name "{name}" already declared', loc)
+        raise CompilationException(f'name "{self.ids[name]}" already declared', loc)
 
       self.save_weak_decl(
         name,
         cast(tuple[Node, bool], self.members[name])[0]
       )
 
-    self.members[name] = (value, is_weak)
+      # the complete declaration replaces the weak one
+      self.members[name] = (value, is_weak)
+      return
+
+    self.bind(name, (value, is_weak), loc)
 
-  def get_member(self, name: str, loc: Loc) -> Symbol | None:
+  def get_member(self, name: int, loc: Loc) -> Symbol | None:
     if name not in self.members:
-      raise CompilationException(f'name "{name}" is not declared', loc)
+      raise CompilationException(f'name "{self.ids[name]}" is not declared', loc)
 
     return cast(Symbol, self.members[name])
 
-  def declare_local(self, name: str, typ: Typ, loc: Loc) -> None:
-    raise UnreachableError('function to remove')
-  
-    if name in self.members and isinstance(self.members[name], LocalSymbol):
-      raise CompilationException(f'local name "{name}" already declared', loc)
-
-    self.members[name] = LocalSymbol(name, loc, typ, llv)
-
   def __repr__(self) -> str:
     return '\n\n'.join(
-      f'{repr(name)} -> {m}' for name, m in self.members.items()
+      f'{repr(self.ids[name])} -> {m}' for name, m in self.members.items()
     )
 
 class CModule:
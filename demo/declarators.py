@@ -0,0 +1,226 @@
+'''
+the types of the declarations: their specifiers give the base type, then
+each part of the declarator derives a new one from it, from the outside
+in (the same order of the c reading rule), down to the declared name
+'''
+
+from data import *
+from comptime import is_int_constant
+
+STORAGE_SPECS = (
+  'typedef', 'extern', 'static', '_Thread_local', 'auto', 'register',
+  'inline', '_Noreturn',
+)
+
+QUALIFIER_SPECS = ('const', 'restrict', 'volatile', '_Atomic', '_Cdecl')
+
+# the kind of the integer types by their sorted specifiers,
+# `signed` and `unsigned` aside (see `int_typ`)
+INT_KINDS: dict[tuple[str, ...], str] = {
+  (): 'int',
+  ('int',): 'int',
+  ('char',): 'char',
+  ('_Bool',): '_Bool',
+  ('short',): 'short',
+  ('int', 'short'): 'short',
+  ('long',): 'long',
+  ('int', 'long'): 'long',
+  ('long', 'long'): 'longlong',
+  ('int', 'long', 'long'): 'longlong',
+}
+
+SIGN_SPECS = ('signed', 'unsigned')
+INT_SPECS = ('char', 'short', 'int', 'long', '_Bool', *SIGN_SPECS)
+
+def int_typ(specs: list[str], is_const: bool, loc: Loc) -> IntTyp:
+  signs = [s for s in specs if s in SIGN_SPECS]
+  kind = INT_KINDS.get(tuple(sorted(s for s in specs if s not in SIGN_SPECS)))
+
+  if kind is None or len(signs) > 1 or (kind == '_Bool' and len(signs) > 0):
+    raise CompilationException(f'invalid type specifiers "{" ".join(specs)}"', loc)
+
+  # plain `char` is signed, as on x86
+  return IntTyp(kind, kind != '_Bool' and signs != ['unsigned'], is_const=is_const)
+
+def specifiers_typ(dspecs: MultipleNode) -> Typ:
+  '''
+  the base type of the declaration specifiers `dspecs`
+  '''
+
+  specs: list[str] = []
+  is_const: bool = False
+
+  for spec in dspecs.nodes:
+    # TODO: struct, union and enum types, typedef-ed names,
+    #       meta types and the floating ones, until then their
+    #       type is poisoned, so it does not report errors
+    if not isinstance(spec, Token) or spec.kind in ('id', 'meta_id'):
+      return PoisonedTyp()
+
+    if spec.kind in STORAGE_SPECS:
+      continue
+
+    if spec.kind in QUALIFIER_SPECS:
+      is_const = is_const or spec.kind == 'const'
+      continue
+
+    if spec.kind not in INT_SPECS and spec.kind != 'void':
+      return PoisonedTyp()
+
+    specs.append(spec.kind)
+
+  if specs == ['void']:
+    return VoidTyp(is_const=is_const)
+
+  if len(specs) == 0 or 'void' in specs:
+    raise CompilationException(f'invalid type specifiers "{" ".join(specs)}"', dspecs.loc)
+
+  return int_typ(specs, is_const, dspecs.loc)
+
+def pointer_typ(pointer: Node | None, typ: Typ) -> Typ:
+  '''
+  each `*` derives a pointer, the first one is the closest to the base type
+  '''
+
+  while pointer is not None:
+    quals = cast(MultipleNode, cast(SyntaxNode, pointer)['type_qualifier_list']).nodes
+    is_const = any(cast(Token, q).kind == 'const' for q in quals)
+
+    typ = PointerTyp(typ, is_const=is_const)
+    pointer = cast(SyntaxNode, pointer)['pointer']
+
+  return typ
+
+class DeclaratorResolver:
+  '''
+  resolves each declaration once, at predeclaration, and keeps the
+  result by node, so that the later lookups (while generating the
+  bodies or checking signatures) don't walk the declarator again;
+  array sizes are evaluated at compile time by `gen`
+  '''
+
+  def __init__(self, gen) -> None:
+    from gen import Gen
+
+    self.gen: Gen = gen
+    # by id of the node, the result holds the node
+    self.resolved: dict[int, ResolvedDeclaration] = {}
+
+  def declaration(self, node: SyntaxNode) -> ResolvedDeclaration:
+    '''
+    the name and type of a `Declaration`, a `FunctionDefinition`
+    or a `ParameterDeclaration`
+    '''
+
+    if (resolved := self.resolved.get(id(node))) is not None:
+      return resolved
+
+    typ = specifiers_typ(cast(MultipleNode, node['declaration_specifiers']))
+    is_parameter = node.syntax_name == 'ParameterDeclaration'
+
+    name, typ, pnames = self.declarator(node['declarator'], typ, is_parameter)
+
+    # parameters of function types are pointers
+    if is_parameter and isinstance(typ, FnTyp):
+      typ = PointerTyp(typ)
+
+    resolved = self.resolved[id(node)] = ResolvedDeclaration(node, name, typ, pnames)
+    return resolved
+
+  def declarator(
+    self,
+    node: Node | None,
+    typ: Typ,
+    is_parameter: bool = False
+  ) -> tuple[Token | None, Typ, list[Token | None]]:
+    '''
+    the declared name (`None` for abstract declarators), its type and,
+    when it is a function, the names of its parameters
+    '''
+
+    pnames: list[Token | None] = []
+
+    while isinstance(node, SyntaxNode):
+      match node.syntax_name:
+        case 'Declarator':
+          typ = pointer_typ(node['pointer'], typ)
+          node = node['direct_declarator']
+
+        case 'AbstractDeclarator':
+          typ = pointer_typ(node['pointer'], typ)
+          node = node['direct_abstract_declarator']
+
+        case 'ParameterListDeclarator':
+          typ, pnames = self.function_typ(node, typ)
+          node = node['declarator']
+
+        case 'EmptyParameterListAbstractDeclarator':
+          typ, pnames = self.function_typ(node, typ)
+          node = None
+
+        case 'ArrayDeclarator' | 'ArrayAbstractDeclarator':
+          if isinstance(typ, (FnTyp, VoidTyp)):
+            raise CompilationException(f'array of "{typ}"', node.loc)
+
+          inner = node['declarator']
+
+          # a parameter of array type is a pointer, its size may
+          # not even be constant (`int n, int a[n]`)
+          if is_parameter and not isinstance(inner, SyntaxNode):
+            typ = PointerTyp(typ)
+          else:
+            size = cast(CompoundNode, node['size_initializer'])
+            typ = ArrayTyp(typ, self.array_length(size, is_parameter))
+
+          node = inner
+
+        case _:
+          raise UnreachableError(node.syntax_name)
+
+    return cast(Token | None, node), typ, pnames
+
+  def function_typ(self, node: SyntaxNode, ret: Typ) -> tuple[FnTyp, list[Token | None]]:
+    if isinstance(ret, (FnTyp, ArrayTyp)):
+      raise CompilationException(f'function returning "{ret}"', node.loc)
+
+    if node.syntax_name == 'EmptyParameterListAbstractDeclarator':
+      return FnTyp(ret, [], False), []
+
+    parameters = cast(MultipleNode, node['parameter_list']).nodes
+    params: list[Typ] = []
+    pnames: list[Token | None] = []
+
+    for parameter in parameters:
+      resolved = self.declaration(cast(SyntaxNode, parameter))
+
+      # `(void)` is an empty parameter list
+      if isinstance(resolved.typ, VoidTyp) and resolved.name is None and len(parameters) == 1:
+        break
+
+      params.append(resolved.typ)
+      pnames.append(resolved.name)
+
+    return FnTyp(ret, params, node['ellipsis'] is not None), pnames
+
+  def array_length(self, size: CompoundNode, is_parameter: bool = False) -> int | None:
+    '''
+    `None` for `[]`, and for the variable sizes of the inner
+    arrays of parameters (`int n, int a[][n]`), which are
+    not known at compile time, as `[*]` (the size is not kept)
+    '''
+
+    if len(size.tokens) == 0:
+      return None
+
+    length = self.gen.evaluate(size)
+
+    if length is None and is_parameter:
+      return None
+
+    if length is None or not is_int_constant(length):
+      raise CompilationException('array size is not an integer constant', size.loc)
+
+    if cast(int, length.meta) < 0:
+      raise CompilationException('array size is negative', size.loc)
+
+    return cast(int, length.meta)
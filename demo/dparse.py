@@ -36,39 +36,63 @@ class DParse:
   body parsing is performed in the next step
   '''
 
-  def __init__(self, unit) -> None:
+  def __init__(self, unit, tokens: TokenBuffer | TokenWindow | None = None) -> None:
     from unit import TranslationUnit
     self.unit: TranslationUnit = unit
+    # when streaming, a window over the lexer instead of the whole buffer
+    self.tokens: TokenBuffer | TokenWindow = \
+      unit.tokens if tokens is None else tokens
     self.index: int = 0
     # i just assign it with a placeholder, because it will be always
     # overwritten
     self.current_dspecs: MultipleNode = MultipleNode(self.cur.loc)
 
+    # meta tags are recognized by their interned ids
+    self.builtin_t_id: int = unit.ids.intern('builtin_t')
+    self.meta_type_ids: frozenset[int] = frozenset(map(unit.ids.intern, META_TYPES))
+    self.meta_directive_ids: frozenset[int] = frozenset(map(unit.ids.intern, META_DIRECTIVES))
+
   @property
   def cur(self) -> Token:
     return self.tok(0)
 
+  @property
+  def cur_value_id(self) -> int | None:
+    '''
+    the interned id of the current token's value
+    (only for identifiers and strings)
+    '''
+
+    if not self.has_token():
+      return None
+
+    return self.tokens.value_id_at(self.index)
+
   def tok(self, offset: int) -> Token:
     if not self.has_token(offset):
-      return Token('eof', None, self.unit.tokens[-1].loc)
+      return Token('eof', None, self.tokens[-1].loc)
 
-    return self.unit.tokens[self.index + offset]
+    return self.tokens[self.index + offset]
 
   def has_token(self, offset: int = 0) -> bool:
-    return self.index + offset < len(self.unit.tokens)
+    return self.tokens.has(self.index + offset)
 
   def skip(self, count: int = 1):
     self.index += count
 
   def token(self, *kinds: str) -> Token | None:
-    tok: Token = self.cur
+    # comparing the kind column first, so that
+    # a view is only handed out when the token matches
+    if not self.has_token():
+      return None
 
-    for kind in kinds:
-      if kind == tok.kind:
-        self.skip()
-        return tok
+    if self.tokens.kind_at(self.index) not in kinds:
+      return None
 
-    return None
+    tok: Token = self.cur
+    self.skip()
+
+    return tok
 
   def identifier(self) -> Token | None:
     return self.token('id')
@@ -92,25 +116,15 @@ class DParse:
       )
 
     opener: Token = self.expect_token('{')
-    compound = CompoundNode(opener.loc)
-    nest_level: int = 0
-
-    while True:
-      if not self.has_token():
-        raise CompilationException('body not closed', opener.loc)
 
-      if self.cur.kind == '{':
-        nest_level += 1
-      elif self.cur.kind == '}':
-        if nest_level == 0:
-          break
+    # a single jump, brackets are paired by the token storage
+    if (closer := self.tokens.match_at(self.index - 1)) < 0:
+      raise CompilationException('body not closed', opener.loc)
 
-        nest_level -= 1
-
-      compound.tokens.append(self.cur)
-      self.skip()
+    compound = CompoundNode(opener.loc)
+    compound.tokens = self.tokens.slice(self.index, closer)
+    self.index = closer + 1
 
-    self.token('}')
     return compound
 
   def log(self, obj: object) -> None:
@@ -132,10 +146,10 @@ class DParse:
       return None
 
     if declarator.syntax_name == 'ParameterListDeclarator':
-      actual_decl = declarator.data['declarator']
+      actual_decl = declarator['declarator']
     elif (
       declarator.syntax_name == 'Declarator' and
-      isinstance(dd := declarator.data['direct_declarator'], SyntaxNode) and
+      isinstance(dd := declarator['direct_declarator'], SyntaxNode) and
       dd.syntax_name == 'ParameterListDeclarator'
     ):
       actual_decl = dd
@@ -147,7 +161,7 @@ class DParse:
     if (
       isinstance(actual_decl, SyntaxNode) and
       actual_decl.syntax_name == 'Declarator' and
-      actual_decl.data['pointer'] is not None
+      actual_decl['pointer'] is not None
     ):
       return None
 
@@ -161,14 +175,15 @@ class DParse:
     else:
       body = self.collect_compound_statement()
 
-    fndef = SyntaxNode(declarator.loc, 'FunctionDefinition', {
-      'declaration_specifiers': dspecs,
-      'declarator': declarator,
-      'body': body,
-    })
+    fndef = FunctionDefinition(
+      declarator.loc,
+      declaration_specifiers=dspecs,
+      declarator=declarator,
+      body=body,
+    )
 
     if allow_method_mods:
-      fndef.data['method_modifier'] = mmod
+      fndef['method_modifier'] = mmod
 
     return fndef
 
@@ -182,37 +197,29 @@ class DParse:
     allow_empty: bool = False
   ) -> CompoundNode:
     compound = CompoundNode(loc)
-    nest_levels: dict[str, int] = {
-      '(': 0, '[': 0, '{': 0
-    }
-
-    flip = lambda c: {
-      ')': '(', ']': '[', '}': '{'
-    }[c]
-
-    is_nested = lambda: \
-      nest_levels['('] > 0 or \
-      nest_levels['['] > 0 or \
-      nest_levels['{'] > 0
+    start: int = self.index
 
     while True:
       if not self.has_token():
         raise CompilationException('initializer not closed, did you forget a ";"?', loc)
 
-      if not is_nested() and self.cur.kind in terminator:
+      kind = self.tokens.kind_at(self.index)
+
+      if kind in terminator:
         break
 
-      if self.cur.kind in ['(', '[', '{']:
-        nest_levels[self.cur.kind] += 1
-      elif self.cur.kind in [')', ']', '}']:
-        flipped = flip(self.cur.kind)
+      # nested brackets are jumped over, so
+      # the terminator is only matched at the top level
+      if kind in OPENING_BRACKETS:
+        if (closer := self.tokens.match_at(self.index)) < 0:
+          raise CompilationException(f'"{kind}" is never closed', self.cur.loc)
 
-        if nest_levels[flipped] > 0:
-          nest_levels[flipped] -= 1
+        self.index = closer
 
-      compound.tokens.append(self.cur)
       self.skip()
 
+    compound.tokens = self.tokens.slice(start, self.index)
+
     if not allow_empty and len(compound.tokens) == 0:
       raise CompilationException(
         'initializer cannot be empty',
@@ -232,14 +239,15 @@ class DParse:
     if (eq := self.token('=')) is not None:
       first = self.collect_initializer(TERMINATOR, eq.loc)
 
-    first_decl = SyntaxNode(declarator.loc, 'Declaration', {
-      'declaration_specifiers': dspecs,
-      'declarator': declarator,
-      'initializer': first,
-    })
+    first_decl = Declaration(
+      declarator.loc,
+      declaration_specifiers=dspecs,
+      declarator=declarator,
+      initializer=first,
+    )
 
     if allow_bitfield:
-      first_decl.data['bitfield'] = bitfield
+      first_decl['bitfield'] = bitfield
 
     if self.token(';') is not None:
       return first_decl
@@ -257,11 +265,12 @@ class DParse:
       if (eq := self.token('=')) is not None:
         initializer = self.collect_initializer(TERMINATOR, eq.loc)
 
-      new_decl = SyntaxNode(declarator.loc, 'Declaration', {
-        'declaration_specifiers': dspecs,
-        'declarator': declarator,
-        'initializer': initializer,
-      })
+      new_decl = Declaration(
+        declarator.loc,
+        declaration_specifiers=dspecs,
+        declarator=declarator,
+        initializer=initializer,
+      )
 
       decls.nodes.append(new_decl)
 
@@ -311,7 +320,6 @@ class DParse:
     # otherwise let's check if the
     # dspecs contains an effective type
     # or just qualifiers, such as `volatile`, `const`, 'static' etc..
-    name: str = cast(str, self.cur.value)
     QUALS = CLASS_SPECS + FUNCTION_SPECS + TYPE_QUALS
 
     for t in self.current_dspecs.nodes:
@@ -363,6 +371,50 @@ class DParse:
   def identifier_or_meta_id(self) -> Token | None:
     return self.token('id', 'meta_id')
 
+  def translation_unit_into(
+    self,
+    root: MultipleNode,
+    on_declaration: Callable[[Node], None] | None = None,
+    reuse: Callable[[int], tuple[Node, int] | None] | None = None,
+    spans: list[tuple[int, int]] | None = None
+  ) -> None:
+    '''
+    the top level scope behaves the same as a
+    struct's or union's body, except that functions
+    cannot have method modifiers (such as `t f() const|static {}`);
+
+    this is not `@recoverable`, so between two top level
+    declarations there is no rewind point left, and the tokens
+    before the current one can be released (when streaming);
+
+    `reuse` may hand out an already parsed declaration starting at the
+    given index (and where it ends) instead of parsing it again, and
+    the tokens range of each declaration is appended to `spans`
+    (see `incremental_dparse`)
+    '''
+
+    while self.has_token():
+      start = self.index
+
+      if reuse is not None and (reused := reuse(start)) is not None:
+        edecl, self.index = reused
+      else:
+        edecl = self.external_declaration(False)
+
+      self.tokens.release(self.index)
+
+      # we may parse a standalone semicolon
+      if isinstance(edecl, PlaceholderNode):
+        continue
+
+      root.nodes.append(edecl)
+
+      if spans is not None:
+        spans.append((start, self.index))
+
+      if on_declaration is not None:
+        on_declaration(edecl)
+
   @recoverable
   def struct_or_union_declaration_list_into(
     self,
@@ -426,10 +478,11 @@ class DParse:
 
     initializer = self.collect_initializer([',', '}'], eq.loc)
 
-    return SyntaxNode(name.loc, 'EnumeratorWithValue', {
-      'name': name,
-      'initializer': initializer,
-    })
+    return EnumeratorWithValue(
+      name.loc,
+      name=name,
+      initializer=initializer,
+    )
 
   @recoverable
   def enumerator_list(self) -> MultipleNode | None:
@@ -449,7 +502,7 @@ class DParse:
 
   @recoverable
   def type_specifier(self) -> Node | None:
-    if self.cur.kind == 'meta_id' and self.cur.value == 'builtin_t':
+    if self.cur.kind == 'meta_id' and self.cur_value_id == self.builtin_t_id:
       tag = self.expect_token('meta_id')
       self.expect_token('(')
       name = str(self.expect_token('str').value)
@@ -457,7 +510,7 @@ class DParse:
 
       return TypeBuiltinNode(name, tag.loc)
 
-    if self.cur.kind == 'meta_id' and self.cur.value in META_TYPES:
+    if self.cur.kind == 'meta_id' and self.cur_value_id in self.meta_type_ids:
       return self.expect_token('meta_id')
 
     builtin = self.token(*TYPE_SPECS)
@@ -481,11 +534,12 @@ class DParse:
           self.cur.loc
         )
 
-      return SyntaxNode(spec_kw.loc, 'EnumSpecifier', {
-        'is_struct': is_enum_struct,
-        'name': tname,
-        'body': body,
-      })
+      return EnumSpecifier(
+        spec_kw.loc,
+        is_struct=is_enum_struct,
+        name=tname,
+        body=body,
+      )
 
     if (spec_kw := self.token('struct', 'union')) is not None:
       tname = self.identifier()
@@ -499,10 +553,11 @@ class DParse:
           self.cur.loc
         )
 
-      return SyntaxNode(spec_kw.loc, f'{spec_kw.kind.capitalize()}Specifier', {
-        'name': tname,
-        'body': body,
-      })
+      return SYNTAX_NODES[f'{spec_kw.kind.capitalize()}Specifier'](
+        spec_kw.loc,
+        name=tname,
+        body=body,
+      )
 
     if (tydef_name := self.typedef_name()) is not None:
       if (tmpl := self.template_arguments(tydef_name)) is not None:
@@ -582,10 +637,11 @@ class DParse:
     if (p := self.token('*')) is None:
       return None
 
-    return SyntaxNode(p.loc, 'Pointer', {
-      'type_qualifier_list': self.type_qualifier_list(),
-      'pointer': self.pointer()
-    })
+    return Pointer(
+      p.loc,
+      type_qualifier_list=self.type_qualifier_list(),
+      pointer=self.pointer()
+    )
 
   @recoverable
   def direct_abstract_declarator(self) -> Node | None:
@@ -595,7 +651,7 @@ class DParse:
       pass # just to keep lines cleaner, they are really messy here
     elif (opener := self.token('(')) is not None:
       if (dad := self.abstract_declarator(opener.loc)) is None:
-        dad = SyntaxNode(opener.loc, 'EmptyParameterListAbstractDeclarator', {})
+        dad = EmptyParameterListAbstractDeclarator(opener.loc)
 
       self.expect_token(')')
     else:
@@ -623,10 +679,11 @@ class DParse:
 
     dad = self.direct_abstract_declarator()
 
-    return SyntaxNode(loc, 'AbstractDeclarator', {
-      'pointer': pointer,
-      'direct_abstract_declarator': dad,
-    })
+    return AbstractDeclarator(
+      loc,
+      pointer=pointer,
+      direct_abstract_declarator=dad,
+    )
 
   @recoverable
   def parameter_declaration(self) -> Node | None:
@@ -638,10 +695,11 @@ class DParse:
 
     loc = declarator.loc if declarator is not None else dspecs.loc
 
-    return SyntaxNode(loc, 'ParameterDeclaration', {
-      'declaration_specifiers': dspecs,
-      'declarator': declarator,
-    })
+    return ParameterDeclaration(
+      loc,
+      declaration_specifiers=dspecs,
+      declarator=declarator,
+    )
 
   @recoverable
   def parameter_list(self) -> tuple[Node, Node | None] | None:
@@ -701,10 +759,11 @@ class DParse:
 
     self.expect_token(']')
 
-    return SyntaxNode(opener.loc, f'Array{midfix}Declarator', {
-      'declarator': dd,
-      'size_initializer': initializer
-    })
+    return SYNTAX_NODES[f'Array{midfix}Declarator'](
+      opener.loc,
+      declarator=dd,
+      size_initializer=initializer
+    )
 
   @recoverable
   def parameter_list_declarator(self, dd: Node | None) -> Node | None:
@@ -718,11 +777,12 @@ class DParse:
     else:
       return None
 
-    return SyntaxNode(opener.loc, 'ParameterListDeclarator', {
-      'declarator': dd,
-      'parameter_list': plist[0],
-      'ellipsis': plist[1]
-    })
+    return ParameterListDeclarator(
+      opener.loc,
+      declarator=dd,
+      parameter_list=plist[0],
+      ellipsis=plist[1]
+    )
 
   @recoverable
   def declarator(self) -> Node | None:
@@ -736,10 +796,11 @@ class DParse:
     if pointer is None:
       return direct_declarator
 
-    return SyntaxNode(direct_declarator.loc, 'Declarator', {
-      'pointer': pointer,
-      'direct_declarator': direct_declarator
-    })
+    return Declarator(
+      direct_declarator.loc,
+      pointer=pointer,
+      direct_declarator=direct_declarator
+    )
 
   def parse_use_feature(self, loc: Loc) -> UseFeatureDirective:
     d = UseFeatureDirective(loc)
@@ -871,7 +932,7 @@ class DParse:
     if \
       not is_inside_structunion and \
         self.cur.kind == 'meta_id' and \
-          self.cur.value in META_DIRECTIVES:
+          self.cur_value_id in self.meta_directive_ids:
       return self.parse_meta_directive()
 
     if self.token(';') is not None:
@@ -890,10 +951,8 @@ class DParse:
       return PoisonedNode(loc)
 
     if self.token(';') is not None:
-      return SyntaxNode(
-        dspecs.loc,
-        'EmptyDeclaration',
-        {'declaration_specifiers': dspecs}
+      return EmptyDeclaration(
+        dspecs.loc, declaration_specifiers=dspecs
       )
 
     declarator = self.expect_node(
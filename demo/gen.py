@@ -1,27 +1,20 @@
 from data import *
+from comptime import \
+  ComptimeVM, LIT_INT, UNKNOWN, fold_unary, fold_binary, integer_literal, is_int_constant
+from declarators import DeclaratorResolver
 from typing import cast
 
-def get_declaration_name(node: Node | None) -> Token | None:
-  if isinstance(node, Token) and node.kind == 'id':
-    return node
-
-  if not isinstance(node, SyntaxNode):
-    return None
-
-  match node.syntax_name:
-    case 'Declarator':
-      return get_declaration_name(node['direct_declarator'])
+def is_exported(node: SyntaxNode) -> bool:
+  '''
+  whether a function definition is visible to the other units (it is
+  neither `static` nor `inline`, such as the helpers of the headers)
+  '''
 
-    case                       \
-      'ArrayDeclarator'      | \
-      'Declaration'          | \
-      'ParameterDeclaration' | \
-      'FunctionDefinition'   | \
-      'ParameterListDeclarator':
-        return get_declaration_name(node['declarator'])
+  dspecs = cast(MultipleNode, node['declaration_specifiers']).nodes
 
-    case _:
-      return None
+  return not any(
+    isinstance(s, Token) and s.kind in ('static', 'inline') for s in dspecs
+  )
 
 class Gen:
   '''
@@ -38,6 +31,24 @@ class Gen:
     self.unit: TranslationUnit = unit
     self.lparsers: list['LParse'] = []
 
+    # the `@test` directives, and their generated bodies
+    self.test_nodes: list[TestDirective] = []
+    self.tests: list[LParse] = []
+
+    # the function bodies `gen_from_roots` did not generate
+    self.skipped: int = 0
+
+    # the names whose symbols are being processed, see `generate`
+    self.generating: set[int] = set()
+    self.vm: ComptimeVM = ComptimeVM(
+      unit.ids, self.comptime_body, generated=self.generated_body
+    )
+    # the names and types of the declarations, by node
+    self.resolver: DeclaratorResolver = DeclaratorResolver(self)
+
+    # meta tags are recognized by their interned ids, as dparse does
+    self.meta_id: int = unit.ids.intern('meta')
+
   # current local parser
   @property
   def lparser(self) -> 'LParse':
@@ -52,29 +63,75 @@ class Gen:
     return self.unit.tab
 
   def predeclare_top_level(self, node: Node) -> None:
-    if node.is_empty_decl():
-      raise NotImplementedError()
+    if isinstance(node, TestDirective):
+      self.test_nodes.append(node)
+      return
 
     assert isinstance(node, SyntaxNode)
+    self.predeclare_enumerators(cast(MultipleNode, node['declaration_specifiers']))
+
+    # TODO: struct and union declarations
+    #       don't declare any symbol yet
+    if node.is_empty_decl():
+      return
 
     key = {
       'Declaration': 'initializer',
       'FunctionDefinition': 'body'
     }[node.syntax_name]
     
-    name = cast(Token, get_declaration_name(node))
+    name = cast(Token, self.resolver.declaration(node).name)
     is_weak = node[key] is None
 
     self.tab.declare(
-      cast(str, name.value),
+      cast(int, name.value_id),
       node,
       is_weak,
       name.loc
     )
 
+  def predeclare_enumerators(self, dspecs: MultipleNode) -> None:
+    '''
+    the enumerators of the enums defined in `dspecs` are `int` constants,
+    each one is the previous one plus one when it has no value (the
+    first one is 0), so they are declared with their value computed
+
+    TODO: the enums defined inside structs, parameters and bodies
+    '''
+
+    from comptime import INT, fits
+
+    for spec in dspecs.nodes:
+      if not isinstance(spec, SyntaxNode) or spec.syntax_name != 'EnumSpecifier' or spec['body'] is None:
+        continue
+
+      value: int = 0
+
+      for enumerator in cast(MultipleNode, spec['body']).nodes:
+        if isinstance(enumerator, SyntaxNode):
+          initializer = cast(CompoundNode, enumerator['initializer'])
+          v = self.evaluate(initializer)
+
+          if v is None or not is_int_constant(v):
+            raise CompilationException('enumerator value is not an integer constant', initializer.loc)
+
+          value = cast(int, v.meta)
+          enumerator = enumerator['name']
+
+        name = cast(Token, enumerator)
+
+        if not fits(value, INT):
+          raise CompilationException(f'enumerator value {value} is out of range of "int"', name.loc)
+
+        self.tab.bind(
+          cast(int, name.value_id),
+          EnumeratorSymbol(cast(str, name.value), name.loc, Val(INT, value, name.loc)),
+          name.loc
+        )
+
+        value += 1
+
   def process_top_level(self, node: Node, is_weak: bool) -> Symbol:
-    # typ = self.get_declaration_typ(node)
-    
     assert isinstance(node, SyntaxNode)
     match node.syntax_name:
       case 'FunctionDefinition':
@@ -85,34 +142,160 @@ class Gen:
         if is_weak:
           return ExternFnSymbol(node)
 
-        self.lparsers.append(LParse(
-          self,
-          # cast(FnTyp, typ),
-          node
-        ))
+        self.lparsers.append(LParse(self, node))
 
         self.lparser.process()
-
-        fn = self.lparsers.pop()
-        decl_name_token = cast(Token, get_declaration_name(node))
-        name = cast(str, decl_name_token.value)
-        return FnSymbol(name, decl_name_token.loc, fn)
+        return self.function_symbol(node, self.lparsers.pop())
 
       case _:
         raise UnreachableError()
 
+  def function_symbol(self, node: SyntaxNode, fn: 'LParse') -> FnSymbol:
+    decl_name_token = cast(Token, self.resolver.declaration(node).name)
+    name = cast(str, decl_name_token.value)
+
+    return FnSymbol(name, decl_name_token.loc, fn)
+
+  def generate(self, name: int, loc: Loc) -> Symbol:
+    '''
+    the symbol of the predeclared `name`, processed now
+    when it was not yet (a comptime call may need it earlier)
+    '''
+
+    if isinstance(value := self.tab.members[name], Symbol):
+      return value
+
+    if name in self.generating:
+      raise CompilationException(
+        f'"{self.tab.ids[name]}" is used at compile time while it is generated', loc
+      )
+
+    self.generating.add(name)
+
+    try:
+      sym, is_weak = value
+      self.tab.members[name] = symbol = self.process_top_level(cast(Node, sym), is_weak)
+    finally:
+      self.generating.discard(name)
+
+    return symbol
+
+  def comptime_body(self, name: int, loc: Loc) -> 'CBody | None':
+    '''
+    the body of the function `name`, for `ComptimeVM`, `None` when
+    it is not a function definition (only those are generated)
+    '''
+
+    if name not in self.tab.members or not self.has_body(name):
+      return None
+
+    if not isinstance(symbol := self.generate(name, loc), FnSymbol):
+      return None
+
+    return symbol.fn.cbody
+
+  def generated_body(self, name: int) -> 'CBody | object | None':
+    '''
+    the same as `comptime_body`, but it never generates: `UNKNOWN`
+    when the body is not generated yet (or is being generated)
+    '''
+
+    if name not in self.tab.members or not self.has_body(name):
+      return None
+
+    if not isinstance(symbol := self.tab.members[name], FnSymbol):
+      return UNKNOWN
+
+    return symbol.fn.cbody
+
+  def evaluate(self, compound: CompoundNode) -> Val | None:
+    '''
+    the value of a constant expression (such as an array size or an
+    enumerator's one), computed at compile time; `None` when it is not
+    one, because it refers to names which are not functions
+    '''
+
+    return LParse(self, None).pg_constant(compound)
+
+  def has_body(self, name: int) -> bool:
+    '''
+    whether `name` is a function definition (with a body)
+    '''
+
+    if isinstance(value := self.tab.members[name], FnSymbol):
+      return True
+
+    if isinstance(value, Symbol):
+      return False
+
+    node, is_weak = value
+    return not is_weak and cast(SyntaxNode, node).syntax_name == 'FunctionDefinition'
+
+  def gen_test(self, node: TestDirective) -> 'LParse':
+    l = LParse(self, node)
+    l.process()
+    self.tests.append(l)
+
+    return l
+
+  def default_roots(self) -> list[int]:
+    '''
+    `main` and the exported function definitions
+    '''
+
+    return [
+      name for name, value in self.tab.members.items()
+        if self.has_body(name) and is_exported(cast(SyntaxNode, cast(tuple, value)[0]))
+    ]
+
+  def gen_from_roots(self, roots: list[int] | None = None) -> None:
+    '''
+    the same as `gen_whole_unit`, but only the function bodies reachable
+    from `roots` (names, by default `default_roots`) and from the tests
+    are generated, through a worklist of the names each generated body
+    refers to; the others are only predeclared, `skipped` counts them
+    '''
+
+    for top_level in self.root.nodes:
+      self.predeclare_top_level(top_level)
+
+    if roots is None:
+      roots = self.default_roots()
+
+    # in source order
+    worklist: list[int] = roots[::-1]
+    queued: set[int] = set(roots)
+
+    def enqueue(body: CBody) -> None:
+      for name in body.referenced_names():
+        if name not in queued and name in self.tab.members:
+          queued.add(name)
+          worklist.append(name)
+
+    for test in self.test_nodes:
+      enqueue(self.gen_test(test).cbody)
+
+    while len(worklist) > 0:
+      # prototypes and variables are only predeclared
+      if not self.has_body(name := worklist.pop()):
+        continue
+
+      enqueue(cast(FnSymbol, self.generate(name, self.root.loc)).fn.cbody)
+
+    self.skipped = sum(
+      not isinstance(value, Symbol) and self.has_body(name)
+        for name, value in self.tab.members.items()
+    )
+
   def gen_whole_unit(self) -> None:
     for top_level in self.root.nodes:
       self.predeclare_top_level(top_level)
 
-    for name, value in self.tab.members.items():
-      assert not isinstance(value, Symbol)
-      sym, is_weak = value
+    for test in self.test_nodes:
+      self.gen_test(test)
 
-      self.tab.members[name] = self.process_top_level(
-        cast(Node, sym),
-        is_weak
-      )
+    for name in self.tab.members:
+      self.generate(name, self.root.loc)
 
     # checking that all weak declarations
     # match the signature with the complete ones
@@ -125,7 +308,7 @@ class Gen:
       assert isinstance(complete_decl, Symbol)
 
       for weak_decl in weak_decls:
-        weak_decl_typ = self.get_declaration_typ(weak_decl)
+        weak_decl_typ = self.resolver.declaration(weak_decl).typ
 
         if complete_decl.typ != weak_decl_typ:
           self.unit.report(
@@ -134,33 +317,405 @@ class Gen:
           )
     '''
 
+ASSIGNMENT_OPERATORS = (
+  '=', '*=', '/=',
+  '%=', '+=', '-=',
+  '<<=', '>>=', '&=',
+  '^=', '|=',
+)
+
+# the opcodes of `CBody`, what their operand is:
+# * `CONST`: an index into the constant pool
+# * `LOCAL`, `LOCAL_REF`: the slot of a local
+# * `GLOBAL`, `GLOBAL_REF`: the id of the name in the unit's `ids`
+# * `MEMBER`, `ARROW` and their references: the id of the member name
+# * `CALL`: the arguments count
+# * `UNARY`, `BINARY`, `ASSIGN`, `PRE`, `POST`: an operator code
+# * jumps: the index of the target instruction
+# * the others have none (0)
+OPCODES: tuple[str, ...] = (
+  'const', 'local', 'local_ref', 'global', 'global_ref',
+  'index', 'index_ref', 'member', 'member_ref', 'arrow', 'arrow_ref',
+  'deref', 'deref_ref', 'call',
+  'unary', 'binary', 'assign', 'pre', 'post', 'pop',
+  'jump', 'jump_if_false', 'jump_if_true', 'ret', 'ret_void',
+)
+
+CONST, LOCAL, LOCAL_REF, GLOBAL, GLOBAL_REF, \
+  INDEX, INDEX_REF, MEMBER, MEMBER_REF, ARROW, ARROW_REF, \
+  DEREF, DEREF_REF, CALL, \
+  UNARY, BINARY, ASSIGN, PRE, POST, POP, \
+  JUMP, JUMP_IF_FALSE, JUMP_IF_TRUE, RET, RET_VOID = range(len(OPCODES))
+
+JUMPS = (JUMP, JUMP_IF_FALSE, JUMP_IF_TRUE)
+
+# the instructions that read or write memory which is not
+# a local, the bodies using them are not pure
+IMPURE_OPS: frozenset[int] = frozenset((
+  GLOBAL_REF, INDEX, INDEX_REF, MEMBER, MEMBER_REF,
+  ARROW, ARROW_REF, DEREF, DEREF_REF,
+))
+
+# the operand of a jump not patched yet
+UNPATCHED: int = -1
+
+# loads that have a reference form, the one
+# used when the loaded value must be an lvalue
+LVALUE_FORMS: dict[int, int] = {
+  LOCAL: LOCAL_REF,
+  GLOBAL: GLOBAL_REF,
+  INDEX: INDEX_REF,
+  MEMBER: MEMBER_REF,
+  ARROW: ARROW_REF,
+  DEREF: DEREF_REF,
+}
+
+# unary and binary ones share the same codes, the opcode tells them apart
+OPERATORS: tuple[str, ...] = (
+  '+', '-', '*', '/', '%', '<<', '>>', '&', '|', '^',
+  '==', '!=', '<', '>', '<=', '>=', '~', '!', '++', '--',
+  *ASSIGNMENT_OPERATORS,
+)
+
+OPERATOR_CODES: dict[str, int] = {op: i for i, op in enumerate(OPERATORS)}
+
+def rebuild_cbody(
+  ids: InternPool,
+  c: str,
+  ops: array,
+  args: array,
+  locs: list[Loc] | tuple[SourceMap, array],
+  consts: list[Val],
+  local_names: list[int],
+  local_typs: list[Typ | None],
+  params: int,
+  ret_typ: Typ | None,
+  locals: dict[int, int]
+) -> 'CBody':
+  '''
+  the inverse of `CBody.__reduce__`
+  '''
+
+  body = CBody(ids)
+  body.c, body.ops, body.args = c, ops, args
+  body.consts, body.local_names, body.local_typs = consts, local_names, local_typs
+  body.params, body.ret_typ = params, ret_typ
+
+  if isinstance(locs, tuple):
+    source_map, offsets = locs
+    locs = [SourceLoc(source_map, offset) for offset in offsets]
+
+  body.locs = locs
+  body.const_indices = {
+    (v.typ, type(v.meta), v.meta): i for i, v in enumerate(consts)
+  }
+  # only the outermost scope is still open
+  body.locals.bindings = locals
+  body.locals.depths = dict.fromkeys(locals, 0)
+
+  return body
+
 class CBody:
-  def __init__(self) -> None:
+  '''
+  the stack based bytecode of a function body: operands are pushed
+  and each operator pops its own;
+
+  instructions are stored as parallel `array` columns (opcode and
+  operand), values are in the constant pool `consts` and names are
+  resolved while emitting, locals to their slot and the others to
+  their id; locations are only read for errors, they stay objects
+
+  operators whose operands are all known are computed at compile
+  time (see `comptime.fold_binary`), and only their result is loaded
+  '''
+
+  def __init__(self, ids: InternPool) -> None:
+    self.ids: InternPool = ids
+
     self.c: str = ''
+    # the values of the last instructions, when they are all
+    # constant loads, the operands that can be folded
     self.vstack: list[Val] = []
-    self.locals: dict[str, Typ] = []
-  
+    # the instructions before it are never made references (see
+    # `as_lvalue`), they may be the last ones of a conditional's
+    # branch, whose value is not an lvalue
+    self.barrier: int = 0
+
+    self.ops: array[int] = array('B')
+    self.args: array[int] = array('l')
+    self.locs: list[Loc] = []
+
+    self.consts: list[Val] = []
+    # typs are canonical, so they are keyed by identity
+    self.const_indices: dict[tuple[Typ, type, object], int] = {}
+
+    # name id -> slot in the open scopes, and the name and
+    # declared type of each slot (`None` when it is not known)
+    self.locals: Scopes = Scopes(ids, 'local name')
+    self.local_names: list[int] = []
+    self.local_typs: list[Typ | None] = []
+    # the first slots
+    self.params: int = 0
+    # the declared return type, `None` when it is not a function
+    self.ret_typ: Typ | None = None
+
+  def __len__(self) -> int:
+    return len(self.ops)
+
+  # bodies are sent between processes (see `parallel_gen`) as a tuple
+  # of their columns, the indexes are rebuilt and source locations are
+  # sent as an array of offsets, instead of an object each; the pickler
+  # visits each object, so fewer objects make it faster
+  def __reduce__(self) -> tuple[Callable[..., 'CBody'], tuple]:
+    locs: object = self.locs
+
+    if len(self.locs) > 0 and all(type(loc) is SourceLoc for loc in self.locs):
+      source_map = cast(SourceLoc, self.locs[0]).source_map
+
+      if all(cast(SourceLoc, loc).source_map is source_map for loc in self.locs):
+        locs = (source_map, array('l', [cast(SourceLoc, loc).offset for loc in self.locs]))
+
+    return rebuild_cbody, (
+      self.ids, self.c, self.ops, self.args, locs,
+      self.consts, self.local_names, self.local_typs,
+      self.params, self.ret_typ, self.locals.bindings
+    )
+
+  @property
+  def cursor(self) -> int:
+    '''
+    the index of the next instruction, the target of jumps
+    '''
+
+    return len(self.ops)
+
+  def emit(self, op: int, arg: int, loc: Loc) -> int:
+    if op != CONST:
+      self.vstack.clear()
+
+    self.ops.append(op)
+    self.args.append(arg)
+    self.locs.append(loc)
+
+    return len(self.ops) - 1
+
+  def const(self, v: Val) -> int:
+    key = (v.typ, type(v.meta), v.meta)
+
+    if (index := self.const_indices.get(key)) is not None:
+      return index
+
+    index = len(self.consts)
+    self.consts.append(v)
+    self.const_indices[key] = index
+
+    return index
+
+  def declare_local(self, name: int, loc: Loc, typ: Typ | None = None) -> int:
+    slot = len(self.local_names)
+    self.locals.bind(name, slot, loc)
+    self.local_names.append(name)
+    self.local_typs.append(typ)
+
+    return slot
+
   def load(self, v: Val) -> None:
+    self.emit(CONST, self.const(v), cast(Loc, v.loc))
     self.vstack.append(v)
-  
-  def load_name(self, name: str) -> None:
-    pass
 
-# TODO: execute at comptime certain operations
+  def drop(self, count: int) -> None:
+    '''
+    removes the last `count` instructions, constant loads
+    '''
+
+    del self.ops[-count:]
+    del self.args[-count:]
+    del self.locs[-count:]
+    del self.vstack[-count:]
+    self.barrier = min(self.barrier, self.cursor)
+
+  def truncate(self, cursor: int, vstack: list[Val]) -> None:
+    '''
+    removes the instructions from `cursor` on,
+    `vstack` is the one there was at that point
+    '''
+
+    del self.ops[cursor:]
+    del self.args[cursor:]
+    del self.locs[cursor:]
+    self.vstack = vstack
+    self.barrier = min(self.barrier, cursor)
+
+  def constant_condition(self) -> bool | None:
+    '''
+    the truth of the last value, when it is a constant
+    '''
+
+    if len(self.vstack) == 0 or not is_int_constant(self.vstack[-1]):
+      return None
+
+    return self.vstack[-1].meta != 0
+
+  def load_name(self, name: int, loc: Loc) -> None:
+    if (slot := self.locals.get(name)) is not None:
+      self.emit(LOCAL, slot, loc)
+    else:
+      self.emit(GLOBAL, name, loc)
+
+  def operator(self, op: int, operator: str, loc: Loc) -> None:
+    vstack = self.vstack
+
+    if op == BINARY and len(vstack) >= 2:
+      if (v := fold_binary(operator, vstack[-2], vstack[-1], loc)) is not None:
+        self.drop(2)
+        self.load(v)
+        return
+
+    if op == UNARY and len(vstack) >= 1:
+      if (v := fold_unary(operator, vstack[-1], loc)) is not None:
+        self.drop(1)
+        self.load(v)
+        return
+
+    self.emit(op, OPERATOR_CODES[operator], loc)
+
+  def as_lvalue(self, loc: Loc, position: int = -1) -> None:
+    '''
+    turns the load at `position` (by default the last instruction)
+    into its reference form, a struct member also needs its base to be
+    one, while the other references are made of plain values; loads
+    before `barrier` are the values of conditionals, not lvalues
+    '''
+
+    if \
+      len(self.ops) + position < self.barrier or \
+        (ref := LVALUE_FORMS.get(self.ops[position])) is None:
+      raise CompilationException('expression is not assignable', loc)
+
+    if self.ops[position] == MEMBER:
+      self.as_lvalue(loc, position - 1)
+
+    self.ops[position] = ref
+
+  def jump(self, op: int, loc: Loc) -> int:
+    '''
+    returns the jump's index, for `patch`
+    '''
+
+    return self.emit(op, UNPATCHED, loc)
+
+  def patch(self, jump: int) -> None:
+    '''
+    the jump at `jump` goes to the next instruction
+    '''
+
+    self.args[jump] = self.cursor
+
+    # the next instruction may be reached with other values
+    self.vstack.clear()
+    self.barrier = self.cursor
+
+  def ret(self, loc: Loc) -> None:
+    self.emit(RET, 0, loc)
+
+  def ret_void(self, loc: Loc) -> None:
+    self.emit(RET_VOID, 0, loc)
+
+  def operand_repr(self, op: int, arg: int) -> str | None:
+    if op == CONST:
+      return repr(self.consts[arg])
+
+    if op == LOCAL or op == LOCAL_REF:
+      return f'{arg} ({self.ids[self.local_names[arg]]})'
+
+    if op in (GLOBAL, GLOBAL_REF, MEMBER, MEMBER_REF, ARROW, ARROW_REF):
+      return repr(self.ids[arg])
+
+    if op in (UNARY, BINARY, ASSIGN, PRE, POST):
+      return repr(OPERATORS[arg])
+
+    if op in JUMPS:
+      return f'-> {arg}'
+
+    if op == CALL:
+      return str(arg)
+
+    return None
+
+  def referenced_names(self) -> list[int]:
+    '''
+    the ids of the globals the code refers to, in order
+    '''
+
+    return list(dict.fromkeys(
+      arg for op, arg in zip(self.ops, self.args) if op == GLOBAL or op == GLOBAL_REF
+    ))
+
+  def disassemble(self) -> list[str]:
+    '''
+    one line per instruction: its index, opcode and operand
+    '''
+
+    lines: list[str] = []
+
+    for i, (op, arg) in enumerate(zip(self.ops, self.args)):
+      line = f'{i}: {OPCODES[op]}'
+
+      if (operand := self.operand_repr(op, arg)) is not None:
+        line += f' {operand}'
+
+      lines.append(line)
+
+    return lines
+
+  def __repr__(self) -> str:
+    return f'CBody{indented_repr(self.disassemble(), str, ("[", "]"))}'
+
+# the binary operators from the loosest to the tightest, the same
+# levels as the c99 grammar; the flag tells whether they are right
+# associative (the conditional operator is here as well, since
+# it starts after its condition the same way)
+PRECEDENCE_LEVELS: list[tuple[tuple[str, ...], bool]] = [
+  (ASSIGNMENT_OPERATORS, True),
+  (('?',), True),
+  (('||',), False),
+  (('&&',), False),
+  (('|',), False),
+  (('^',), False),
+  (('&',), False),
+  (('==', '!='), False),
+  (('<', '>', '<=', '>='), False),
+  (('<<', '>>'), False),
+  (('+', '-'), False),
+  (('*', '/', '%'), False),
+]
+
+# operator -> (precedence, is right associative), prefix
+# and postfix operators bind tighter than all of them
+BINARY_OPERATORS: dict[str, tuple[int, bool]] = {
+  op: (precedence, is_right_assoc)
+    for precedence, (ops, is_right_assoc) in enumerate(PRECEDENCE_LEVELS, start=1)
+      for op in ops
+}
+
+ASSIGNMENT_PRECEDENCE: int = BINARY_OPERATORS['='][0]
+CONDITIONAL_PRECEDENCE: int = BINARY_OPERATORS['?'][0]
+
 class LParse:
   '''
   content parser also from:
   https://github.com/katef/kgt/blob/main/examples/c99-grammar.iso-ebnf
   '''
 
-  def __init__(self, gen: Gen, node: SyntaxNode) -> None:
+  def __init__(self, gen: Gen, node: SyntaxNode | TestDirective | None) -> None:
     self.gen: Gen = gen
     # self.typ: FnTyp = typ
-    self.node: SyntaxNode = node
+    # `None` for constant expressions, see `pg_constant`
+    self.node: SyntaxNode | TestDirective | None = node
     
-    self.tokens: list[Token]
+    self.tokens: list[Token] | TokenRange
     self.index: int = 0
-    self.cbody: CBody = CBody()
+    self.cbody: CBody = CBody(gen.unit.ids)
 
   @property
   def unit(self): # -> TranslationUnit:
@@ -187,12 +742,12 @@ class LParse:
     return self.index + offset < len(self.tokens)
 
   def token(self, *kinds: str) -> bool:
-    for kind in kinds:
-      if kind == self.cur.kind:
-        self.skip()
-        return True
+    # a view is handed out for each read of `cur`, so only once
+    if self.cur.kind not in kinds:
+      return False
 
-    return False
+    self.skip()
+    return True
 
   def expect_token(self, kind: str) -> Token:
     token = self.cur
@@ -218,9 +773,44 @@ class LParse:
       op = self.bck
 
       match op.kind:
+        case '[':
+          self.pg_expression(is_stmt=True)
+          self.expect_token(']')
+          self.cbody.emit(INDEX, 0, op.loc)
+
+        case '(':
+          self.cbody.emit(CALL, self.pg_arguments(), op.loc)
+
+        case '.' | '->':
+          name = self.expect_token('id')
+          self.cbody.emit(
+            MEMBER if op.kind == '.' else ARROW, cast(int, name.value_id), name.loc
+          )
+
+        case '++' | '--':
+          self.cbody.as_lvalue(op.loc)
+          self.cbody.operator(POST, op.kind, op.loc)
+
         case _:
-          raise NotImplementedError()
-          # raise UnreachableError()
+          raise UnreachableError()
+
+  def pg_arguments(self) -> int:
+    '''
+    the arguments of a call, after its `(`, returns their count
+    '''
+
+    if self.token(')'):
+      return 0
+
+    count: int = 1
+    self.pg_assignment_expression()
+
+    while self.token(','):
+      self.pg_assignment_expression()
+      count += 1
+
+    self.expect_token(')')
+    return count
 
   @recoverable
   def typename(self) -> bool:
@@ -242,13 +832,28 @@ class LParse:
 
   def pg_unary_expression(self) -> None:
     if self.token('++', '--'):
-      # TODO: gen code for these operators
+      op = self.bck
+
       self.pg_unary_expression()
+      self.cbody.as_lvalue(op.loc)
+      self.cbody.operator(PRE, op.kind, op.loc)
       return
 
     if self.unary_operators():
       op = self.bck
-      raise NotImplementedError()
+      self.pg_cast_expression()
+
+      match op.kind:
+        # the reference is the address
+        case '&':
+          self.cbody.as_lvalue(op.loc)
+
+        case '*':
+          self.cbody.emit(DEREF, 0, op.loc)
+
+        case _:
+          self.cbody.operator(UNARY, op.kind, op.loc)
+
       return
 
     # TODO: sizeof expression | (sizeof | _Alignof)(type-name)
@@ -257,7 +862,7 @@ class LParse:
 
   def pg_primary_expression(self) -> None:
     # TODO: implement `__func__` and generic-selection here
-    if not self.token('num', 'id', 'str', '('):
+    if not self.token('num', 'id', 'str', '(', 'meta_id'):
       raise CompilationException(
         'expected primary expression', self.cur.loc
       )
@@ -266,98 +871,208 @@ class LParse:
 
     match p.kind:
       case 'num':
-        constant = cast(int, self.bck.value)
+        # the lexer keeps the spelling, radix and suffix give the type
+        self.cbody.load(integer_literal(cast(str, p.value), p.loc))
+
+      case 'id':
+        self.pg_name(p)
+
+      case 'str':
         self.cbody.load(Val(
-          LitIntTyp(),
-          constant,
+          PointerTyp(IntTyp('char', True)),
+          p.value,
           p.loc
         ))
 
-      case 'id':
-        self.cbody.load_name(cast(str, p.value))
-
       case '(':
-        self.pg_expression()
+        self.pg_expression(is_stmt=True)
         self.expect_token(')')
 
+      case 'meta_id' if p.value_id == self.gen.meta_id:
+        self.pg_meta(p.loc)
+
       case _:
-        raise UnreachableError()      
+        raise CompilationException(
+          'expected primary expression', p.loc
+        )
 
-  def assignment_operators(self) -> bool:
-    return self.token(
-      '=', '*=', '/=',
-      '%=', '+=', '-=',
-      '<<=', '>>=', '&=',
-      '^=', '|=',
-    )
+  def pg_name(self, name: Token) -> None:
+    '''
+    enumerators are loaded as constants (unless a local
+    shadows them), so they are folded as literals are
+    '''
 
-  def pg_binary_expression(
-    self,
-    ops: tuple[str, ...],
-    parse_fn: Callable[[], None]
-  ) -> None:
-    parse_fn()
+    name_id = cast(int, name.value_id)
 
-    while self.token(*ops):
-      op = self.bck
+    if \
+      self.cbody.locals.get(name_id) is None and \
+        isinstance(symbol := self.gen.tab.members.get(name_id), EnumeratorSymbol):
+      self.cbody.load(Val(symbol.val.typ, symbol.val.meta, name.loc))
+      return
 
-      parse_fn()
-      self.cbody(op.kind, op.loc)
+    self.cbody.load_name(name_id, name.loc)
 
-  def pg_conditional_expression(self) -> None:
-    # TODO: implement logical operators
-    #       in a way that they are actually "logical"
+  def pg_meta(self, loc: Loc) -> None:
+    '''
+    `@meta(expression)`, after `@meta`: the expression
+    is executed at compile time, only its value is loaded
+    '''
 
-    multiplicative = (
-      ('*', '/', '%'), self.pg_cast_expression
-    )
+    cbody = self.cbody
+    start, vstack = cbody.cursor, cbody.vstack.copy()
 
-    additive = (
-      ('+', '-'), lambda: self.pg_binary_expression(*multiplicative)
-    )
+    self.expect_token('(')
+    self.pg_expression(is_stmt=True)
+    self.expect_token(')')
 
-    shift = (
-      ('<<', '>>'), lambda: self.pg_binary_expression(*additive)
-    )
+    v = self.gen.vm.evaluate(cbody, start, loc)
 
-    relational = (
-      ('<', '>', '<=', '>='), lambda: self.pg_binary_expression(*shift)
-    )
+    cbody.truncate(start, vstack)
+    cbody.load(Val(v.typ, v.meta, loc))
 
-    equality = (
-      ('==', '!='), lambda: self.pg_binary_expression(*relational)
-    )
+  def pg_binary_expression(self, min_precedence: int) -> None:
+    '''
+    precedence climbing over `BINARY_OPERATORS`: after its left operand,
+    each operator binding at least as tight as `min_precedence` parses
+    its right operand with its own precedence (one more, when left
+    associative), so the recursion only goes as deep as the operators
+    actually found, instead of through each level of the grammar
+    '''
 
-    and_ = (
-      ('&',), lambda: self.pg_binary_expression(*equality)
-    )
+    self.pg_cast_expression()
 
-    xor = (
-      ('^',), lambda: self.pg_binary_expression(*and_)
-    )
+    while (entry := BINARY_OPERATORS.get(self.cur.kind)) is not None:
+      precedence, is_right_assoc = entry
 
-    or_ = (
-      ('|',), lambda: self.pg_binary_expression(*xor)
-    )
+      if precedence < min_precedence:
+        return
 
-    # TODO: while self.token('?')
-    
-    # the top of the chain
-    self.pg_binary_expression(*or_)
+      op = self.cur
+      self.skip()
 
-  def pg_assignment_expression(self) -> None:
-    self.pg_conditional_expression()
+      next_precedence = precedence if is_right_assoc else precedence + 1
 
-    if not self.assignment_operators():
+      match op.kind:
+        case '?':
+          self.pg_conditional(op.loc)
+
+        case '&&' | '||':
+          self.pg_logical(op, next_precedence)
+
+        case kind if kind in ASSIGNMENT_OPERATORS:
+          # the left operand is the last thing emitted
+          self.cbody.as_lvalue(op.loc)
+          self.pg_binary_expression(next_precedence)
+          self.cbody.operator(ASSIGN, op.kind, op.loc)
+
+        case _:
+          self.pg_binary_expression(next_precedence)
+          self.cbody.operator(BINARY, op.kind, op.loc)
+
+  def pg_conditional(self, loc: Loc) -> None:
+    '''
+    `c ? a : b`, after the `?`
+    '''
+
+    if (condition := self.cbody.constant_condition()) is not None:
+      self.pg_constant_conditional(condition)
       return
 
-    raise NotImplementedError()
+    jumpi = self.cbody.jump(JUMP_IF_FALSE, loc)
+
+    self.pg_expression(is_stmt=True)
+    self.expect_token(':')
+
+    quiti = self.cbody.jump(JUMP, loc)
+    self.cbody.patch(jumpi)
+
+    self.pg_binary_expression(CONDITIONAL_PRECEDENCE)
+    self.cbody.patch(quiti)
+
+  def pg_constant_conditional(self, condition: bool) -> None:
+    '''
+    `c ? a : b` when `c` is known, only the chosen branch is kept
+    '''
+
+    cbody = self.cbody
+    cbody.drop(1)
+    start, start_vstack = cbody.cursor, cbody.vstack.copy()
+
+    self.pg_expression(is_stmt=True)
+    self.expect_token(':')
+
+    if not condition:
+      cbody.truncate(start, start_vstack)
+
+    middle, middle_vstack = cbody.cursor, cbody.vstack.copy()
+    self.pg_binary_expression(CONDITIONAL_PRECEDENCE)
+
+    if condition:
+      cbody.truncate(middle, middle_vstack)
+
+    # the kept branch is not an lvalue either
+    cbody.barrier = cbody.cursor
+
+  def pg_logical(self, op: Token, precedence: int) -> None:
+    '''
+    `a && b` and `a || b`, after the operator: `b` is only evaluated
+    when `a` does not decide the result, which is either 0 or 1
+    '''
+
+    is_and = op.kind == '&&'
+
+    if (condition := self.cbody.constant_condition()) is not None:
+      self.pg_constant_logical(op, precedence, is_and, condition)
+      return
+    jumpi = self.cbody.jump(JUMP_IF_FALSE if is_and else JUMP_IF_TRUE, op.loc)
+
+    self.pg_binary_expression(precedence)
+    self.cbody.load(Val(LIT_INT, 0, op.loc))
+    self.cbody.operator(BINARY, '!=', op.loc)
+
+    quiti = self.cbody.jump(JUMP, op.loc)
+    self.cbody.patch(jumpi)
+
+    self.cbody.load(Val(IntTyp('int', True), 0 if is_and else 1, op.loc))
+    self.cbody.patch(quiti)
+
+  def pg_constant_logical(
+    self,
+    op: Token,
+    precedence: int,
+    is_and: bool,
+    condition: bool
+  ) -> None:
+    '''
+    `a && b` and `a || b` when `a` is known, `b` is
+    dropped when `a` decides the result
+    '''
+
+    cbody = self.cbody
+    cbody.drop(1)
+    start, start_vstack = cbody.cursor, cbody.vstack.copy()
+
+    self.pg_binary_expression(precedence)
+
+    if condition != is_and:
+      cbody.truncate(start, start_vstack)
+      cbody.load(Val(IntTyp('int', True), int(condition), op.loc))
+      return
+
+    cbody.load(Val(LIT_INT, 0, op.loc))
+    cbody.operator(BINARY, '!=', op.loc)
+
+  def pg_conditional_expression(self) -> None:
+    self.pg_binary_expression(CONDITIONAL_PRECEDENCE)
+
+  def pg_assignment_expression(self) -> None:
+    self.pg_binary_expression(ASSIGNMENT_PRECEDENCE)
 
   def pg_expression(self, is_stmt: bool = False) -> None:
     self.pg_assignment_expression()
 
     while is_stmt and self.token(','):
-      loc = self.cur.loc
+      self.cbody.emit(POP, 0, self.bck.loc)
       self.pg_assignment_expression()
 
   def pg_return(self, l: Loc) -> None:
@@ -365,7 +1080,7 @@ class LParse:
       self.cbody.ret_void(l)
       return
     
-    self.pg_expression()
+    self.pg_expression(is_stmt=True)
     self.cbody.ret(l)
     self.expect_token(';')
 
@@ -379,7 +1094,7 @@ class LParse:
 
   def pg_rounded_expression(self) -> None:
     self.expect_token('(')
-    self.pg_expression()
+    self.pg_expression(is_stmt=True)
     self.expect_token(')')
 
   def pg_statement(self) -> None:
@@ -390,18 +1105,18 @@ class LParse:
 
   def pg_if(self, loc: Loc) -> None:
     self.pg_rounded_expression()
-    jumpi = self.cbody.jump_if_false(loc)
+    jumpi = self.cbody.jump(JUMP_IF_FALSE, loc)
 
     self.pg_statement()
 
     if self.token('else'):
-      quiti = self.cbody.jump(loc)
-      jumpi.ex = self.cbody.cursor
+      quiti = self.cbody.jump(JUMP, loc)
+      self.cbody.patch(jumpi)
       
       self.pg_statement()
-      quiti.ex = self.cbody.cursor
+      self.cbody.patch(quiti)
     else:
-      jumpi.ex = self.cbody.cursor
+      self.cbody.patch(jumpi)
 
   def selection_statement(self) -> bool:
     if self.token('if'):
@@ -410,7 +1125,23 @@ class LParse:
     
     return False
 
+  def compound_statement(self) -> bool:
+    if not self.token('{'):
+      return False
+
+    # the block's locals are not visible after it
+    self.cbody.locals.push()
+
+    while not self.token('}'):
+      self.decl_or_statement()
+
+    self.cbody.locals.pop()
+    return True
+
   def statement(self) -> bool:
+    if self.compound_statement():
+      return True
+
     if self.jump_statement():
       return True
     
@@ -457,14 +1188,61 @@ class LParse:
   # parse the next tokens and in the mean while
   # emit untyped ir for the parsed tokens
   def pg_fnbody(self) -> None:
-    # TODO: generate declaration instructions
-    #       for parameters
-
     while self.has_token():
       self.decl_or_statement()
 
+  def declare_parameters(self) -> None:
+    '''
+    the parameters take the first local slots, in order,
+    with their types and the return one (for comptime calls)
+    '''
+
+    if not isinstance(self.node, SyntaxNode):
+      return
+
+    resolved = self.gen.resolver.declaration(self.node)
+    typ = cast(FnTyp, resolved.typ)
+    self.cbody.ret_typ = typ.ret
+
+    # TODO: generate declaration instructions
+    #       for their types
+    for name, ptyp in zip(resolved.pnames, typ.params):
+      if name is not None:
+        self.cbody.declare_local(cast(int, name.value_id), name.loc, ptyp)
+        self.cbody.params += 1
+
+  def pg_constant(self, compound: CompoundNode) -> Val | None:
+    '''
+    the value of the constant expression made of `compound`'s tokens,
+    `None` when it refers to an object or an unknown name, whose value
+    is not known at compile time (see `Gen.evaluate`)
+    '''
+
+    self.tokens = compound.tokens
+
+    if len(self.tokens) == 0:
+      raise CompilationException('expected constant expression', compound.loc)
+
+    self.pg_conditional_expression()
+
+    if self.has_token():
+      raise CompilationException(
+        f'unexpected token "{self.cur.kind}" in constant expression', self.cur.loc
+      )
+
+    tab = self.gen.tab
+
+    if any(n not in tab.members or not self.gen.has_body(n) for n in self.cbody.referenced_names()):
+      return None
+
+    return self.gen.vm.evaluate(self.cbody, 0, compound.loc)
+
   def process(self) -> None:
-    self.tokens = cast(CompoundNode, self.node['body']).tokens
+    if isinstance(self.node, TestDirective):
+      self.tokens = self.node.body.tokens
+    else:
+      self.tokens = cast(CompoundNode, cast(SyntaxNode, self.node)['body']).tokens
+    self.declare_parameters()
 
     # an empty body may make the parsing functions
     # to raise errors because they need at least one token
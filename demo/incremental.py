@@ -0,0 +1,155 @@
+from data import *
+from parallel import declaration_boundaries
+from hashlib import blake2b
+
+def declaration_key(unit, start: int, end: int) -> bytes:
+  '''
+  the fingerprint of the declaration in the tokens [start, end): a
+  digest of its source text, from its first token to its last one
+  (always a single char, `;` or `}`); the same text gives the
+  same tokens, and their locations move all by the same offset
+  '''
+
+  offsets = unit.tokens.offsets
+  text = unit.source[offsets[start]:offsets[end - 1] + 1]
+
+  return blake2b(
+    text.encode() if isinstance(text, str) else text, digest_size=16
+  ).digest()
+
+# an unassigned attribute
+ABSENT: object = object()
+
+def declaration_index(
+  unit,
+  spans: list[tuple[int, int]],
+  known: dict[int, bytes]
+) -> dict[bytes, int]:
+  '''
+  the index of each declaration by its key, `known`
+  holds the keys already computed, by start index
+  '''
+
+  return {
+    known[start] if start in known else declaration_key(unit, start, end): i
+      for i, (start, end) in enumerate(spans)
+  }
+
+class Rebase:
+  '''
+  copies a tree parsed from the tokens of `old` starting at
+  `old_start` into the same tokens of `new` starting at `new_start`:
+  views, ranges and locations are moved to `new`
+  '''
+
+  def __init__(
+    self,
+    old: TokenBuffer,
+    new: TokenBuffer,
+    old_start: int,
+    new_start: int
+  ) -> None:
+    self.new: TokenBuffer = new
+    self.delta: int = new_start - old_start
+    self.offset_delta: int = new.offsets[new_start] - old.offsets[old_start]
+
+  def value(self, v: Any) -> Any:
+    # exact types first, they are the most frequent ones
+    cls = type(v)
+
+    if cls in NODE_LAYOUTS:
+      return self.node(v)
+
+    if cls is TokenView:
+      return TokenView(self.new, v.index + self.delta)
+
+    if cls is SourceLoc:
+      return SourceLoc(self.new.source_map, v.offset + self.offset_delta)
+
+    if cls is list:
+      return [self.value(item) for item in v]
+
+    if cls is tuple:
+      return tuple(self.value(item) for item in v)
+
+    if cls is TokenRange:
+      return TokenRange(self.new, v.start + self.delta, v.end + self.delta)
+
+    if cls is Token:
+      # ids are not the same in the new pools
+      value_id = None
+
+      if v.value_id is not None:
+        pool = self.new.ids if v.kind in ID_KINDS else self.new.str_literals
+        value_id = pool.intern(cast(str, v.value))
+
+      return Token(v.kind, v.value, self.value(v.loc), value_id)
+
+    # names, flags and plain locations
+    return v
+
+  def node(self, node: Node) -> Node:
+    cls = type(node)
+    copy = cls.__new__(cls)
+
+    for attr in NODE_LAYOUTS[cls]:
+      # optional syntax fields may be unassigned
+      if (v := getattr(node, attr, ABSENT)) is not ABSENT:
+        setattr(copy, attr, self.value(v))
+
+    return copy
+
+class DeclarationReuse:
+  '''
+  the `reuse` hook of `DParse.translation_unit_into`: at each
+  position, the tokens up to the next declaration boundary (see
+  `declaration_boundaries`) are looked up among the previous
+  unit's declarations, when they are the same the previous node
+  is rebased instead of parsed again;
+
+  typedef-ed names are recognized by their position inside
+  a declaration, so a declaration only depends on its tokens
+  '''
+
+  def __init__(self, previous, unit, root: MultipleNode) -> None:
+    self.previous_tokens: TokenBuffer = previous.tokens
+    self.unit = unit
+    self.tokens: TokenBuffer = unit.tokens
+    self.root: MultipleNode = root
+
+    # declaration key -> index in the previous spans
+    self.previous: dict[bytes, int] = previous.declarations
+
+    # the roots start with the prefix's nodes, if any
+    self.previous_base: int = len(previous.root.nodes) - len(previous.spans)
+    self.previous_nodes: list[Node] = previous.root.nodes[self.previous_base:]
+    self.previous_spans: list[tuple[int, int]] = previous.spans
+
+    self.boundaries: list[int] = declaration_boundaries(unit.tokens)
+    self.next_boundary: int = 0
+
+    # index in the new root -> index in the previous root
+    self.reused: dict[int, int] = {}
+    # the keys of the reused declarations, by start index
+    self.keys: dict[int, bytes] = {}
+
+  def __call__(self, index: int) -> tuple[Node, int] | None:
+    while \
+      self.next_boundary < len(self.boundaries) and \
+        self.boundaries[self.next_boundary] <= index:
+      self.next_boundary += 1
+
+    if self.next_boundary == len(self.boundaries):
+      return None
+
+    end = self.boundaries[self.next_boundary]
+    key = declaration_key(self.unit, index, end)
+
+    if (i := self.previous.get(key)) is None:
+      return None
+
+    self.reused[len(self.root.nodes)] = self.previous_base + i
+    self.keys[index] = key
+
+    rebase = Rebase(self.previous_tokens, self.tokens, self.previous_spans[i][0], index)
+    return rebase.node(self.previous_nodes[i]), end
@@ -1,5 +1,6 @@
 from data import *
-from typing import cast
+from typing import Iterator, cast
+import re
 
 def is_word_char(c: str) -> bool:
   return c.isalnum() or c == '_'
@@ -37,13 +38,35 @@ TRIPLE_PUNCTUATION: list[str] = [
   '...', '<<=', '>>=',
 ]
 
+def intern_token(unit, token: Token) -> Token:
+  '''
+  replaces the value of identifiers and strings with the
+  one stored in the unit's pools, so that duplicates can be freed
+  '''
+
+  pool: InternPool
+
+  # already interned by the lexer
+  if token.value_id is not None:
+    return token
+
+  if token.kind in ID_KINDS:
+    pool = unit.ids
+  elif token.kind in STR_KINDS:
+    pool = unit.str_literals
+  else:
+    return token
+
+  token.value_id = pool.intern(cast(str, token.value))
+  token.value = pool[token.value_id]
+
+  return token
+
 class Lexer:
   def __init__(self, unit) -> None:
     from unit import TranslationUnit
     self.unit: TranslationUnit = unit
     self.index: int = 0
-    self.index_of_linestart: int = 0
-    self.line: int = 0
 
   @property
   def cur(self) -> str:
@@ -51,14 +74,7 @@ class Lexer:
 
   @property
   def loc(self) -> Loc:
-    return Loc(
-      self.unit.filepath,
-      self.line + 1,
-      self.calculate_col() + 1
-    )
-
-  def calculate_col(self) -> int:
-    return self.index - self.index_of_linestart
+    return SourceLoc(self.unit.source_map, self.index)
 
   def char(self, offset: int) -> str:
     return self.unit.source[self.index + offset]
@@ -67,6 +83,8 @@ class Lexer:
     return self.index + offset < len(self.unit.source)
 
   def eat_cpp(self) -> None:
+    marker_index: int = self.index
+
     # skipping `# `
     self.skip()
 
@@ -79,8 +97,11 @@ class Lexer:
     self.eat_white()
     new_path: Token = self.collect_stringed_token(self.loc)
 
-    self.line = cast(int, new_line.value) - 2
-    self.unit.filepath = cast(str, new_path.value)
+    self.unit.source_map.add_linemarker(
+      marker_index,
+      cast(str, new_path.value),
+      int(cast(str, new_line.value))
+    )
 
     while self.has_char() and self.cur != '\n':
       self.skip()
@@ -98,8 +119,7 @@ class Lexer:
           pass
 
         case '\n':
-          self.line += 1
-          self.index_of_linestart = self.index + 1
+          self.unit.source_map.add_line(self.index + 1)
 
         case _:
           return
@@ -117,7 +137,8 @@ class Lexer:
       self.skip()
 
     if value[0].isdigit():
-      return Token('num', eval(value), loc)
+      # the spelling, its radix and suffix are part of the type
+      return Token('num', value, loc)
 
     if value in KEYWORDS:
       return Token(value, value, loc)
@@ -228,4 +249,268 @@ class Lexer:
     else:
       token = self.collect_punctuation_token(self.loc)
 
-    return token
\ No newline at end of file
+    return intern_token(self.unit, token)
+
+  def tokens(self) -> Iterator[Token]:
+    while self.has_char():
+      token: Token | None = self.next_token()
+
+      if token is None:
+        break
+
+      yield token
+
+ESCAPED_CHARS: dict[str, str] = {
+  '0': '\0',
+  'n': '\n',
+  't': '\t',
+  'r': '\r',
+  'b': '\b',
+  'f': '\f',
+  'v': '\v',
+  'a': '\a',
+  '\\': '\\',
+  '\'': '\'',
+  '\"': '\"',
+}
+
+META_TAGS_SET: frozenset[str] = frozenset(META_TAGS)
+
+# lexeme -> token kind, the bytes tables are used by `BytesLexer`
+KEYWORDS_TABLE: dict[str, str] = {k: k for k in KEYWORDS}
+KEYWORDS_BYTES_TABLE: dict[bytes, str] = {k.encode(): k for k in KEYWORDS}
+
+PUNCTUATION_TABLE: dict[str, str] = {
+  p: p for p in TRIPLE_PUNCTUATION + DOUBLE_PUNCTUATION + PUNCTUATION
+}
+PUNCTUATION_BYTES_TABLE: dict[bytes, str] = {
+  p.encode(): p for p in PUNCTUATION_TABLE
+}
+
+# longest punctuations first, so that the alternation
+# always prefers `<<=` over `<<` over `<`
+PUNCTUATION_PATTERN: str = '|'.join(
+  re.escape(p) for p in sorted(
+    TRIPLE_PUNCTUATION + DOUBLE_PUNCTUATION + PUNCTUATION,
+    key=len,
+    reverse=True
+  )
+)
+
+STRINGED_PATTERN: str = r'"(?:[^"\\]|\\[\s\S])*"|\'(?:[^\'\\]|\\[\s\S])*\''
+
+# the whole tokenizer is driven by this single pattern,
+# the order of the alternatives matters, and `bad` must
+# always be the last one since it matches anything
+MASTER_PATTERN_SOURCE: str = rf'''
+    (?P<white>[ \t\r]+)
+  | (?P<newline>\n)
+  | (?P<cpp>\#[ \t\r]*(?P<cpp_word>\w*))
+  | (?P<word>\w+)
+  | (?P<str>{STRINGED_PATTERN})
+  | (?P<meta>@)
+  | (?P<punct>{PUNCTUATION_PATTERN})
+  | (?P<bad>[\s\S])
+'''
+
+LINEMARKER_PATH_PATTERN_SOURCE: str = rf'[ \t\r]*(?P<path>{STRINGED_PATTERN})?[^\n]*'
+
+MASTER_PATTERN: re.Pattern[str] = re.compile(MASTER_PATTERN_SOURCE, re.VERBOSE)
+LINEMARKER_PATH_PATTERN: re.Pattern[str] = re.compile(LINEMARKER_PATH_PATTERN_SOURCE)
+
+# in bytes patterns `\w` is ascii only, so utf-8 sequences
+# are added to words, to keep non ascii identifiers together
+BYTES_MASTER_PATTERN: re.Pattern[bytes] = re.compile(
+  MASTER_PATTERN_SOURCE.replace(r'\w', r'[\w\x80-\xff]').encode(),
+  re.VERBOSE
+)
+BYTES_LINEMARKER_PATH_PATTERN: re.Pattern[bytes] = re.compile(
+  LINEMARKER_PATH_PATTERN_SOURCE.encode()
+)
+
+ESCAPE_PATTERN: re.Pattern[str] = re.compile(r'\\([\s\S])')
+
+class RegexLexer:
+  '''
+  same token stream as `Lexer`, but the source is walked
+  with `MASTER_PATTERN`, one match per lexeme, instead of
+  one character at a time; `Lexer` is kept as the reference
+  implementation (see `bench.py lexdiff`)
+  '''
+
+  master_pattern: re.Pattern = MASTER_PATTERN
+  linemarker_path_pattern: re.Pattern = LINEMARKER_PATH_PATTERN
+  keywords: dict = KEYWORDS_TABLE
+  punctuations: dict = PUNCTUATION_TABLE
+  quotes: tuple = ('\'', '"')
+
+  def __init__(self, unit) -> None:
+    from unit import TranslationUnit
+    self.unit: TranslationUnit = unit
+    self.index: int = 0
+
+  def loc_at(self, index: int) -> Loc:
+    return SourceLoc(self.unit.source_map, index)
+
+  def has_char(self, offset: int = 0) -> bool:
+    return self.index + offset < len(self.unit.source)
+
+  def unescape(self, value: str, loc: Loc) -> str:
+    if '\\' not in value:
+      return value
+
+    def escape(m: re.Match[str]) -> str:
+      if (c := ESCAPED_CHARS.get(m[1])) is None:
+        raise CompilationException('bad escaped char', loc)
+
+      return c
+
+    return ESCAPE_PATTERN.sub(escape, value)
+
+  def decode(self, lexeme: str) -> str:
+    return lexeme
+
+  def word_token(self, value: str, loc: Loc) -> Token:
+    if value[:1].isdigit():
+      return Token('num', self.decode(value), loc)
+
+    if (keyword := self.keywords.get(value)) is not None:
+      return Token(keyword, keyword, loc)
+
+    return self.id_token(value, loc)
+
+  def id_token(self, value: str, loc: Loc) -> Token:
+    return Token('id', self.decode(value), loc)
+
+  def stringed_token(self, m: re.Match[str], loc: Loc) -> Token:
+    lexeme: str = m.group()
+
+    return Token(
+      'str' if lexeme[:1] == self.quotes[1] else 'chr',
+      self.unescape(self.decode(lexeme[1:-1]), loc),
+      loc
+    )
+
+  def eat_cpp(self, m: re.Match[str]) -> int:
+    '''
+    returns the index from which lexing should resume
+    '''
+
+    word = m['cpp_word']
+
+    # not a linemarker (such as `#pragma`), the reference lexer
+    # only skips the directive name and the char after it
+    if not word[:1].isdigit():
+      return m.end() + 1
+
+    rest = cast(re.Match, self.linemarker_path_pattern.match(self.unit.source, m.end()))
+
+    if (path := rest['path']) is None:
+      raise CompilationException('string not closed', self.loc_at(m.end()))
+
+    self.unit.source_map.add_linemarker(
+      m.start(),
+      self.unescape(self.decode(path[1:-1]), self.loc_at(rest.start('path'))),
+      int(word)
+    )
+
+    return rest.end()
+
+  def meta_token(self, index: int, loc: Loc) -> Token:
+    m = cast(re.Match, self.master_pattern.match(self.unit.source, index))
+    self.index = m.end()
+
+    match m.lastgroup:
+      case 'str':
+        token: Token = self.stringed_token(m, loc)
+        token.kind = 'meta_str'
+
+        return token
+
+      case 'word':
+        token = self.word_token(m.group(), loc)
+        token.kind = 'meta_id'
+
+        if token.value not in META_TAGS_SET:
+          raise CompilationException('unknown meta tag', loc)
+
+        return token
+
+      case _:
+        raise CompilationException('bad token', loc)
+
+  def next_token(self) -> Token | None:
+    source = self.unit.source
+    match_at = self.master_pattern.match
+
+    while self.index < len(source):
+      m = cast(re.Match, match_at(source, self.index))
+      kind = m.lastgroup
+      self.index = m.end()
+
+      match kind:
+        case 'white':
+          continue
+
+        case 'newline':
+          self.unit.source_map.add_line(self.index)
+          continue
+
+        case 'cpp':
+          self.index = self.eat_cpp(m)
+          continue
+
+        case 'word':
+          return intern_token(self.unit, self.word_token(m.group(), self.loc_at(m.start())))
+
+        case 'str':
+          return intern_token(self.unit, self.stringed_token(m, self.loc_at(m.start())))
+
+        case 'meta':
+          return intern_token(self.unit, self.meta_token(self.index, self.loc_at(m.start())))
+
+        case 'punct':
+          value: str = self.punctuations[m.group()]
+          return Token(value, value, self.loc_at(m.start()))
+
+        case _:
+          loc = self.loc_at(m.start())
+
+          if m.group() in self.quotes:
+            raise CompilationException('string not closed', loc)
+
+          raise CompilationException('bad token', loc)
+
+    return None
+
+  def tokens(self) -> Iterator[Token]:
+    while (token := self.next_token()) is not None:
+      yield token
+
+class BytesLexer(RegexLexer):
+  '''
+  `RegexLexer` over a bytes-like source, such as the `mmap`
+  of the preprocessed file (see `TranslationUnit`'s ingestion modes),
+  so the source is never decoded as a whole: only the lexemes that
+  become token values are, and then interned as `str` (the pools
+  hold no undecoded copies);
+
+  offsets, and so columns, count bytes instead of chars: they
+  differ from the `str` ones on lines with non-ascii chars
+  before the token (such as in a string literal)
+  '''
+
+  master_pattern: re.Pattern = BYTES_MASTER_PATTERN
+  linemarker_path_pattern: re.Pattern = BYTES_LINEMARKER_PATH_PATTERN
+  keywords: dict = KEYWORDS_BYTES_TABLE
+  punctuations: dict = PUNCTUATION_BYTES_TABLE
+  quotes: tuple = (b'\'', b'"')
+
+  def decode(self, lexeme: bytes) -> str: # type: ignore[override]
+    return lexeme.decode()
+
+LEXERS: dict[str, type] = {
+  'char': Lexer,
+  'regex': RegexLexer,
+  'bytes': BytesLexer,
+}
@@ -1,18 +1,27 @@
 from unit import TranslationUnit
+from preprocess import Preprocessor, PreprocessCache
+from astcache import AstCache
 from sys  import argv
 from data import *
 
-if len(argv) == 1 or argv[1].startswith('-'):
+# the caches write to disk (see `DEFAULT_CACHE_DIR`), so they are opt-in
+use_cache = '--cache' in argv
+args = [a for a in argv[1:] if a != '--cache']
+
+if len(args) == 0 or args[0].startswith('-'):
   f = 'samples/simple.c0'
 else:
-  f = argv[1]
+  f = args[0]
 
-t = TranslationUnit(f)
+t = TranslationUnit(f, preprocessor=Preprocessor(cache=PreprocessCache() if use_cache else None))
 
 try:
-  t.lex()
+  if use_cache:
+    t.cached_dparse(AstCache())
+  else:
+    t.lex()
+    t.dparse()
 
-  t.dparse()
   t.dump_root()
 
   t.gen()
@@ -0,0 +1,309 @@
+from data import *
+from dparse import DParse
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import get_all_start_methods, get_context
+from os import cpu_count
+from io import BytesIO
+import pickle
+
+def declaration_boundaries(tokens: TokenBuffer) -> list[int]:
+  '''
+  the indexes right after the top level declarations that surely
+  end there: a `;` or a function body's `}` (its `{` follows the
+  parameters' `)`) at nesting depth 0;
+
+  other bodies, such as a struct's one, may be followed by a declarator,
+  so they are not boundaries, a missed boundary only makes a chunk bigger
+  '''
+
+  boundaries: list[int] = []
+  index: int = 0
+
+  while index < tokens.length:
+    kind = tokens.kind_at(index)
+
+    if kind in OPENING_BRACKETS:
+      # the rest is a single chunk, its parser reports the error
+      if (closer := tokens.match_at(index)) < 0:
+        break
+
+      if kind == '{' and index > 0 and tokens.kind_at(index - 1) == ')':
+        boundaries.append(closer + 1)
+
+      index = closer + 1
+      continue
+
+    index += 1
+
+    if kind == ';':
+      boundaries.append(index)
+
+  return boundaries
+
+def split_chunks(tokens: TokenBuffer, count: int) -> list[tuple[int, int]]:
+  '''
+  at most `count` ranges of declarations, of about the same size
+  '''
+
+  size = max(tokens.length // count, 1)
+  chunks: list[tuple[int, int]] = []
+  start: int = 0
+
+  for boundary in declaration_boundaries(tokens):
+    if boundary - start >= size:
+      chunks.append((start, boundary))
+      start = boundary
+
+  if start < tokens.length:
+    chunks.append((start, tokens.length))
+
+  return chunks
+
+class SharedPickler(pickle.Pickler):
+  '''
+  nodes are sent between processes without the token storage
+  they refer to (through views and locations), both sides have
+  the same one, and it is referenced by name
+  '''
+
+  def __init__(self, file: BytesIO, tokens: TokenBuffer) -> None:
+    super().__init__(file, pickle.HIGHEST_PROTOCOL)
+
+    self.shared: dict[int, str] = {
+      id(tokens): 'tokens',
+      id(tokens.ids): 'ids',
+      id(tokens.str_literals): 'str_literals',
+      id(tokens.source_map): 'source_map',
+    }
+
+  def persistent_id(self, obj: object) -> str | None:
+    return self.shared.get(id(obj))
+
+class SharedUnpickler(pickle.Unpickler):
+  def __init__(self, file: BytesIO, tokens: TokenBuffer) -> None:
+    super().__init__(file)
+
+    self.shared: dict[str, object] = {
+      'tokens': tokens,
+      'ids': tokens.ids,
+      'str_literals': tokens.str_literals,
+      'source_map': tokens.source_map,
+    }
+
+  def persistent_load(self, pid: str) -> object:
+    return self.shared[pid]
+
+class ChunkUnit:
+  '''
+  what `DParse` needs from a unit, in the workers
+  '''
+
+  def __init__(self, tokens: TokenBuffer) -> None:
+    self.tokens: TokenBuffer = tokens
+    self.ids: InternPool = tokens.ids
+
+# the unit's tokens, in each worker
+worker_tokens: TokenBuffer | None = None
+
+def init_worker(tokens: TokenBuffer) -> None:
+  global worker_tokens
+  worker_tokens = tokens
+
+def dparse_chunk(chunk: tuple[int, int]) -> bytes:
+  '''
+  the chunk's declarations and the error that stopped
+  the parser (if any), pickled with `SharedPickler`
+  '''
+
+  tokens = cast(TokenBuffer, worker_tokens)
+  d = DParse(ChunkUnit(tokens), tokens.slice(*chunk))
+  root = MultipleNode(d.cur.loc)
+  # exceptions are not sent as such, their `args` are empty
+  error: tuple[str, Loc | None] | None = None
+
+  try:
+    d.translation_unit_into(root)
+  except CompilationException as e:
+    error = (e.message, e.loc)
+
+  f = BytesIO()
+  SharedPickler(f, tokens).dump((root.nodes, error))
+
+  return f.getvalue()
+
+def parallel_dparse(unit, root: MultipleNode, workers: int | None = None) -> None:
+  '''
+  dparses the chunks of `unit.tokens` in a process pool, and appends
+  their declarations to `root` in order; the first error (in source
+  order) is raised after the declarations before it, as `dparse` does;
+
+  typedef-ed names are recognized by their position inside a
+  declaration, so the chunks don't depend on each other
+  '''
+
+  from unit import TranslationUnit
+
+  u: TranslationUnit = unit
+  workers = workers or cpu_count() or 1
+
+  # the workers' pools must not diverge from the unit's ones,
+  # so the names dparse looks up are interned before forking
+  DParse(u)
+
+  # a few chunks per worker, to balance the load
+  chunks = split_chunks(u.tokens, workers * 4)
+
+  # forked workers share the tokens without pickling them
+  method = 'fork' if 'fork' in get_all_start_methods() else 'spawn'
+
+  with ProcessPoolExecutor(
+    workers,
+    mp_context=get_context(method),
+    initializer=init_worker,
+    initargs=(u.tokens,)
+  ) as pool:
+    for result in pool.map(dparse_chunk, chunks):
+      nodes, error = SharedUnpickler(BytesIO(result), u.tokens).load()
+      root.nodes.extend(nodes)
+
+      if error is not None:
+        # the chunks after it are not needed
+        pool.shutdown(wait=False, cancel_futures=True)
+        raise CompilationException(*error)
+
+class GenUnit:
+  '''
+  what `Gen` needs from a unit, in the workers
+  '''
+
+  def __init__(self, tokens: TokenBuffer, tab: SymTable) -> None:
+    self.tokens: TokenBuffer = tokens
+    self.ids: InternPool = tokens.ids
+    self.tab: SymTable = tab
+
+# the bodies generator, in each worker
+worker_gen = None
+
+def init_gen_worker(tokens: TokenBuffer, tab: SymTable) -> None:
+  from gen import Gen
+
+  global worker_tokens, worker_gen
+  worker_tokens = tokens
+  worker_gen = Gen(GenUnit(tokens, tab))
+
+def gen_chunk(names: list[int]) -> bytes:
+  '''
+  the bodies of the functions `names` (in order) and the error
+  that stopped the generator (if any), pickled with `SharedPickler`
+  '''
+
+  from gen import Gen
+
+  tokens = cast(TokenBuffer, worker_tokens)
+  g = cast(Gen, worker_gen)
+
+  bodies: list[object] = []
+  error: tuple[str, Loc | None] | None = None
+
+  try:
+    for name in names:
+      node, _ = cast(tuple[Node, bool], g.tab.members[name])
+      bodies.append(cast(FnSymbol, g.generate(name, node.loc)).fn.cbody)
+  except CompilationException as e:
+    error = (e.message, e.loc)
+
+  f = BytesIO()
+  SharedPickler(f, tokens).dump((bodies, error))
+
+  return f.getvalue()
+
+def split_names(tab: SymTable, names: list[int], count: int) -> list[list[int]]:
+  '''
+  at most `count` runs of consecutive function names,
+  whose bodies have about the same number of tokens
+  '''
+
+  def size(name: int) -> int:
+    node = cast(SyntaxNode, cast(tuple, tab.members[name])[0])
+    return len(node['body'].tokens)
+
+  target = max(sum(map(size, names)) // count, 1)
+  chunks: list[list[int]] = []
+  filled: int = target
+
+  for name in names:
+    if filled >= target:
+      chunks.append([])
+      filled = 0
+
+    chunks[-1].append(name)
+    filled += size(name)
+
+  return chunks
+
+def parallel_gen(gen, workers: int | None = None) -> None:
+  '''
+  the same as `gen.gen_whole_unit`, but the function bodies are
+  generated in a process pool: once the unit is predeclared, a body
+  only depends on the symbol table, so the workers get a snapshot of it
+  and runs of consecutive functions; their bodies are merged back in
+  declaration order, and the first error (in that order) is raised
+  after the symbols before it, as `gen_whole_unit` does
+  '''
+
+  from gen import Gen, LParse
+
+  g: Gen = gen
+  workers = workers or cpu_count() or 1
+
+  for top_level in g.root.nodes:
+    g.predeclare_top_level(top_level)
+
+  for test in g.test_nodes:
+    g.gen_test(test)
+
+  # the tests may have generated some at compile time
+  names = [
+    name for name, value in g.tab.members.items()
+      if not isinstance(value, Symbol) and g.has_body(name)
+  ]
+
+  chunks = split_names(g.tab, names, workers * 4)
+  # the other symbols are processed here, in order
+  pending = iter(g.tab.members.copy())
+
+  def generate_until(stop: int | None) -> None:
+    for name in pending:
+      if name == stop:
+        return
+
+      g.generate(name, g.root.loc)
+
+  # forked workers share the tokens without pickling them,
+  # and each one gets a snapshot of the table for free
+  method = 'fork' if 'fork' in get_all_start_methods() else 'spawn'
+
+  with ProcessPoolExecutor(
+    workers,
+    mp_context=get_context(method),
+    initializer=init_gen_worker,
+    initargs=(g.unit.tokens, g.tab)
+  ) as pool:
+    for chunk, result in zip(chunks, pool.map(gen_chunk, chunks)):
+      bodies, error = SharedUnpickler(BytesIO(result), g.unit.tokens).load()
+
+      for name, body in zip(chunk, bodies):
+        generate_until(name)
+        node = cast(SyntaxNode, cast(tuple, g.tab.members[name])[0])
+
+        # the parser only holds its body
+        fn = LParse(g, node)
+        fn.cbody = body
+        g.tab.members[name] = g.function_symbol(node, fn)
+
+      if error is not None:
+        generate_until(chunk[len(bodies)])
+        pool.shutdown(wait=False, cancel_futures=True)
+        raise CompilationException(*error)
+
+  generate_until(None)
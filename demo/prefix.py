@@ -0,0 +1,170 @@
+from data import *
+from preprocess import Preprocessor, PreprocessCache, hash_bytes
+from os import makedirs, remove, scandir
+from os.path import abspath, basename, dirname, exists, join
+import pickle
+import re
+
+INCLUDE_PATTERN: re.Pattern[str] = re.compile(r'^\s*#\s*include\b')
+
+# bumped when the pickled classes change, older snapshots are removed
+SNAPSHOT_FORMAT: int = 2
+
+def read_prologue(filepath: str) -> tuple[str, int] | None:
+  '''
+  the leading `#include` directives of a source file (only comments
+  and blank lines may be between them), and the line of the last one
+  '''
+
+  includes: list[str] = []
+  last_line: int = 0
+  in_comment: bool = False
+
+  with open(filepath, 'r') as f:
+    for i, line in enumerate(f, start=1):
+      stripped = line.strip()
+
+      if in_comment:
+        in_comment = '*/' not in stripped
+        continue
+
+      if stripped == '' or stripped.startswith('//'):
+        continue
+
+      if stripped.startswith('/*'):
+        in_comment = '*/' not in stripped[2:]
+        continue
+
+      if INCLUDE_PATTERN.match(line) is None:
+        break
+
+      includes.append(stripped)
+      last_line = i
+
+  if len(includes) == 0:
+    return None
+
+  return '\n'.join(includes) + '\n', last_line
+
+def find_prologue_end(source: str | bytes, filepath: str, last_line: int) -> int | None:
+  '''
+  the offset of the linemarker that brings the preprocessed
+  source back to `filepath` after its prologue
+  '''
+
+  pattern = rf'^#[ \t]*(\d+)[ \t]+"{re.escape(filepath)}"'
+
+  for m in re.finditer(
+    pattern if isinstance(source, str) else pattern.encode(),
+    source, # type: ignore[arg-type]
+    re.MULTILINE
+  ):
+    if int(m[1]) > last_line:
+      return m.start()
+
+  return None
+
+class PrefixSnapshot:
+  '''
+  the lexed and dparsed prologue of a unit: its tokens, top
+  level nodes and everything they refer to (pools and source map);
+  dparse keeps no other state between top level declarations,
+  typedef-ed names are recognized by their position only
+  '''
+
+  def __init__(self, unit) -> None:
+    self.tokens: TokenBuffer = unit.tokens
+    self.root: MultipleNode = unit.root
+    self.ids: InternPool = unit.ids
+    self.str_literals: InternPool = unit.str_literals
+    self.source_map: SourceMap = unit.source_map
+
+class PrefixStore:
+  '''
+  snapshots of `#include` prologues, shared between units;
+  a prologue is preprocessed through the `PreprocessCache`, and its snapshot
+  is named after the cached object, which is content-addressed on the
+  include closure, so a changed header leads to a new snapshot
+  '''
+
+  def __init__(self, cache: PreprocessCache) -> None:
+    self.cache: PreprocessCache = cache
+    self.directory: str = join(cache.directory, 'prefixes')
+    makedirs(self.directory, exist_ok=True)
+
+    self.builds: int = 0
+    self.loads: int = 0
+
+  def prologue_filepath(self, prologue: str, unit_dir: str) -> str:
+    '''
+    the prologue is written in a file of its own,
+    named after its content and the unit's directory
+    '''
+
+    name = hash_bytes(f'{abspath(unit_dir)}\n{prologue}'.encode())
+    filepath = join(self.directory, f'{name}.h')
+
+    if not exists(filepath):
+      with open(filepath, 'w') as f:
+        f.write(prologue)
+
+    return filepath
+
+  def load(
+    self,
+    filepath: str,
+    prologue: str,
+    preprocessor: Preprocessor
+  ) -> PrefixSnapshot:
+    from unit import TranslationUnit
+
+    # quoted includes are searched from the prologue's
+    # directory, but they must be resolved from the unit's one
+    prologue_preprocessor = Preprocessor(
+      preprocessor.command,
+      preprocessor.flags + ['-iquote', dirname(filepath) or '.'],
+      self.cache
+    )
+
+    prologue_filepath = self.prologue_filepath(prologue, dirname(filepath))
+    object_path = prologue_preprocessor.cached_preprocess(prologue_filepath)
+    snapshot_path = join(
+      self.directory, f'{basename(object_path)}.{SNAPSHOT_FORMAT}.snapshot'
+    )
+
+    if exists(snapshot_path):
+      with open(snapshot_path, 'rb') as f:
+        self.loads += 1
+        return pickle.load(f)
+
+    unit = TranslationUnit(prologue_filepath, preprocessor=prologue_preprocessor)
+    unit.lex()
+    unit.dparse()
+
+    snapshot = PrefixSnapshot(unit)
+
+    with open(snapshot_path, 'wb') as f:
+      pickle.dump(snapshot, f)
+
+    self.remove_stale()
+    self.builds += 1
+
+    return snapshot
+
+  def remove_stale(self) -> None:
+    '''
+    removes the snapshots whose preprocessed object has
+    been evicted, and those of another format
+    '''
+
+    for entry in scandir(self.directory):
+      if not entry.name.endswith('.snapshot'):
+        continue
+
+      key, _, format = entry.name.removesuffix('.snapshot').partition('.')
+
+      if format != str(SNAPSHOT_FORMAT) or not exists(self.cache.object_path(key)):
+        remove(entry.path)
+
+  def __repr__(self) -> str:
+    return f'PrefixStore({self.directory}, builds: {self.builds}, loads: {self.loads})'
@@ -0,0 +1,469 @@
+from data import *
+from subprocess import Popen, PIPE
+from tempfile import TemporaryFile
+from contextlib import nullcontext
+from typing import IO, Iterable, Iterator
+from shutil import which
+from shlex import split as split_command
+from time import perf_counter
+from os import environ, getcwd, makedirs, replace, remove, scandir, utime
+from os.path import abspath, join, exists, dirname, expanduser, sep
+from hashlib import sha256
+from json import dumps, loads
+import re
+
+CPP_FLAGS: list[str] = ['-std=c99', '-nostdinc', '-Iinclude']
+
+# known preprocessor commands, flags and input files are appended;
+# the drivers need `-x c` because our sources are not `.c` files
+PREPROCESSORS: dict[str, list[str]] = {
+  'clang-cpp': ['clang-cpp'],
+  'cpp': ['cpp'],
+  'gcc': ['gcc', '-E', '-x', 'c'],
+  'clang': ['clang', '-E', '-x', 'c'],
+}
+
+# tried in order when no command is configured
+# (neither passed nor in the `Z9_CPP` environment variable)
+DEFAULT_PREPROCESSORS: list[str] = ['clang-cpp', 'cpp', 'gcc', 'clang']
+
+# each preprocessed input starts with this linemarker (after the one
+# naming the input), this is how the output of a batch is split
+BUILTIN_LINEMARKER_PATTERN: re.Pattern[bytes] = re.compile(
+  rb'^#[ \t]*\d+[ \t]+"<built-in>"', re.MULTILINE
+)
+
+def resolve_command(command: str | list[str] | None) -> list[str]:
+  if command is None:
+    command = environ.get('Z9_CPP')
+
+  if command is None:
+    for name in DEFAULT_PREPROCESSORS:
+      if which(PREPROCESSORS[name][0]) is not None:
+        return PREPROCESSORS[name]
+
+    raise CompilationException(
+      f'no preprocessor found, tried {", ".join(DEFAULT_PREPROCESSORS)}', None
+    )
+
+  if isinstance(command, list):
+    return command
+
+  if command in PREPROCESSORS:
+    return PREPROCESSORS[command]
+
+  return split_command(command)
+
+# how much of the preprocessor's stdout is read at once (at most)
+STREAM_CHUNK_SIZE: int = 64 * 1024
+
+def split_batch_output(chunks: Iterable[bytes], count: int) -> Iterator[bytes]:
+  '''
+  the output of each input of a batch, as soon as the next one
+  starts (so the first units can be lexed while the preprocessor
+  is still working on the others)
+  '''
+
+  buffer = bytearray()
+  # where the current input's output starts, and how far
+  # the buffer was searched (always at the start of a line)
+  start: int | None = None
+  scanned: int = 0
+  found: int = 0
+
+  for chunk in chunks:
+    buffer += chunk
+    # only whole lines are searched, a linemarker may be split across chunks
+    complete = buffer.rfind(b'\n') + 1
+
+    for m in BUILTIN_LINEMARKER_PATTERN.finditer(buffer, scanned, complete):
+      # the input's chunk starts with the linemarker before `<built-in>`
+      next_start = buffer.rfind(b'\n', 0, max(m.start() - 1, 0)) + 1
+      found += 1
+
+      if start is not None:
+        yield bytes(buffer[start:next_start])
+
+      start = next_start
+
+    scanned = max(scanned, complete)
+
+    # what was handed out is not needed anymore
+    if start is not None and start > 0:
+      del buffer[:start]
+      scanned -= start
+      start = 0
+
+  if found != count:
+    raise CompilationException(
+      f'cannot split the preprocessed batch, expected {count} inputs, found {found}',
+      None
+    )
+
+  yield bytes(buffer[start:])
+
+# in the user's cache directory, the working one is left alone
+DEFAULT_CACHE_DIR: str = environ.get('Z9_CACHE_DIR') or join(
+  environ.get('XDG_CACHE_HOME') or join(expanduser('~'), '.cache'), 'z9'
+)
+DEFAULT_CACHE_MAX_BYTES: int = 256 * 1024 * 1024
+
+def hash_bytes(content: bytes) -> str:
+  return sha256(content).hexdigest()
+
+def hash_file(filepath: str) -> str | None:
+  try:
+    with open(filepath, 'rb') as f:
+      return hash_bytes(f.read())
+  except OSError:
+    return None
+
+def parse_depfile(content: str) -> list[str]:
+  '''
+  the prerequisites of a make rule, as written by `-MD -MF`
+  '''
+
+  content = content.replace('\\\n', ' ')
+  prerequisites = content[content.index(':') + 1:]
+
+  # spaces in paths are escaped with `\`
+  return [
+    p.replace('\\ ', ' ') for p in re.split(r'(?<!\\)\s+', prerequisites) if p != ''
+  ]
+
+# the include search lists printed by `-v` (gcc and clang), one
+# directory per indented line, the `"..."` one comes first
+SEARCH_LIST_PATTERN: re.Pattern[str] = re.compile(
+  r'^#include [<"]\.\.\.[>"] search starts here:\n((?: .*\n)*)', re.MULTILINE
+)
+
+def parse_search_dirs(verbose: str) -> list[str]:
+  '''
+  the include directories, in search order, from the `-v` output
+  '''
+
+  return [
+    abspath(line.strip().removesuffix(' (framework directory)'))
+      for m in SEARCH_LIST_PATTERN.finditer(verbose) for line in m[1].splitlines()
+  ]
+
+def missed_headers(filepath: str, deps: list[str], search_dirs: list[str]) -> list[str]:
+  '''
+  the paths that were searched before each dependency was found, and
+  did not exist: its name in the search directories before the one it
+  was found in, and in the directories of the files that may have
+  included it (the depfile does not tell which one did, nor whether
+  with `"..."`), so creating any of them may change the output
+  '''
+
+  includer_dirs = list(dict.fromkeys(dirname(abspath(f)) for f in [filepath] + deps))
+  missed: dict[str, None] = {}
+
+  for dep in map(abspath, deps):
+    for k, directory in enumerate(search_dirs):
+      if not dep.startswith(directory + sep):
+        continue
+
+      name = dep[len(directory) + 1:]
+
+      for searched in includer_dirs + search_dirs[:k]:
+        if (candidate := join(searched, name)) != dep and not exists(candidate):
+          missed[candidate] = None
+
+  return list(missed)
+
+def evict_lru(directory: str, max_bytes: int, keep: str) -> int:
+  '''
+  removes the least recently used files of `directory` until their total
+  size fits in `max_bytes`, returns how many were removed; `keep` is never
+  evicted, even when it alone is bigger than `max_bytes`
+  '''
+
+  entries = [e for e in scandir(directory) if e.is_file()]
+  total = sum(e.stat().st_size for e in entries)
+  evicted: int = 0
+
+  if total <= max_bytes:
+    return evicted
+
+  for entry in sorted(entries, key=lambda e: e.stat().st_mtime):
+    if total <= max_bytes:
+      break
+
+    if entry.path == keep:
+      continue
+
+    total -= entry.stat().st_size
+    remove(entry.path)
+    evicted += 1
+
+  return evicted
+
+class PreprocessCache:
+  '''
+  on-disk cache of preprocessed sources, content-addressed:
+  the key hashes the command, the flags and the content of every
+  file in the include closure of the source (taken from the preprocessor's
+  dependency output), so a warm lookup only needs to rehash those files;
+
+  * `manifests/` maps each (source, working directory, command and flags)
+    to its last known closure, and to the headers that were searched and
+    not found (see `missed_headers`): one created since, earlier on the
+    include path than the header it was found as, is a miss too
+  * `objects/` holds the preprocessed outputs, evicted least recently
+    used first when their total size goes over `max_bytes`
+  '''
+
+  def __init__(
+    self,
+    directory: str = DEFAULT_CACHE_DIR,
+    max_bytes: int = DEFAULT_CACHE_MAX_BYTES
+  ) -> None:
+    self.directory: str = directory
+    self.max_bytes: int = max_bytes
+
+    self.manifests_dir: str = join(directory, 'manifests')
+    self.objects_dir: str = join(directory, 'objects')
+    makedirs(self.manifests_dir, exist_ok=True)
+    makedirs(self.objects_dir, exist_ok=True)
+
+    self.hits: int = 0
+    self.misses: int = 0
+    self.evictions: int = 0
+
+  def manifest_path(self, filepath: str, command: list[str]) -> str:
+    # relative include paths depend on the working directory
+    name = hash_bytes(dumps([abspath(filepath), getcwd(), command]).encode())
+    return join(self.manifests_dir, name)
+
+  def object_path(self, key: str) -> str:
+    return join(self.objects_dir, key)
+
+  def key(self, filepath: str, command: list[str], closure: dict[str, str]) -> str:
+    # `filepath` is hashed as written, since it ends up in the linemarkers
+    return hash_bytes(
+      dumps([filepath, getcwd(), command, sorted(closure.items())]).encode()
+    )
+
+  def lookup(self, filepath: str, command: list[str]) -> str | None:
+    '''
+    the path of the cached output, when the source
+    and its whole include closure are unchanged
+    '''
+
+    try:
+      with open(self.manifest_path(filepath, command), 'r') as f:
+        manifest = loads(f.read())
+        closure: dict[str, str] = manifest['closure']
+        missed: list[str] = manifest['missed']
+    except (OSError, ValueError, KeyError, TypeError):
+      self.misses += 1
+      return None
+
+    for dep, dep_hash in closure.items():
+      if hash_file(dep) != dep_hash:
+        self.misses += 1
+        return None
+
+    if any(map(exists, missed)):
+      self.misses += 1
+      return None
+
+    object_path = self.object_path(self.key(filepath, command, closure))
+
+    if not exists(object_path):
+      self.misses += 1
+      return None
+
+    # recently used, for the eviction
+    utime(object_path)
+
+    self.hits += 1
+    return object_path
+
+  def store(
+    self,
+    filepath: str,
+    command: list[str],
+    deps: list[str],
+    search_dirs: list[str],
+    output: bytes
+  ) -> str:
+    closure: dict[str, str] = {}
+
+    for dep in [filepath] + deps:
+      if (dep_hash := hash_file(dep)) is not None:
+        closure[abspath(dep)] = dep_hash
+
+    object_path = self.object_path(self.key(filepath, command, closure))
+
+    # written aside and then moved, so that readers
+    # never see a partial file
+    self.write_atomic(object_path, output)
+    self.write_atomic(
+      self.manifest_path(filepath, command),
+      dumps({
+        'closure': closure,
+        'missed': missed_headers(filepath, deps, search_dirs),
+      }).encode()
+    )
+
+    self.evict(keep=object_path)
+    return object_path
+
+  def write_atomic(self, path: str, content: bytes) -> None:
+    with open(path + '.tmp', 'wb') as f:
+      f.write(content)
+
+    replace(path + '.tmp', path)
+
+  def evict(self, keep: str) -> None:
+    self.evictions += evict_lru(self.objects_dir, self.max_bytes, keep)
+
+  def __repr__(self) -> str:
+    return \
+      f'PreprocessCache({self.directory}, hits: {self.hits}, ' \
+      f'misses: {self.misses}, evictions: {self.evictions})'
+
+class Preprocessor:
+  '''
+  runs the c preprocessor and reads its stdout as it is written,
+  straight into the translation unit (no temporary file is involved),
+  the spawned processes and their wall time are counted;
+
+  with a `PreprocessCache`, unchanged units skip the subprocess
+  '''
+
+  def __init__(
+    self,
+    command: str | list[str] | None = None,
+    flags: list[str] = CPP_FLAGS,
+    cache: PreprocessCache | None = None
+  ) -> None:
+    self.command: list[str] = resolve_command(command)
+    self.flags: list[str] = flags
+    self.cache: PreprocessCache | None = cache
+
+    # only compiler drivers (`-E`) accept many inputs at once, `cpp`
+    # takes a single one (the second is its output), and an input that
+    # includes all the others would share macros and include guards
+    self.supports_batch: bool = '-E' in self.command
+
+    self.spawns: int = 0
+    self.units: int = 0
+    self.wall_time: float = 0.0
+
+  def run(self, args: list[str], units: int) -> bytes:
+    return b''.join(self.stream(args, units))
+
+  def spawn(self, args: list[str], units: int) -> tuple[bytes, bytes]:
+    '''
+    the whole stdout and stderr of the preprocessor
+    '''
+
+    with TemporaryFile() as errors:
+      output = b''.join(self.stream(args, units, errors))
+      errors.seek(0)
+
+      return output, errors.read()
+
+  def stream(
+    self,
+    args: list[str],
+    units: int,
+    errors: IO[bytes] | None = None
+  ) -> Iterator[bytes]:
+    '''
+    the preprocessor's stdout, chunk by chunk as it is written;
+    stderr goes to `errors` (or to a temporary file), a pipe
+    that nobody reads could block the preprocessor
+    '''
+
+    with TemporaryFile() if errors is None else nullcontext(errors) as errors, \
+      Popen(self.command + self.flags + args, stdout=PIPE, stderr=errors) as process:
+      stdout: IO[bytes] = process.stdout # type: ignore[assignment]
+
+      self.spawns += 1
+      self.units += units
+
+      while True:
+        # only the time spent waiting on the preprocessor counts,
+        # not the one spent by the consumer between the chunks
+        start = perf_counter()
+        chunk = stdout.read1(STREAM_CHUNK_SIZE) # type: ignore[attr-defined]
+        self.wall_time += perf_counter() - start
+
+        if len(chunk) == 0:
+          break
+
+        yield chunk
+
+      start = perf_counter()
+      process.wait()
+      self.wall_time += perf_counter() - start
+
+      if process.returncode != 0:
+        errors.seek(0)
+        error = errors.read().decode(errors='replace').strip().splitlines()
+        details = f': {error[0]}' if len(error) > 0 else ''
+
+        raise CompilationException(f'preprocessor failed{details}', None)
+
+  def preprocess(self, filepath: str) -> bytes:
+    if self.cache is None:
+      return self.run([filepath], 1)
+
+    with open(self.cached_preprocess(filepath), 'rb') as f:
+      return f.read()
+
+  def cached_preprocess(self, filepath: str) -> str:
+    '''
+    the path of the cached output of `filepath`,
+    the preprocessor only runs on a cache miss
+    '''
+
+    from tempfile import TemporaryDirectory
+
+    cache: PreprocessCache = self.cache # type: ignore[assignment]
+    command = self.command + self.flags
+
+    if (cached := cache.lookup(filepath, command)) is not None:
+      return cached
+
+    with TemporaryDirectory() as tmp:
+      depfile = join(tmp, 'deps')
+      # `-v` prints the include search path
+      output, errors = self.spawn(['-v', '-MD', '-MF', depfile, filepath], 1)
+
+      with open(depfile, 'r') as f:
+        deps = parse_depfile(f.read())
+
+    search_dirs = parse_search_dirs(errors.decode(errors='replace'))
+    return cache.store(filepath, command, deps, search_dirs, output)
+
+  def preprocess_to_file(self, filepath: str, output_filepath: str) -> None:
+    self.run([filepath, '-o', output_filepath], 1)
+
+  def preprocess_many(self, filepaths: list[str]) -> Iterator[bytes]:
+    '''
+    preprocesses all the inputs in a single invocation when
+    the command supports it, otherwise one at a time; each
+    output is handed out as soon as it is complete
+    '''
+
+    # the dependency output cannot be split per input, so
+    # with a cache the inputs are preprocessed one by one
+    if not self.supports_batch or self.cache is not None or len(filepaths) <= 1:
+      return (self.preprocess(f) for f in filepaths)
+
+    return split_batch_output(
+      self.stream(filepaths, len(filepaths)),
+      len(filepaths)
+    )
+
+  def __repr__(self) -> str:
+    per_unit = self.wall_time / self.units * 1000 if self.units > 0 else 0
+
+    return \
+      f'Preprocessor({" ".join(self.command)}, spawns: {self.spawns}, ' \
+      f'units: {self.units}, wall_time: {self.wall_time:.3f}s, per_unit: {per_unit:.1f}ms)'
@@ -1,26 +1,108 @@
 from data import *
-from subprocess import run as runprocess
+from preprocess import Preprocessor
+from prefix import PrefixSnapshot, PrefixStore
 from sys import argv
+from typing import Callable
+from mmap import mmap, ACCESS_READ
+
+def map_file(filepath: str) -> mmap | bytes:
+  with open(filepath, 'rb') as f:
+    # empty files cannot be mapped
+    try:
+      return mmap(f.fileno(), 0, access=ACCESS_READ)
+    except ValueError:
+      return b''
+
+# how the preprocessed source is read:
+# * 'str': the preprocessor's stdout decoded into a single `str`
+# * 'bytes': the preprocessor's stdout, lexed as bytes by `BytesLexer`
+# * 'mmap': the preprocessor writes into a temporary file, which
+#   is memory-mapped and lexed by `BytesLexer`
+# with 'bytes' and 'mmap', columns count bytes, not chars (see `BytesLexer`)
+INGESTION_MODES = ('str', 'bytes', 'mmap')
 
 class TranslationUnit:
-  def __init__(self, filepath: str) -> None:
-    from tempfile import NamedTemporaryFile
+  def __init__(
+    self,
+    filepath: str,
+    ingestion: str = 'str',
+    preprocessor: Preprocessor | None = None,
+    preprocessed: bytes | None = None
+  ) -> None:
+    '''
+    `preprocessed` is the already preprocessed source (see `translation_units`)
+    '''
+
     from rich.console import Console
 
     self.console = Console(emoji=False)
+    self.preprocessor: Preprocessor = \
+      Preprocessor() if preprocessor is None else preprocessor
 
-    preprocessed_filepath: str = NamedTemporaryFile().name
-    clang_cpp = runprocess(
-      f'clang-cpp.exe -std=c99 -nostdinc -Iinclude "{filepath}" -o "{preprocessed_filepath}"'
-    ).returncode
+    self.filepath: str = filepath
+    self.source: str | bytes | mmap
 
-    if clang_cpp != 0:
-      raise CompilationException('clang preprocessor failed', None)
+    if ingestion == 'mmap':
+      self.source = self.preprocess_mapped()
+    else:
+      if preprocessed is None:
+        preprocessed = self.preprocessor.preprocess(filepath)
+
+      self.source = preprocessed if ingestion == 'bytes' else preprocessed.decode()
 
-    self.filepath: str = filepath
-    self.source: str = open(preprocessed_filepath, 'r').read()
     self.cmod: CModule = CModule(filepath + '.c')
 
+    # see `use_prefix`
+    self.prefix: PrefixSnapshot | None = None
+    self.source_start: int = 0
+
+  def preprocess_mapped(self) -> mmap | bytes:
+    from tempfile import TemporaryDirectory
+    from os.path import join
+
+    # the cached output can be mapped directly
+    if self.preprocessor.cache is not None:
+      return map_file(self.preprocessor.cached_preprocess(self.filepath))
+
+    with TemporaryDirectory() as tmp:
+      preprocessed_filepath = join(tmp, 'preprocessed')
+      self.preprocessor.preprocess_to_file(self.filepath, preprocessed_filepath)
+
+      # the mapping stays valid after the file is removed
+      return map_file(preprocessed_filepath)
+
+  def use_prefix(self, store: PrefixStore) -> bool:
+    '''
+    when the unit starts with an `#include` prologue, its snapshot is
+    loaded from `store` (or built), and lexing and dparsing resume
+    right after the prologue; must be called before `lex`
+    '''
+
+    from prefix import read_prologue, find_prologue_end
+
+    if (prologue := read_prologue(self.filepath)) is None:
+      return False
+
+    text, last_line = prologue
+    start = find_prologue_end(self.source, self.filepath, last_line)
+
+    if start is None:
+      return False
+
+    self.prefix = store.load(self.filepath, text, self.preprocessor)
+    self.source_start = start
+
+    return True
+
+  def new_root(self, loc: Loc) -> MultipleNode:
+    if self.prefix is None:
+      return MultipleNode(loc)
+
+    root = MultipleNode(self.prefix.root.loc)
+    root.nodes.extend(self.prefix.root.nodes)
+
+    return root
+
   def compile(self) -> None:
     open(self.cmod.filepath, 'w').write(repr(self.cmod.c))
 
@@ -35,47 +117,194 @@ class TranslationUnit:
       f'[b][red]{prefix}[/red][/b]: {message}'
     )
 
-  def lex(self) -> None:
-    from lex import Lexer
-    from data import Token
+  def new_lexer(self, engine: str | None = None):
+    from lex import LEXERS
+    from data import InternPool, SourceMap
 
-    self.tokens: list[Token] = []
-    l = Lexer(self)
+    # shared by all the next stages
+    self.ids: InternPool = InternPool()
+    self.str_literals: InternPool = InternPool()
+    self.source_map: SourceMap = SourceMap(self.filepath)
 
-    while l.has_char():
-      token: Token | None = l.next_token()
+    # the prologue's tokens are already interned
+    if self.prefix is not None:
+      self.ids = self.prefix.ids
+      self.str_literals = self.prefix.str_literals
 
-      if token is None:
-        break
+    if engine is None:
+      engine = 'regex' if isinstance(self.source, str) else 'bytes'
 
+    l = LEXERS[engine](self)
+    l.index = self.source_start
+
+    return l
+
+  def lex(self, engine: str | None = None) -> None:
+    from data import TokenBuffer
+
+    l = self.new_lexer(engine)
+    self.tokens: TokenBuffer = TokenBuffer(
+      self.ids, self.str_literals, self.source_map
+    )
+
+    for token in l.tokens():
       self.tokens.append(token)
 
   def gen(self) -> None:
-    from gen import Gen
+    from gen import Gen, LParse
     from data import SymTable
 
     g = Gen(self)
-    self.tab: SymTable = SymTable()
+    self.tab: SymTable = SymTable(self.ids)
 
     g.gen_whole_unit()
+    self.tests: list[LParse] = g.tests
+
+  def demand_gen(self, roots: list[str] | None = None) -> None:
+    '''
+    the same as `gen`, but only the function bodies reachable from
+    `roots` (by default, `main` and the other exported functions)
+    and from the tests are generated, see `Gen.gen_from_roots`;
+    `skipped_bodies` counts the others
+    '''
+
+    from gen import Gen
+    from data import SymTable
+
+    g = Gen(self)
+    self.tab = SymTable(self.ids)
+
+    g.gen_from_roots(None if roots is None else [self.ids.intern(r) for r in roots])
+
+    self.tests = g.tests
+    self.skipped_bodies: int = g.skipped
+
+  def parallel_gen(self, workers: int | None = None) -> None:
+    '''
+    the same as `gen`, but the function bodies are generated
+    by `workers` processes (by default, one per core)
+    '''
+
+    from gen import Gen
+    from parallel import parallel_gen
+    from data import SymTable
+
+    g = Gen(self)
+    self.tab = SymTable(self.ids)
 
-  def dparse(self) -> None:
+    parallel_gen(g, workers)
+    self.tests = g.tests
+
+  def dparse(self, on_declaration: Callable[[Node], None] | None = None) -> None:
     from dparse import DParse
     from data import MultipleNode
 
     if len(self.tokens) == 0:
-      self.root: MultipleNode = MultipleNode(Loc(self.filepath, 1, 1))
+      self.root: MultipleNode = self.new_root(Loc(self.filepath, 1, 1))
       return
 
     d = DParse(self)
-    self.root = MultipleNode(d.cur.loc)
+    self.root = self.new_root(d.cur.loc)
+    d.translation_unit_into(self.root, on_declaration)
 
-    # the top level scope behaves the same as a
-    # struct's or union's body, except that functions
-    # cannot have method modifiers (such as `t f() const|static {}`)
-    d.struct_or_union_declaration_list_into(
-      self.root, expect_braces=False, allow_method_mods=False
-    )
+  def incremental_dparse(self, previous: 'TranslationUnit | None' = None) -> None:
+    '''
+    the same as `dparse`, but the top level declarations whose tokens are
+    the same as in `previous` (an earlier version of this unit, dparsed
+    by this method) are reused instead of parsed again;
+
+    `reused` maps the index of each reused declaration in `root.nodes`
+    to its index in the previous root, `spans` holds the tokens range
+    of each declaration and `declarations` indexes them by their fingerprint;
+
+    `reused` is only reported for now, `gen` still generates every
+    declaration: the generated bodies refer to names by their ids in
+    the unit's pool, which are not the same in the new unit, and an
+    unchanged body may still depend on a declaration that changed
+    '''
+
+    from dparse import DParse
+    from incremental import DeclarationReuse, declaration_index
+
+    self.spans: list[tuple[int, int]] = []
+    self.reused: dict[int, int] = {}
+    self.declarations: dict[bytes, int] = {}
+
+    if len(self.tokens) == 0:
+      self.root = self.new_root(Loc(self.filepath, 1, 1))
+      return
+
+    d = DParse(self)
+    self.root = self.new_root(d.cur.loc)
+
+    if previous is None:
+      d.translation_unit_into(self.root, spans=self.spans)
+      self.declarations = declaration_index(self, self.spans, {})
+      return
+
+    reuse = DeclarationReuse(previous, self, self.root)
+    d.translation_unit_into(self.root, reuse=reuse, spans=self.spans)
+
+    self.reused = reuse.reused
+    self.declarations = declaration_index(self, self.spans, reuse.keys)
+
+  def cached_dparse(self, cache) -> bool:
+    '''
+    lexes and dparses the unit, unless its tree is in `cache` (an `AstCache`),
+    then the tokens, pools and source map are loaded along with it;
+    returns whether it was loaded (units with a prefix are never cached)
+    '''
+
+    if self.prefix is None and cache.load(self):
+      return True
+
+    self.lex()
+    self.dparse()
+
+    if self.prefix is None:
+      cache.store(self)
+
+    return False
+
+  def parallel_dparse(self, workers: int | None = None) -> None:
+    '''
+    the same as `dparse`, but chunks of top level declarations
+    are dparsed by `workers` processes (by default, one per core)
+    '''
+
+    from parallel import parallel_dparse
+    from data import MultipleNode
+
+    if len(self.tokens) == 0:
+      self.root = self.new_root(Loc(self.filepath, 1, 1))
+      return
+
+    self.root = self.new_root(self.tokens[0].loc)
+    parallel_dparse(self, self.root, workers)
+
+  def stream_dparse(
+    self,
+    engine: str | None = None,
+    on_declaration: Callable[[Node], None] | None = None
+  ) -> None:
+    '''
+    lexes and dparses at the same time, the parser pulls
+    the tokens from the lexer through a `TokenWindow`,
+    so the whole token stream is never materialized
+    '''
+
+    from dparse import DParse
+    from data import MultipleNode, TokenWindow
+
+    self.window: TokenWindow = TokenWindow(self.new_lexer(engine).tokens())
+
+    if not self.window.has(0):
+      self.root = self.new_root(Loc(self.filepath, 1, 1))
+      return
+
+    d = DParse(self, self.window)
+    self.root = self.new_root(d.cur.loc)
+    d.translation_unit_into(self.root, on_declaration)
 
   def dump_root(self) -> None:
     self.console.print('\n-- ROOT --\n')
@@ -96,4 +325,27 @@ class TranslationUnit:
 
     self.console.print(
       self.fix_message(repr(self.tab))
-    )
\ No newline at end of file
+    )
+
+def translation_units(
+  filepaths: list[str],
+  ingestion: str = 'str',
+  preprocessor: Preprocessor | None = None
+) -> list[TranslationUnit]:
+  '''
+  preprocesses all the files in one invocation
+  (when the preprocessor supports it), each unit
+  is created as soon as its output is complete
+  '''
+
+  if preprocessor is None:
+    preprocessor = Preprocessor()
+
+  if ingestion == 'mmap':
+    return [TranslationUnit(f, ingestion, preprocessor) for f in filepaths]
+
+  return [
+    TranslationUnit(f, ingestion, preprocessor, preprocessed)
+      # strict, so that the batch is read to its end (and checked)
+      for f, preprocessed in zip(filepaths, preprocessor.preprocess_many(filepaths), strict=True)
+  ]
\ No newline at end of file